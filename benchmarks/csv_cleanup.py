@@ -0,0 +1,126 @@
+"""Cleanup speed of legacy order csv rows, row by row vs columnar
+
+Writes a synthetic export of the old system (or uses the given one),
+cleans it in batches with data_cleanup and data_cleanup_columns, checks
+that both produce the same rows and rejects and prints the timings.
+
+    python benchmarks/csv_cleanup.py [orders.csv] [rows]
+"""
+
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from core import exceptions  # noqa: E402
+from core.actions import IMPORT_BATCH_SIZE  # noqa: E402
+from core.actions import data_cleanup  # noqa: E402
+from core.actions import data_cleanup_columns  # noqa: E402
+from core.actions import get_raw_data  # noqa: E402
+
+
+def make_row(i: int) -> list[str]:
+    row = [""] * 29
+    row[1] = f"PKG{i}"
+    row[3] = random.choice(["Delivered", "Issue", "New Orders", "OH HOLD", ""])
+    row[4] = random.choice(["1", "2 pcs", "3", ""])
+    row[5] = f" ram thapa {i % 5000} "
+    row[6] = random.choice(["tee", "long-sleeve-tee", "hoodie", "dlt"])
+    row[7] = f'oversized "{i % 300}" tee'
+    row[8] = random.choice(["3XL", "2XL", "M", "L", "", "Free-Size"])
+    row[9] = random.choice(["black", "white", ""])
+    row[10] = random.choice(["Paid", ""])
+    row[11] = random.choice(["", "", "", "exchanged"])
+    row[12] = random.choice(["1650", "3150.00", "1500"])
+    row[13] = f"{1 + i % 28:02d}/{1 + i % 12:02d}/2024"
+    row[14] = random.choice(["", "May 21, 2024", "June 2, 2024"])
+    # some rows have no phone, they are rejected
+    row[15] = "" if i % 1000 == 0 else f"98{i % 50000:08d}"
+    row[16] = random.choice(["cod", "esewa", ""])
+    row[17] = random.choice(["lakeside, pokhara", "baneshwor", ""])
+    row[18] = random.choice(["1500", "3000", "1350.00"])
+    row[19] = random.choice(["150", "100", ""])
+    row[20] = random.choice(["0", "", "150"])
+    row[21] = random.choice(["instagram", "physically", "website", ""])
+    row[22] = random.choice(["By Airport", "NCM B2B", "pick up", ""])
+    row[23] = f"@ram{i % 5000}"
+    row[25] = random.choice(["", "May 21, 2024"])
+    row[26] = f"ram{i % 5000}@example.com"
+    row[27] = random.choice(["", "", "500"])
+    row[28] = random.choice(["", "", "", "giveaway"])
+    return row
+
+
+def write_csv(path: str, count: int):
+    random.seed(0)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([f"column {i}" for i in range(29)])
+        for i in range(count):
+            writer.writerow(make_row(i))
+
+
+def clean_rows(raws: list[dict[str, str]]):
+    cleaned: list[dict[str, Any]] = []
+    rejected: list[bool] = []
+    for raw in raws:
+        try:
+            cleaned.append(data_cleanup(raw))
+            rejected.append(False)
+        except exceptions.EmptyDataError:
+            rejected.append(True)
+    return cleaned, rejected
+
+
+def main():
+    count = 1_000_000
+    if len(sys.argv) > 1 and sys.argv[1].endswith(".csv"):
+        path = sys.argv[1]
+    else:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else count
+        path = os.path.join(tempfile.mkdtemp(), "orders.csv")
+        write_csv(path, count)
+
+    rows_time = 0.0
+    columns_time = 0.0
+    total = 0
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        while batch := list(islice(reader, IMPORT_BATCH_SIZE)):
+            raws = [get_raw_data(row) for row in batch]
+            total += len(raws)
+
+            start = time.perf_counter()
+            expected, expected_rejected = clean_rows(raws)
+            rows_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            cleaned, rejected = data_cleanup_columns(raws)
+            columns_time += time.perf_counter() - start
+
+            accepted = [d for d, r in zip(cleaned, rejected) if not r]
+            if rejected != expected_rejected or list(
+                map(repr, accepted)
+            ) != list(map(repr, expected)):
+                raise SystemExit("cleaned data differs")
+    print(f"{total} rows")
+    print(f"row by row {rows_time:>8.3f}s")
+    print(f"columnar   {columns_time:>8.3f}s")
+    print(f"speedup    {rows_time / columns_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Queries per order of the fetch_wc ingestion, per-order vs batched
+
+Runs both ingestion paths against the configured database (see .env) on
+the same synthetic woocommerce page, each inside a transaction that is
+rolled back afterwards.
+
+    python benchmarks/wc_ingest.py [orders] [line items per order]
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from core import models  # noqa: E402
+from core.serializers import WcNewOrderSerializer  # noqa: E402
+from core.wc import save_orders  # noqa: E402
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_order(i: int, n_items: int) -> dict[str, Any]:
+    return {
+        "id": 900000 + i,
+        "status": "processing",
+        "date_created": "2024-06-13T08:01:00",
+        "date_modified_gmt": "2024-06-13T08:01:00",
+        "discount_total": "0.00",
+        "shipping_total": "150.00",
+        "total": f"{1500 * n_items + 150}.00",
+        "customer_id": 0,
+        "order_key": f"wc_order_bench{i}",
+        "billing": {
+            "first_name": f"Bench{i % 40}",
+            "last_name": "Customer",
+            "address_1": "Lakeside",
+            "phone": f"90{i % 40:08d}",
+            "email": "bench@example.com",
+        },
+        "shipping": {"address_1": "Lakeside", "phone": "", "state": "NP001"},
+        "payment_method": "cod",
+        "customer_note": "",
+        "line_items": [
+            {
+                "id": i * 100 + j,
+                "product_id": (i + j) % 25,
+                "name": f"BENCH-PRODUCT-{(i + j) % 25}",
+                "quantity": 1,
+                "subtotal": "1500",
+                "total": "1500",
+                "meta_data": [
+                    {"key": "pa_size", "value": "xl"},
+                    {"key": "pa_color", "value": "black"},
+                ],
+            }
+            for j in range(n_items)
+        ],
+    }
+
+
+def legacy_create_order(settings: models.Settings, wc_data: Any):
+    """fetch_wc's original per-order, per-line-item ingestion"""
+    if models.Order.objects.filter(
+        medium=models.MediumChoices.WEBSITE,
+        wc_order_id=wc_data["id"],
+    ).exists():
+        return
+    with transaction.atomic():
+        customer, created = models.Customer.objects.get_or_create(
+            phone=wc_data["billing"]["phone"],
+        )
+        if created:
+            customer.full_name = wc_data["billing"]["full_name"]
+            customer.email = wc_data["billing"]["email"]
+            customer.address = wc_data["billing"]["address"]
+            customer.phone2 = wc_data["shipping"]["phone2"]
+            customer.save()
+        category, _ = models.Category.objects.get_or_create(title="UNKNOWN")
+        order = models.Order.objects.create(
+            customer=customer,
+            medium=models.MediumChoices.WEBSITE,
+            wc_order_id=wc_data["id"],
+            wc_order_key=wc_data["order_key"],
+            status=wc_data["status"],
+            subtotal_price=wc_data["total"]
+            - wc_data["discount_total"]
+            - wc_data["shipping_total"],
+            delivery_charge=wc_data["shipping_total"],
+            discount=wc_data["discount_total"],
+            total_price=wc_data["total"],
+            customer_note=wc_data["customer_note"],
+            delivery_ncm_from=settings.delivery_ncm_from,
+            delivery_ncm_to=wc_data["shipping"]["delivery_ncm_to"],
+            delivery_address=wc_data["shipping"]["address"],
+            delivery_note=wc_data["customer_note"],
+            ordered_at=wc_data["date_created"],
+        )
+        for item in wc_data["line_items"]:
+            product = models.Product.objects.filter(title=item["name"]).first()
+            if product is None:
+                product = models.Product(title=item["name"], category=category)
+            product.price = item["price_per_unit"]
+            product.wc_product_id = item["product_id"]
+            product.save()
+            models.OrderItem.objects.create(
+                product=product,
+                order=order,
+                wc_item_id=item["id"],
+                quantity=item["quantity"],
+                price_per_unit=item["price_per_unit"],
+                discount=item["discount"],
+                price=item["price"],
+                size=item["size"],
+                color=item["color"],
+            )
+
+
+def run(name: str, ingest: Any, n_orders: int):
+    created = 0
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                ingest()
+                created = models.Order.objects.filter(
+                    wc_order_key__startswith="wc_order_bench"
+                ).count()
+                raise Rollback
+        except Rollback:
+            pass
+        elapsed = time.perf_counter() - start
+    # minus the savepoint/count bookkeeping queries of this function
+    queries = len(ctx.captured_queries) - 1
+    print(
+        f"{name:<10} {created:>6} orders {queries:>7} queries "
+        f"{queries / n_orders:>7.2f} queries/order {elapsed:>7.3f}s"
+    )
+
+
+def main():
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    n_items = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    serializer = WcNewOrderSerializer(
+        data=[make_order(i, n_items) for i in range(n_orders)], many=True
+    )
+    serializer.is_valid(raise_exception=True)
+    wc_orders: Any = serializer.validated_data  # type: ignore
+    settings, _ = models.Settings.objects.get_or_create(id=1)
+
+    def legacy():
+        for wc_data in wc_orders:
+            legacy_create_order(settings, wc_data)
+
+    def batched():
+        save_orders(settings, wc_orders)
+
+    print(f"{n_orders} orders x {n_items} line items")
+    run("per-order", legacy, n_orders)
+    run("batched", batched, n_orders)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Validation speed of woocommerce orders, serializer vs fast path
+
+Validates the same payloads with WcNewOrderSerializer and
+validate_wc_orders, checks that both produce the same data and prints
+the timings. Uses recorded payloads (a JSON list of woocommerce orders,
+as returned by /wp-json/wc/v3/orders) when a file is given, otherwise
+synthetic ones.
+
+    python benchmarks/wc_validate.py [orders.json] [count]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from core.serializers import WcNewOrderSerializer  # noqa: E402
+from core.serializers import validate_wc_orders  # noqa: E402
+
+
+def make_order(i: int) -> dict[str, Any]:
+    items = random.randint(1, 4)
+    return {
+        "id": 10000 + i,
+        "parent_id": 0,
+        "status": random.choice(["processing", "completed", "on-hold"]),
+        "currency": "NPR",
+        "version": "8.9.3",
+        "prices_include_tax": False,
+        "date_created": "2024-06-13T08:01:00",
+        "date_modified": "2024-06-13T09:11:00",
+        "date_modified_gmt": "2024-06-13T03:26:00",
+        "discount_total": "0.00",
+        "discount_tax": "0.00",
+        "shipping_total": "150.00",
+        "shipping_tax": "0.00",
+        "cart_tax": "0.00",
+        "total": f"{1500 * items + 150}.00",
+        "total_tax": "0.00",
+        "customer_id": 0,
+        "order_key": f"wc_order_{i:013d}",
+        "billing": {
+            "first_name": "Ram",
+            "last_name": "Thapa",
+            "company": "",
+            "address_1": "Lakeside, Pokhara",
+            "address_2": "",
+            "city": "Pokhara",
+            "state": "NP001",
+            "postcode": "",
+            "country": "NP",
+            "email": "ram@example.com",
+            "phone": f"98{i:08d}",
+        },
+        "shipping": {
+            "first_name": "Ram",
+            "last_name": "Thapa",
+            "company": "",
+            "address_1": "Lakeside, Pokhara",
+            "address_2": "",
+            "city": "Pokhara",
+            "state": f"NP{random.randint(1, 90):03d}",
+            "postcode": "",
+            "country": "NP",
+            "phone": "",
+        },
+        "payment_method": random.choice(["cod", "esewa"]),
+        "payment_method_title": "Cash on delivery",
+        "customer_note": "",
+        "meta_data": [{"id": 1, "key": "_wc_order_attribution", "value": ""}],
+        "line_items": [
+            {
+                "id": i * 10 + j,
+                "name": f"OVERSIZED-TEE-{j}",
+                "product_id": 100 + j,
+                "variation_id": 200 + j,
+                "quantity": random.randint(1, 3),
+                "tax_class": "",
+                "subtotal": "1500",
+                "subtotal_tax": "0.00",
+                "total": "1350",
+                "total_tax": "0.00",
+                "taxes": [],
+                "meta_data": [
+                    {"id": 1, "key": "pa_size", "value": "xl"},
+                    {"id": 2, "key": "pa_color", "value": "white"},
+                    {"id": 3, "key": "pa_include-longsleeve", "value": "no"},
+                    {"id": 4, "key": "pa_minimal-logo-variation", "value": ""},
+                    {"id": 5, "key": "_reduced_stock", "value": "1"},
+                ],
+                "sku": "",
+                "price": 1350,
+            }
+            for j in range(items)
+        ],
+        "tax_lines": [],
+        "shipping_lines": [],
+        "fee_lines": [],
+        "coupon_lines": [],
+        "refunds": [],
+    }
+
+
+def main():
+    count = 10000
+    if len(sys.argv) > 1 and sys.argv[1].endswith(".json"):
+        with open(sys.argv[1]) as f:
+            recorded = json.load(f)
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else count
+        payloads = [recorded[i % len(recorded)] for i in range(count)]
+    else:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else count
+        random.seed(0)
+        payloads = [make_order(i) for i in range(count)]
+
+    start = time.perf_counter()
+    serializer = WcNewOrderSerializer(data=payloads, many=True)
+    serializer.is_valid(raise_exception=True)
+    expected: Any = serializer.validated_data  # type: ignore
+    serializer_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    validated = validate_wc_orders(payloads)
+    fast_time = time.perf_counter() - start
+
+    if [dict(o) for o in expected] != validated:
+        raise SystemExit("validated data differs")
+    print(f"{count} orders")
+    print(f"serializer {serializer_time:>8.3f}s")
+    print(f"fast path  {fast_time:>8.3f}s")
+    print(f"speedup    {serializer_time / fast_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
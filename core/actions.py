@@ -1,15 +1,27 @@
 import csv
+import gzip
+import hashlib
 import json
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from decimal import ROUND_HALF_UP
 from decimal import Decimal
-from io import StringIO
+from importlib.util import find_spec
+from io import TextIOWrapper
+from itertools import chain
+from itertools import islice
 from typing import Any
 from typing import BinaryIO
+from typing import Callable
+from typing import Iterator
 
-import httpx
+import zstandard
 from django.contrib import admin
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import Q
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 from django.http.response import HttpResponseRedirect
@@ -19,6 +31,68 @@ from form_action import extra_button  # type: ignore
 from core import exceptions
 from core import models
 from core.forms import OrderUploadForm
+from core.importer import copy_previous_orders
+
+# rows cleaned and saved together by upload_previous_orders
+IMPORT_BATCH_SIZE = 5000
+
+# raw field: its column in the csv export of the old system
+RAW_COLUMNS = {
+    "delivery_package_id": 1,
+    "status": 3,
+    "quantity": 4,
+    "full_name": 5,
+    "c_title": 6,  # category title
+    "p_title": 7,  # product title
+    "s_name": 8,  # size name
+    "c_name": 9,  # color name
+    "is_paid": 10,
+    "is_advance": 10,
+    "is_disputed": 11,
+    "dispute_remarks": 11,
+    "total_price": 12,
+    "ordered_at": 13,  # order
+    "shipped_at": 14,
+    "phone": 15,
+    "payment_method": 16,
+    "address": 17,
+    "delivery_to": 17,
+    "subtotal_price": 18,  # order
+    "price": 18,  # order_item, payment_item.is_advance
+    "price_per_unit": 18,  # order_item, calculate from quantity
+    "delivery_charge": 19,
+    "discount": 20,
+    "medium": 21,
+    "delivery_method": 22,
+    "insta_handle": 23,
+    "phone2": 24,
+    "paid_at": 25,
+    "email": 26,
+    "amount": 27,  # payment item(is_advance=True)
+    "is_giveaway": 28,
+    "giveaway_reason": 28,
+}
+RAW_ROW_LENGTH = 29
+# raw fields identifying the order of a row, see get_row_identity
+IDENTITY_COLUMNS = (
+    "phone",
+    "ordered_at",
+    "p_title",
+    "s_name",
+    "c_name",
+    "quantity",
+    "price",
+    "payment_method",
+    "amount",
+)
+
+# first bytes of the supported upload formats
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+PARQUET_MAGIC = b"PAR1"
+ARROW_FILE_MAGIC = b"ARROW1"
+ARROW_STREAM_MAGIC = b"\xff\xff\xff\xff"
+ARROW_MAGICS = (PARQUET_MAGIC, ARROW_FILE_MAGIC, ARROW_STREAM_MAGIC)
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -28,24 +102,7 @@ class DecimalEncoder(json.JSONEncoder):
         return super().default(o)
 
 
-def get_unique_values(data: list[Any], unique_field: str = "id") -> list[Any]:
-    try:
-        return list(d[unique_field] for d in data)
-    except KeyError:
-        return []
-
-
-def data_cleanup(raw: dict[str, Any]):
-    # shallow copy
-    data = dict(raw)
-    # trim leading and trailing spaces
-    for key in data:
-        data[key] = data[key].strip()
-
-    # title case
-    data["full_name"] = data["full_name"].title()
-    data["address"] = data["address"].title()
-
+def clean_category_title(value: str) -> str:
     # category titles:
     # Men:
     # Turtleneck-Tee, T-Shirt, Trouser, Shorts, Hoodie, DLT, Sweatshirt
@@ -53,122 +110,179 @@ def data_cleanup(raw: dict[str, Any]):
     # Pullover-Sweatshirt, Set-Pullover, Pant, Inner-Longsleeve
     # Women:
     # Women-Crop-Longsleeve
-    c_title_l = data["c_title"].lower()
+    c_title_l = value.lower()
     if c_title_l == "tee":
-        data["c_title"] = "T-Shirt"
+        return "T-Shirt"
     elif c_title_l == "long-sleeve-tee":
-        data["c_title"] = "Longsleeve"
+        return "Longsleeve"
     elif c_title_l == "turtle neck tee":
-        data["c_title"] = "Turtleneck-Tee"
+        return "Turtleneck-Tee"
     elif c_title_l == "turtle neck sweatshirt":
-        data["c_title"] = "Turtleneck-Sweatshirt"
+        return "Turtleneck-Sweatshirt"
     elif c_title_l == "dlt":
-        data["c_title"] = "DLT"
+        return "DLT"
     elif c_title_l == "crop-long-sleeve":
-        data["c_title"] = "Women-Crop-Longsleeve"
-    else:
-        data["c_title"] = data["c_title"].title().replace(" ", "-")
+        return "Women-Crop-Longsleeve"
+    return value.title().replace(" ", "-")
 
+
+def clean_size(value: str) -> str:
     # size types:
     # S, M, L, XL, XXL, XXXL, Free
-    if data["s_name"] == "3XL":
-        data["s_name"] = models.SizeChoices.XXXL
-    elif data["s_name"] == "2XL":
-        data["s_name"] = models.SizeChoices.XXL
-    elif data["s_name"] == "Free-Size":
-        data["s_name"] = models.SizeChoices.FREE
-    elif data["s_name"] == "":
-        data["s_name"] = models.SizeChoices.FREE
-    if data["s_name"] not in models.SizeChoices.values:
-        raise Exception(f"Invalid size type: {data['s_name']}")
-
+    if value == "3XL":
+        value = models.SizeChoices.XXXL
+    elif value == "2XL":
+        value = models.SizeChoices.XXL
+    elif value == "Free-Size":
+        value = models.SizeChoices.FREE
+    elif value == "":
+        value = models.SizeChoices.FREE
+    if value not in models.SizeChoices.values:
+        raise Exception(f"Invalid size type: {value}")
+    return value
+
+
+def clean_color(value: str) -> str:
     # color types:
-    data["c_name"] = data["c_name"].title()
-    if data["c_name"] == "":
-        data["c_name"] = models.ColorChoices.BLACK
-    if data["c_name"] not in models.ColorChoices.values:
-        raise Exception(f"Invalid color type: {data['c_name']}")
-
-    # product title
-    data["p_title"] = (
-        data["p_title"].upper().replace('"', "").replace(" ", "-")
-    )
+    value = value.title()
+    if value == "":
+        value = models.ColorChoices.BLACK
+    if value not in models.ColorChoices.values:
+        raise Exception(f"Invalid color type: {value}")
+    return value
+
+
+def clean_product_title(value: str) -> str:
+    return value.upper().replace('"', "").replace(" ", "-")
+
+
+def clean_medium(value: str) -> str:
+    value = value.title()
+    if value == "Physically":
+        value = models.MediumChoices.CONTACT
+    elif value == "":
+        value = models.MediumChoices.WEBSITE
+    if value not in models.MediumChoices.values:
+        raise Exception(f"Invalid order medium: {value}")
+    return value
+
+
+def clean_status(value: str) -> str:
+    if value == "Issue":
+        value = models.StatusChoices.DISPUTED
+    elif value == "Ready-to-Ship":
+        value = models.StatusChoices.PROCESSED
+    elif value in ["New Orders", "INSTOCK"]:
+        value = models.StatusChoices.PENDING
+    elif value == "OH HOLD":
+        value = models.StatusChoices.ONHOLD
+    elif value == "":
+        value = models.StatusChoices.PENDING
+    if value not in models.StatusChoices.values:
+        value = models.StatusChoices.PENDING
+    return value
+
+
+def clean_price(value: str) -> Decimal:
+    return Decimal(value) if value else Decimal("0.00")
+
+
+def clean_ordered_at(value: str) -> datetime:
+    # "ordered_at": "26/05/2024"
+    return datetime.strptime(value, "%d/%m/%Y")
+
+
+def clean_date(value: str) -> datetime | None:
+    # "shipped_at": "May 21, 2024"
+    return datetime.strptime(value, "%B %d, %Y") if value else None
+
+
+def clean_payment_method(value: str) -> str:
+    value = value.title()
+    if value not in models.PaymentMethodChoices.values:
+        value = models.PaymentMethodChoices.COD
+    return value
 
-    # order medium
-    data["medium"] = data["medium"].title()
-    if data["medium"] == "Physically":
-        data["medium"] = models.MediumChoices.CONTACT
-    elif data["medium"] == "":
-        data["medium"] = models.MediumChoices.WEBSITE
-    if data["medium"] not in models.MediumChoices.values:
-        raise Exception(f"Invalid order medium: {data['medium']}")
-
-    # status
-    if data["status"] == "Issue":
-        data["status"] = models.StatusChoices.DISPUTED
-    elif data["status"] == "Ready-to-Ship":
-        data["status"] = models.StatusChoices.PROCESSED
-    elif data["status"] in ["New Orders", "INSTOCK"]:
-        data["status"] = models.StatusChoices.PENDING
-    elif data["status"] == "OH HOLD":
-        data["status"] = models.StatusChoices.ONHOLD
-    elif data["status"] == "":
-        data["status"] = models.StatusChoices.PENDING
-    if data["status"] not in models.StatusChoices.values:
-        data["status"] = models.StatusChoices.PENDING
+
+def clean_quantity(value: str) -> int:
+    return int(value.split()[0]) if value else 1
+
+
+def clean_price_per_unit(price: Decimal, quantity: int) -> Decimal:
+    if quantity > 1:
+        return (price / Decimal(quantity)).quantize(
+            Decimal("1.00"), rounding=ROUND_HALF_UP
+        )
+    return price
+
+
+def clean_delivery_method(value: str) -> str:
+    if value == "By Airport":
+        value = models.DeliveryMethodChoices.AIRPORT
+    if value == "NCM B2B":
+        value = models.DeliveryMethodChoices.NCM
+    elif value == "pick up":
+        value = models.DeliveryMethodChoices.SELF
+    elif value not in models.DeliveryMethodChoices.values:
+        value = models.DeliveryMethodChoices.SELF
+    return value
+
+
+def get_empty_data_error(
+    data: dict[str, Any],
+) -> exceptions.EmptyDataError | None:
+    if data["phone"] == "":
+        return exceptions.EmptyDataError(
+            f"No Phone. User: {data['full_name']}"
+        )
+    if data["c_title"] == "":
+        return exceptions.EmptyDataError(
+            f"No Category Title. User: {data['phone']}"
+        )
+    if data["p_title"] == "":
+        return exceptions.EmptyDataError(
+            f"No Product Title. User: {data['phone']}"
+        )
+    return None
+
+
+def data_cleanup(raw: dict[str, Any]):
+    # shallow copy
+    data = dict(raw)
+    # trim leading and trailing spaces
+    for key in data:
+        data[key] = data[key].strip()
+
+    # title case
+    data["full_name"] = data["full_name"].title()
+    data["address"] = data["address"].title()
+
+    data["c_title"] = clean_category_title(data["c_title"])
+    data["s_name"] = clean_size(data["s_name"])
+    data["c_name"] = clean_color(data["c_name"])
+    data["p_title"] = clean_product_title(data["p_title"])
+    data["medium"] = clean_medium(data["medium"])
+    data["status"] = clean_status(data["status"])
 
     # pricing
-    data["subtotal_price"] = (
-        Decimal(data["subtotal_price"])
-        if data["subtotal_price"]
-        else Decimal("0.00")
-    )
-    data["total_price"] = (
-        Decimal(data["total_price"])
-        if data["total_price"]
-        else Decimal("0.00")
-    )
-    data["price"] = (
-        Decimal(data["price"]) if data["price"] else Decimal("0.00")
-    )
-    data["discount"] = (
-        Decimal(data["discount"]) if data["discount"] else Decimal("0.00")
-    )
-    data["delivery_charge"] = (
-        Decimal(data["delivery_charge"])
-        if data["delivery_charge"]
-        else Decimal("0.00")
-    )
+    data["subtotal_price"] = clean_price(data["subtotal_price"])
+    data["total_price"] = clean_price(data["total_price"])
+    data["price"] = clean_price(data["price"])
+    data["discount"] = clean_price(data["discount"])
+    data["delivery_charge"] = clean_price(data["delivery_charge"])
 
     # paid
-    if data["is_paid"] == "Paid":
-        data["is_paid"] = True
-    else:
-        data["is_paid"] = False
+    data["is_paid"] = data["is_paid"] == "Paid"
 
     # dates
     try:
-        # "ordered_at": "26/05/2024"
-        data["ordered_at"] = datetime.strptime(data["ordered_at"], "%d/%m/%Y")
+        data["ordered_at"] = clean_ordered_at(data["ordered_at"])
     except ValueError:
         data["ordered_at"] = timezone.now()
-    # "shipped_at": "May 21, 2024"
-    data["shipped_at"] = (
-        datetime.strptime(data["shipped_at"], "%B %d, %Y")
-        if data["shipped_at"]
-        else None
-    )
-    # "paid_at": "May 21, 2024"
-    data["paid_at"] = (
-        datetime.strptime(data["paid_at"], "%B %d, %Y")
-        if data["paid_at"]
-        else None
-    )
+    data["shipped_at"] = clean_date(data["shipped_at"])
+    data["paid_at"] = clean_date(data["paid_at"])
 
-    # payment method
-    data["payment_method"] = data["payment_method"].title()
-    if data["payment_method"] not in models.PaymentMethodChoices.values:
-        data["payment_method"] = models.PaymentMethodChoices.COD
+    data["payment_method"] = clean_payment_method(data["payment_method"])
 
     # payment items
     data["is_advance"] = False
@@ -187,15 +301,10 @@ def data_cleanup(raw: dict[str, Any]):
     data["is_disputed"] = bool(data["is_disputed"])
 
     # quantity
-    data["quantity"] = (
-        int(data["quantity"].split()[0]) if data["quantity"] else 1
+    data["quantity"] = clean_quantity(data["quantity"])
+    data["price_per_unit"] = clean_price_per_unit(
+        data["price"], data["quantity"]
     )
-    if data["quantity"] > 1:
-        data["price_per_unit"] = (
-            data["price"] / Decimal(data["quantity"])
-        ).quantize(Decimal("1.00"), rounding=ROUND_HALF_UP)
-    else:
-        data["price_per_unit"] = data["price"]
 
     # phone length validation
     data["phone"] = data["phone"][:15]
@@ -205,270 +314,370 @@ def data_cleanup(raw: dict[str, Any]):
         data["full_name"] = "N/A"
 
     # no delivery_method, delivery_to
-    if data["delivery_method"] == "By Airport":
-        data["delivery_method"] = models.DeliveryMethodChoices.AIRPORT
-    if data["delivery_method"] == "NCM B2B":
-        data["delivery_method"] = models.DeliveryMethodChoices.NCM
-    elif data["delivery_method"] == "pick up":
-        data["delivery_method"] = models.DeliveryMethodChoices.SELF
-    elif data["delivery_method"] not in models.DeliveryMethodChoices.values:
-        data["delivery_method"] = models.DeliveryMethodChoices.SELF
+    data["delivery_method"] = clean_delivery_method(data["delivery_method"])
     if not data["delivery_to"]:
         data["delivery_to"] = "N/A"
 
     # empty data
-    if data["phone"] == "":
-        raise exceptions.EmptyDataError(f"No Phone. User: {data['full_name']}")
-    if data["c_title"] == "":
-        raise exceptions.EmptyDataError(
-            f"No Category Title. User: {data['phone']}"
-        )
-    if data["p_title"] == "":
-        raise exceptions.EmptyDataError(
-            f"No Product Title. User: {data['phone']}"
-        )
+    error = get_empty_data_error(data)
+    if error is not None:
+        raise error
 
     return data
 
 
-def upload_previous_orders(file: BinaryIO):
-    content = StringIO(file.read().decode("utf-8"))
-    reader = csv.reader(content, delimiter=",")
-    # skip the headers
-    next(reader, None)
-    total_count = 0
-    count = 0
-    customers: list[dict[str, Any]] = []
-    categories: list[dict[str, str]] = []
-    sizes: list[dict[str, str]] = []
-    colors: list[dict[str, str]] = []
-    products: list[dict[str, str]] = []
-    orders: list[dict[str, Any]] = []
-    payment_items: list[dict[str, Any]] = []
-    order_items: list[dict[str, Any]] = []
-    for row in reader:
-        raw_data = {
-            "delivery_package_id": row[1],
-            "status": row[3],
-            "quantity": row[4],
-            "full_name": row[5],
-            "c_title": row[6],  # category title
-            "p_title": row[7],  # product title
-            "s_name": row[8],  # size name
-            "c_name": row[9],  # color name
-            "is_paid": row[10],
-            "is_advance": row[10],
-            "is_disputed": row[11],
-            "dispute_remarks": row[11],
-            "total_price": row[12],
-            "ordered_at": row[13],  # order
-            "shipped_at": row[14],
-            "phone": row[15],
-            "payment_method": row[16],
-            "address": row[17],
-            "delivery_to": row[17],
-            "subtotal_price": row[18],  # order
-            "price": row[18],  # order_item, payment_item.is_advance
-            "price_per_unit": row[18],  # order_item, calculate from quantity
-            "delivery_charge": row[19],
-            "discount": row[20],
-            "medium": row[21],
-            "delivery_method": row[22],
-            "insta_handle": row[23],
-            "phone2": row[24],
-            "paid_at": row[25],
-            "email": row[26],
-            "amount": row[27],  # payment item(is_advance=True)
-            "is_giveaway": row[28],
-            "giveaway_reason": row[28],
-        }
-        total_count += 1
+# column mapped by data_cleanup_columns: function applied to its values
+CLEANUP_COLUMNS: dict[str, Callable[[str], Any]] = {
+    "full_name": str.title,
+    "address": str.title,
+    "c_title": clean_category_title,
+    "s_name": clean_size,
+    "c_name": clean_color,
+    "p_title": clean_product_title,
+    "medium": clean_medium,
+    "status": clean_status,
+    "subtotal_price": clean_price,
+    "total_price": clean_price,
+    "price": clean_price,
+    "discount": clean_price,
+    "delivery_charge": clean_price,
+    "shipped_at": clean_date,
+    "paid_at": clean_date,
+    "payment_method": clean_payment_method,
+    "quantity": clean_quantity,
+    "delivery_method": clean_delivery_method,
+}
+
+
+class InvalidValue:
+    # marks the values a cleanup function raised for
+    pass
+
+
+INVALID = InvalidValue()
+
+
+def map_column(values: list[Any], function: Callable[..., Any]) -> list[Any]:
+    """Apply the function once per distinct value of the column"""
+    results: dict[Any, Any] = {}
+    for value in set(values):
         try:
-            cleaned_data = data_cleanup(raw_data)
-        except exceptions.EmptyDataError as e:
-            print(e)
-            continue
-        customer = {
-            "full_name": cleaned_data["full_name"],
-            "insta_handle": cleaned_data["insta_handle"],
-            "email": cleaned_data["email"],
-            "phone": cleaned_data["phone"],
-            "phone2": cleaned_data["phone2"],
-            "address": cleaned_data["address"],
-        }
-        category = {
-            "title": cleaned_data["c_title"],
-        }
-        size = {
-            "name": cleaned_data["s_name"],
-        }
-        color = {
-            "name": cleaned_data["c_name"],
-        }
-        product = {
-            "title": cleaned_data["p_title"],
-            "category__title": cleaned_data["c_title"],
-        }
-        order = {
-            "customer__phone": cleaned_data["phone"],  # UNIQUE phone
-            "medium": cleaned_data["medium"],
-            "status": cleaned_data["status"],
-            "subtotal_price": cleaned_data["subtotal_price"],
-            "delivery_charge": cleaned_data["delivery_charge"],
-            "discount": cleaned_data["discount"],
-            "total_price": cleaned_data["total_price"],
-            "is_paid": cleaned_data["is_paid"],
-            "delivery_to": cleaned_data["delivery_to"],
-            "delivery_method": cleaned_data["delivery_method"],
-            "delivery_package_id": cleaned_data["delivery_package_id"],
-            "ordered_at": cleaned_data["ordered_at"],
-            "shipped_at": cleaned_data["shipped_at"],
-            "paid_at": cleaned_data["paid_at"],
-        }
-        payment_item = {
-            # order__id
-            "payment_method": cleaned_data["payment_method"],
-            "amount": cleaned_data["amount"],
-            "is_advance": cleaned_data["is_advance"],
-        }
-        order_item = {
-            "product__title": cleaned_data["p_title"],
-            # order__id
-            "is_giveaway": cleaned_data["is_giveaway"],
-            "giveaway_reason": cleaned_data["giveaway_reason"],
-            "size": cleaned_data["s_name"],
-            "color": cleaned_data["c_name"],
-            "quantity": cleaned_data["quantity"],
-            "price_per_unit": cleaned_data["price_per_unit"],
-            "price": cleaned_data["price"],
-            "is_disputed": cleaned_data["is_disputed"],
-            "dispute_remarks": cleaned_data["dispute_remarks"],
-        }
-        customers.append(customer)
-        categories.append(category)
-        sizes.append(size)
-        colors.append(color)
-        products.append(product)
-        orders.append(order)
-        payment_items.append(payment_item)
-        order_items.append(order_item)
-        count += 1
-
-    # get uniques
-    u_customers = get_unique_values(customers, "phone")
-    u_categories = get_unique_values(categories, "title")
-    u_products = get_unique_values(products, "title")
-
-    # bulk create
-    # customers
-    models.Customer.objects.bulk_create(
-        [models.Customer(**c) for c in customers], ignore_conflicts=True
-    )
-    customer_ids = {
-        c["phone"]: c["id"]
-        for c in models.Customer.objects.filter(phone__in=u_customers)
-        .values("id", "phone")
-        .iterator()
+            results[value] = function(value)
+        except Exception:
+            results[value] = INVALID
+    return [results[value] for value in values]
+
+
+def data_cleanup_columns(
+    raws: list[dict[str, str]],
+) -> tuple[list[dict[str, Any]], list[bool]]:
+    """Column oriented data_cleanup of many rows
+
+    Each cleanup is computed once per distinct value of its column.
+    Returns the cleaned rows and a mask of the rows data_cleanup rejects
+    with EmptyDataError. Raises the exception of the first row
+    data_cleanup raises for otherwise.
+    """
+    if not raws:
+        return [], []
+    columns = {
+        key: map_column([raw[key] for raw in raws], str.strip)
+        for key in raws[0]
     }
-    # categories
-    models.Category.objects.bulk_create(
-        [models.Category(**c) for c in categories], ignore_conflicts=True
-    )
-    # get ids for unique category entries
-    category_ids = {
-        c["title"]: c["id"]
-        for c in models.Category.objects.filter(title__in=u_categories)
-        .values("id", "title")
-        .iterator()
-    }
-    # sizes
-    models.Size.objects.bulk_create(
-        [models.Size(**s) for s in sizes], ignore_conflicts=True
-    )
-    # colors
-    models.Color.objects.bulk_create(
-        [models.Color(**c) for c in colors], ignore_conflicts=True
-    )
-    # products
-    for p in products:
-        p["category_id"] = category_ids[p["category__title"]]
-        p.pop("category__title", None)
-    models.Product.objects.bulk_create(
-        [models.Product(**p) for p in products], ignore_conflicts=True
-    )
-    product_ids = {
-        p["title"]: p["id"]
-        for p in models.Product.objects.filter(title__in=u_products)
-        .values("id", "title")
-        .iterator()
-    }
-    # orders
-    if not (len(orders) == len(payment_items) == len(order_items)):
-        raise ValueError(
-            "Orders, payment items and order items not equal in len"
+    for key, function in CLEANUP_COLUMNS.items():
+        columns[key] = map_column(columns[key], function)
+    # dates that fail to parse are replaced by the current time
+    ordered_at = map_column(columns["ordered_at"], clean_ordered_at)
+    columns["ordered_at"] = [
+        timezone.now() if value is INVALID else value for value in ordered_at
+    ]
+    columns["is_paid"] = [value == "Paid" for value in columns["is_paid"]]
+    columns["is_advance"] = [bool(value) for value in columns["amount"]]
+    amounts = map_column(columns["amount"], Decimal)
+    columns["amount"] = [
+        (amount if is_advance else total_price if is_paid else Decimal("0.00"))
+        for amount, is_advance, is_paid, total_price in zip(
+            amounts,
+            columns["is_advance"],
+            columns["is_paid"],
+            columns["total_price"],
         )
-    for o in orders:
-        o["customer_id"] = customer_ids[o["customer__phone"]]
-        o.pop("customer__phone", None)
-    order_ids = models.Order.objects.bulk_create(
-        [models.Order(**o) for o in orders]
-    )
-    # payment_items
-    for idx, p in enumerate(payment_items):
-        p["order_id"] = order_ids[idx].id  # type: ignore
-    models.PaymentItem.objects.bulk_create(
-        [models.PaymentItem(**p) for p in payment_items]
-    )
-    # order_items
-    for idx, o in enumerate(order_items):
-        o["order_id"] = order_ids[idx].id  # type: ignore
-        o["product_id"] = product_ids[o["product__title"]]
-        o.pop("product__title", None)
-    models.OrderItem.objects.bulk_create(
-        [models.OrderItem(**o) for o in order_items]
-    )
+    ]
+    columns["is_giveaway"] = [bool(value) for value in columns["is_giveaway"]]
+    columns["is_disputed"] = [bool(value) for value in columns["is_disputed"]]
+    columns["price_per_unit"] = [
+        (
+            clean_price_per_unit(price, quantity)
+            if price is not INVALID and quantity is not INVALID
+            else INVALID
+        )
+        for price, quantity in zip(columns["price"], columns["quantity"])
+    ]
+    columns["phone"] = [value[:15] for value in columns["phone"]]
+    columns["full_name"] = [value or "N/A" for value in columns["full_name"]]
+    columns["delivery_to"] = [
+        value or "N/A" for value in columns["delivery_to"]
+    ]
+
+    keys = list(columns)
+    rows = [dict(zip(keys, values)) for values in zip(*columns.values())]
+    for raw, row in zip(raws, rows):
+        if any(value is INVALID for value in row.values()):
+            # raises the same exception as the row by row cleanup
+            data_cleanup(raw)
+    rejected = [
+        row["phone"] == "" or row["c_title"] == "" or row["p_title"] == ""
+        for row in rows
+    ]
+    return rows, rejected
+
+
+def get_raw_data(row: list[str]) -> dict[str, str]:
+    return {key: row[index] for key, index in RAW_COLUMNS.items()}
+
+
+def get_raw_row(record: dict[str, Any]) -> list[str]:
+    # csv row of a record keyed by the raw fields (json lines, parquet)
+    row = [""] * RAW_ROW_LENGTH
+    for key, index in RAW_COLUMNS.items():
+        value = record.get(key)
+        if value is not None and value != "":
+            row[index] = str(value)
+    return row
+
+
+def read_text_rows(stream: BinaryIO) -> Iterator[list[str]]:
+    # decode while reading instead of loading the whole file
+    content = TextIOWrapper(stream, encoding="utf-8", newline="")
+    try:
+        first_line = content.readline()
+        if first_line.lstrip().startswith("{"):
+            # json lines, one record per line
+            for line in chain([first_line], content):
+                if line.strip():
+                    yield get_raw_row(json.loads(line))
+        else:
+            # csv, the first line is the headers
+            yield from csv.reader(content, delimiter=",")
+    finally:
+        # leave the uploaded file open, it is closed by django
+        content.detach()
+
 
-    # remove this codeblock
-    with open("test-clean.json", "w") as f:
-        json.dump(
-            {
-                "customers": customers,
-                "categories": categories,
-                "sizes": sizes,
-                "colors": colors,
-                "products": products,
-                "orders": orders,
-                "payment_items": payment_items,
-                "order_items": order_items,
-            },
-            f,
-            default=str,
+def read_arrow_rows(file: BinaryIO, head: bytes) -> Iterator[list[str]]:
+    # optional dependency, see upload_orders_csv
+    import pyarrow.ipc  # type: ignore
+    import pyarrow.parquet  # type: ignore
+
+    if head.startswith(PARQUET_MAGIC):
+        batches = pyarrow.parquet.ParquetFile(file).iter_batches(
+            IMPORT_BATCH_SIZE
+        )
+    elif head.startswith(ARROW_FILE_MAGIC):
+        reader = pyarrow.ipc.open_file(file)
+        batches = (
+            reader.get_batch(i) for i in range(reader.num_record_batches)
+        )
+    else:
+        batches = pyarrow.ipc.open_stream(file)
+    for batch in batches:
+        # read column by column, columns are named like the raw fields
+        rows = [[""] * RAW_ROW_LENGTH for _ in range(batch.num_rows)]
+        for name in batch.schema.names:
+            index = RAW_COLUMNS.get(name)
+            if index is None:
+                continue
+            for row, value in zip(rows, batch.column(name).to_pylist()):
+                if value is not None and value != "":
+                    row[index] = str(value)
+        yield from rows
+
+
+def read_rows(file: BinaryIO) -> Iterator[list[str]]:
+    """Yield the rows of an export of the old system
+
+    The format is detected from the first bytes of the file: csv or json
+    lines, optionally gzip or zstd compressed (decompressed while
+    reading), or parquet and arrow files (requires pyarrow). Records of
+    json lines, parquet and arrow files are keyed by the raw fields, see
+    RAW_COLUMNS.
+    """
+    head = file.read(8)
+    file.seek(0)
+    if head.startswith(GZIP_MAGIC):
+        yield from read_text_rows(
+            gzip.GzipFile(fileobj=file, mode="rb")  # type: ignore
         )
+    elif head.startswith(ZSTD_MAGIC):
+        decompressor = zstandard.ZstdDecompressor()
+        yield from read_text_rows(
+            decompressor.stream_reader(file, closefd=False)  # type: ignore
+        )
+    elif head.startswith(ARROW_MAGICS):
+        yield from read_arrow_rows(file, head)
+    else:
+        yield from read_text_rows(file)
+
 
-    return count, total_count
+def get_row_identity(row: list[str]) -> bytes:
+    """Digest of the fields identifying the order of a row
+
+    Customer fields (name, email, address...) are left out, a re-export
+    where they changed updates the customer instead of adding an order.
+    Rows differing only by surrounding spaces are the same row.
+    """
+    content = "\x1f".join(
+        row[RAW_COLUMNS[column]].strip() for column in IDENTITY_COLUMNS
+    )
+    return hashlib.sha256(content.encode()).digest()
+
+
+def get_row_fingerprint(identity: bytes, occurrence: int) -> str:
+    # identical rows are distinct orders (the same item ordered twice on
+    # the same day), they are told apart by their occurrence in the file
+    return hashlib.sha256(identity + str(occurrence).encode()).hexdigest()
+
+
+def get_row_fingerprints(
+    rows: list[list[str]], occurrences: dict[bytes, int]
+) -> list[str]:
+    # occurrences counts the identities of the rows read before
+    fingerprints: list[str] = []
+    for row in rows:
+        identity = get_row_identity(row)
+        occurrence = occurrences.get(identity, 0)
+        occurrences[identity] = occurrence + 1
+        fingerprints.append(get_row_fingerprint(identity, occurrence))
+    return fingerprints
+
+
+def clean_previous_orders(
+    rows: list[list[str]], fingerprints: list[str]
+) -> list[dict[str, Any]]:
+    # runs in the worker processes of read_previous_orders
+    raws = [get_raw_data(row) for row in rows]
+    cleaned_rows, rejected = data_cleanup_columns(raws)
+    accepted_rows: list[dict[str, Any]] = []
+    for data, fingerprint, is_rejected in zip(
+        cleaned_rows, fingerprints, rejected
+    ):
+        if is_rejected:
+            print(get_empty_data_error(data))
+            continue
+        data["fingerprint"] = fingerprint
+        accepted_rows.append(data)
+    return accepted_rows
+
+
+def read_previous_orders(
+    file: BinaryIO, batch_size: int, start: int = 0, processes: int = 1
+) -> Iterator[tuple[list[dict[str, Any]], int]]:
+    """Yield batches of cleaned rows with the number of rows read so far
+
+    Every `batch_size` rows are cleaned together, rows with empty data
+    are left out of their batch. With more than one process the batches
+    are cleaned by a process pool while the caller saves the previous
+    ones, they are still yielded in file order. The first `start` rows
+    are skipped, they were imported before. Fingerprints are numbered
+    over the whole file, skipped rows included, so the file keeps one
+    digest per distinct row in memory.
+    """
+    rows = read_rows(file)
+    occurrences: dict[bytes, int] = {}
+    # the skipped rows are only counted
+    skipped = 0
+    while skipped < start:
+        chunk = list(islice(rows, min(batch_size, start - skipped)))
+        if not chunk:
+            break
+        get_row_fingerprints(chunk, occurrences)
+        skipped += len(chunk)
+    chunks = iter(lambda: list(islice(rows, batch_size)), [])
+    total_count = start
+    if processes <= 1:
+        for chunk in chunks:
+            total_count += len(chunk)
+            fingerprints = get_row_fingerprints(chunk, occurrences)
+            yield clean_previous_orders(chunk, fingerprints), total_count
+        return
+    with ProcessPoolExecutor(processes) as executor:
+        pending: deque[tuple[Future[list[dict[str, Any]]], int]] = deque()
+        for chunk in chunks:
+            total_count += len(chunk)
+            fingerprints = get_row_fingerprints(chunk, occurrences)
+            future = executor.submit(
+                clean_previous_orders, chunk, fingerprints
+            )
+            pending.append((future, total_count))
+            # bounds the rows held in memory
+            if len(pending) > processes:
+                future, count = pending.popleft()
+                yield future.result(), count
+        while pending:
+            future, count = pending.popleft()
+            yield future.result(), count
+
+
+def upload_previous_orders(
+    file: BinaryIO,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    progress: Callable[[int, int], None] | None = None,
+    start: int = 0,
+    processes: int = 1,
+):
+    """Import the orders exported from the old system
+
+    The file is streamed and saved every `batch_size` rows, so memory
+    does not grow with the file size. `progress` is called with the
+    number of imported and read rows after each batch, inside the
+    batch's transaction, so a checkpoint saved by it is committed with
+    the batch. Importing resumes after the first `start` rows. Rows are
+    cleaned by `processes` processes. Rows imported by an earlier upload
+    are skipped.
+    """
+    total_count = start
+    count = 0
+    created = 0
+    for batch, total_count in read_previous_orders(
+        file, batch_size, start, processes
+    ):
+        with transaction.atomic():
+            if batch:
+                created += copy_previous_orders(batch)
+            count += len(batch)
+            if progress is not None:
+                progress(count, total_count)
+        print(
+            f"Imported {count} / {total_count - start} row(s), "
+            f"{created} new order(s)"
+        )
+    return count, total_count - start
 
 
 @extra_button("Upload Orders (CSV)", OrderUploadForm)
 def upload_orders_csv(request: HttpRequest, form: OrderUploadForm):
-    try:
-        count, total_count = upload_previous_orders(form.cleaned_data["file"])
-        if count > 0:
-            messages.add_message(
-                request,
-                messages.INFO,
-                f"Successfully uploaded {count} / {total_count} order(s)",
-            )
-        else:
-            messages.add_message(
-                request, messages.ERROR, "No orders to upload"
-            )
-    except Exception as e:
+    file = form.cleaned_data["file"]
+    head = file.read(8)
+    file.seek(0)
+    # pyarrow is not a requirement, it has no wheels for the alpine image,
+    # without it the job would only fail in process_import_jobs
+    if head.startswith(ARROW_MAGICS) and find_spec("pyarrow") is None:
         messages.add_message(
-            request, messages.ERROR, "Failed to upload orders"
+            request,
+            messages.ERROR,
+            "Parquet and Arrow files need pyarrow, which is not installed. "
+            "Upload a CSV or JSON Lines file, optionally gzip or zstd "
+            "compressed.",
         )
-        raise e
-
-    return HttpResponseRedirect("/admin/core/order/")
+        return HttpResponseRedirect("/admin/core/order/")
+    # imported in the background by process_import_jobs
+    job = models.ImportJob.objects.create(file=file)
+    messages.add_message(
+        request,
+        messages.INFO,
+        f"Queued {job}, see Import jobs for its progress",
+    )
+    return HttpResponseRedirect("/admin/core/importjob/")
 
 
 @admin.action(description="Create ncm order for selected orders")
@@ -477,51 +686,36 @@ def create_ncm_order(
     request: HttpRequest,
     queryset: QuerySet[models.Order],
 ):
-    for o in queryset:
-        if not o.delivery_ncm_from:
-            modeladmin.message_user(
-                request,
-                f"Order #{o.pk} has no NCM from branch.",
-                messages.ERROR,
-            )
-            return
-        if not o.delivery_ncm_to:
-            modeladmin.message_user(
-                request,
-                f"Order #{o.pk} has no NCM delivery branch.",
-                messages.ERROR,
-            )
-            return
-    count = 0
-    settings, _ = models.Settings.objects.get_or_create(id=1)
-    for o in queryset:
-        try:
-            data = {
-                "name": o.customer.full_name,
-                "phone": o.customer.phone,
-                "phone2": o.customer.phone2,
-                "cod_charge": o.total_price if o.is_paid else Decimal("0.00"),
-                "address": o.delivery_address,
-                "fbranch": o.delivery_ncm_from,
-                "branch": o.delivery_ncm_to,
-            }
-            headers = {"Authorization": f"Token {settings.ncm_key}"}
-            res = httpx.post(
-                settings.ncm_url + "/api/v1/order/create",
-                data=data,
-                headers=headers,
-            )
-            res.raise_for_status()
-            order_id = res.json()["orderid"]
-            o.ncm_order_id = order_id
-            o.save()
-            count += 1
-        except httpx.HTTPError as e:
-            modeladmin.message_user(request, str(e), messages.ERROR)
-            return
+    # orders are sent by process_ncm_dispatches, created or in flight
+    # orders are skipped so a shipment is never booked twice
+    pending = queryset.filter(ncm_order_id__isnull=True).exclude(
+        ncm_status__in=[
+            models.NCMStatusChoices.QUEUED,
+            models.NCMStatusChoices.SENDING,
+        ]
+    )
+    no_branch = Q(delivery_ncm_from="") | Q(delivery_ncm_to="")
+    for order_id in pending.filter(no_branch).values_list("pk", flat=True):
+        modeladmin.message_user(
+            request,
+            f"Order #{order_id} has no NCM from or delivery branch.",
+            messages.ERROR,
+        )
+    with transaction.atomic():
+        order_ids = list(
+            pending.exclude(no_branch)
+            .select_for_update()
+            .values_list("pk", flat=True)
+        )
+        models.NCMDispatch.objects.bulk_create(
+            [models.NCMDispatch(order_id=pk) for pk in order_ids]
+        )
+        models.Order.objects.filter(pk__in=order_ids).update(
+            ncm_status=models.NCMStatusChoices.QUEUED
+        )
     modeladmin.message_user(
         request,
-        f"Sucessfully created {len(queryset)} NCM orders.",
+        f"Queued {len(order_ids)} NCM orders.",
         messages.SUCCESS,
     )
 
@@ -548,3 +742,16 @@ def update_order_status(
     modeladmin.message_user(
         request, "Selected items status has been marked as completed."
     )
+
+
+@admin.action(description="Retry selected import jobs")
+def retry_import_jobs(
+    modeladmin: admin.ModelAdmin,  # type: ignore
+    request: HttpRequest,
+    queryset: QuerySet[models.ImportJob],
+):
+    # resumes from the last checkpoint
+    count = queryset.filter(status=models.ImportStatusChoices.FAILED).update(
+        status=models.ImportStatusChoices.QUEUED, error=""
+    )
+    modeladmin.message_user(request, f"Queued {count} import job(s).")
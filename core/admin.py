@@ -1,14 +1,21 @@
 from django.contrib import admin
 from django.contrib.humanize.templatetags.humanize import naturaltime
-from django.db.models import Sum
+from django.db.models import OuterRef
 from django.http import HttpRequest
 from form_action import ExtraButtonMixin  # type: ignore
 
 from core import models
 from core.actions import create_ncm_order
+from core.actions import retry_import_jobs
 from core.actions import update_order_is_paid
 from core.actions import update_order_status
 from core.actions import upload_orders_csv
+from core.db import get_aggregate
+from core.forms import OrderForm
+from core.forms import SettingsForm
+from core.ncm import get_ncm_branch_label
+from core.paginator import EstimatedCountPaginator
+from core.search import CustomerSearchMixin
 
 
 class OrderItemInline(admin.StackedInline[models.OrderItem]):
@@ -32,18 +39,24 @@ class OrderItemInline(admin.StackedInline[models.OrderItem]):
 
 
 @admin.register(models.Customer)
-class CustomerAdmin(admin.ModelAdmin[models.Customer]):
+class CustomerAdmin(CustomerSearchMixin, admin.ModelAdmin[models.Customer]):
     list_display = (
         "id",
         "full_name",
         "phone",
-        "get_order_items",
-        "get_total_paid",
+        "order_count",
+        "order_item_count",
+        "total_paid",
+        "last_order_at",
         "insta_handle",
     )
 
     ordering = ("-id",)
 
+    customer_path = ""
+
+    order_path = None
+
     search_fields = (
         "id",
         "full_name",
@@ -54,22 +67,21 @@ class CustomerAdmin(admin.ModelAdmin[models.Customer]):
         "address",
     )
 
-    list_filter = ("gender",)
-
-    @admin.display(description="Orderitems")
-    def get_order_items(self, obj: models.Customer):
-        return models.OrderItem.objects.filter(order__customer=obj).count()
+    list_filter = ("gender", "last_order_at")
 
-    @admin.display(description="Total paid")
-    def get_total_paid(self, obj: models.Customer):
-        return models.PaymentItem.objects.filter(
-            order__customer=obj
-        ).aggregate(Sum("amount"))["amount__sum"]
+    # stored counters, see core.counters
+    readonly_fields = (
+        "order_count",
+        "order_item_count",
+        "total_paid",
+        "first_order_at",
+        "last_order_at",
+    )
 
 
 @admin.register(models.Category)
 class CategoryAdmin(admin.ModelAdmin[models.Category]):
-    list_display = ("id", "title", "get_products_count")
+    list_display = ("id", "title", "product_count")
 
     ordering = ("-id",)
 
@@ -77,9 +89,7 @@ class CategoryAdmin(admin.ModelAdmin[models.Category]):
 
     list_filter = ("title",)
 
-    @admin.display(description="Products")
-    def get_products_count(self, obj: models.Category):
-        return models.Product.objects.filter(category=obj).count()
+    readonly_fields = ("product_count",)
 
 
 @admin.register(models.Size)
@@ -92,9 +102,21 @@ class SizeAdmin(admin.ModelAdmin[models.Size]):
 
     list_filter = ("name",)
 
-    @admin.display(description="Sold count")
+    def get_queryset(self, request: HttpRequest):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                order_items_count=get_aggregate(
+                    models.OrderItem.objects.filter(size=OuterRef("name")),
+                    "COUNT",
+                )
+            )
+        )
+
+    @admin.display(description="Sold count", ordering="order_items_count")
     def get_order_items(self, obj: models.Size):
-        return models.OrderItem.objects.filter(size=obj.name).count()
+        return obj.order_items_count  # type: ignore
 
 
 @admin.register(models.Color)
@@ -107,9 +129,21 @@ class ColorAdmin(admin.ModelAdmin[models.Color]):
 
     list_filter = ("name",)
 
-    @admin.display(description="Sold count")
+    def get_queryset(self, request: HttpRequest):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                order_items_count=get_aggregate(
+                    models.OrderItem.objects.filter(color=OuterRef("name")),
+                    "COUNT",
+                )
+            )
+        )
+
+    @admin.display(description="Sold count", ordering="order_items_count")
     def get_order_items(self, obj: models.Color):
-        return models.OrderItem.objects.filter(color=obj.name).count()
+        return obj.order_items_count  # type: ignore
 
 
 @admin.register(models.Product)
@@ -121,7 +155,7 @@ class ProductAdmin(admin.ModelAdmin[models.Product]):
         "category",
         "stock",
         "price",
-        "get_order_items",
+        "units_sold",
     )
 
     ordering = ("-id",)
@@ -134,23 +168,28 @@ class ProductAdmin(admin.ModelAdmin[models.Product]):
 
     autocomplete_fields = ("category", "available_sizes", "available_colors")
 
-    @admin.display(description="Sold count")
-    def get_order_items(self, obj: models.Product) -> int:
-        return obj.order_items.count()  # type: ignore
+    readonly_fields = ("units_sold",)
 
 
 @admin.register(models.Order)
-class OrderAdmin(ExtraButtonMixin, admin.ModelAdmin):  # type: ignore
+class OrderAdmin(
+    CustomerSearchMixin, ExtraButtonMixin, admin.ModelAdmin  # type: ignore
+):
+    form = OrderForm
+
+    order_path = ""
+
     list_display = (
         "id",
         "customer",
         "total_price",
         "status",
         "is_paid",
-        "delivery_ncm_to",
+        "get_delivery_ncm_to",
         "delivery_address",
         "delivery_method",
         "ncm_order_id",
+        "ncm_status",
         "created_at_relative",
         "phone_number",
     )
@@ -158,12 +197,21 @@ class OrderAdmin(ExtraButtonMixin, admin.ModelAdmin):  # type: ignore
     def phone_number(self, obj: models.Order):
         return obj.customer.phone
 
+    @admin.display(description="Delivery ncm to", ordering="delivery_ncm_to")
+    def get_delivery_ncm_to(self, obj: models.Order):
+        return get_ncm_branch_label(obj.delivery_ncm_to)
+
     @admin.display(description="Date Created")
     def created_at_relative(self, obj: models.Order):
         return naturaltime(obj.created_at)
 
     ordering = ("-id",)
 
+    # large tables, see EstimatedCountPaginator
+    paginator = EstimatedCountPaginator
+
+    show_full_result_count = False
+
     search_fields = (
         "id",
         "customer__full_name",
@@ -174,7 +222,13 @@ class OrderAdmin(ExtraButtonMixin, admin.ModelAdmin):  # type: ignore
         "customer__address",
     )
 
-    list_filter = ("status", "customer__gender", "is_paid", "delivery_method")
+    list_filter = (
+        "status",
+        "customer__gender",
+        "is_paid",
+        "delivery_method",
+        "ncm_status",
+    )
 
     inlines = (OrderItemInline,)
 
@@ -191,6 +245,7 @@ class OrderAdmin(ExtraButtonMixin, admin.ModelAdmin):  # type: ignore
             "wc_order_id",
             "wc_order_key",
             "ncm_order_id",
+            "ncm_status",
             "status",
             "delivery_package_id",
             "ordered_at",
@@ -203,11 +258,20 @@ class OrderAdmin(ExtraButtonMixin, admin.ModelAdmin):  # type: ignore
 
 
 @admin.register(models.PaymentItem)
-class PaymentItemAdmin(admin.ModelAdmin[models.PaymentItem]):
+class PaymentItemAdmin(
+    CustomerSearchMixin, admin.ModelAdmin[models.PaymentItem]
+):
     list_display = ("id", "order", "payment_method", "amount", "is_advance")
 
     ordering = ("-id",)
 
+    # large tables, see EstimatedCountPaginator
+    paginator = EstimatedCountPaginator
+
+    show_full_result_count = False
+
+    customer_path = "order__customer"
+
     search_fields = (
         "id",
         "order__id",
@@ -225,7 +289,7 @@ class PaymentItemAdmin(admin.ModelAdmin[models.PaymentItem]):
 
 
 @admin.register(models.OrderItem)
-class OrderItemAdmin(admin.ModelAdmin[models.OrderItem]):
+class OrderItemAdmin(CustomerSearchMixin, admin.ModelAdmin[models.OrderItem]):
     list_display = (
         "id",
         "order",
@@ -237,6 +301,15 @@ class OrderItemAdmin(admin.ModelAdmin[models.OrderItem]):
 
     ordering = ("-id",)
 
+    # large tables, see EstimatedCountPaginator
+    paginator = EstimatedCountPaginator
+
+    show_full_result_count = False
+
+    list_select_related = ("order__customer", "product")
+
+    customer_path = "order__customer"
+
     search_fields = (
         "id",
         "order__id",
@@ -259,6 +332,8 @@ class OrderItemAdmin(admin.ModelAdmin[models.OrderItem]):
 
 @admin.register(models.Settings)
 class SettingsAdmin(admin.ModelAdmin[models.Settings]):
+    form = SettingsForm
+
     list_display = (
         "id",
         "wc_url",
@@ -267,3 +342,102 @@ class SettingsAdmin(admin.ModelAdmin[models.Settings]):
         "ncm_key",
         "delivery_ncm_from",
     )
+
+
+@admin.register(models.WcWebhook)
+class WcWebhookAdmin(admin.ModelAdmin[models.WcWebhook]):
+    list_display = (
+        "id",
+        "topic",
+        "wc_order_id",
+        "created_at",
+        "processed_at",
+        "error",
+    )
+
+    ordering = ("-id",)
+
+    search_fields = ("id", "wc_order_id")
+
+    list_filter = ("topic",)
+
+
+@admin.register(models.ImportJob)
+class ImportJobAdmin(admin.ModelAdmin[models.ImportJob]):
+    list_display = (
+        "id",
+        "file",
+        "status",
+        "rows_read",
+        "rows_done",
+        "rows_rejected",
+        "get_rows_per_second",
+        "created_at",
+        "finished_at",
+    )
+
+    ordering = ("-id",)
+
+    list_filter = ("status",)
+
+    # progress is written by process_import_jobs
+    readonly_fields = (
+        "status",
+        "rows_read",
+        "rows_done",
+        "rows_rejected",
+        "rows_per_second",
+        "started_at",
+        "finished_at",
+        "error",
+    )
+
+    actions = (retry_import_jobs,)
+
+    @admin.display(description="Rows/sec")
+    def get_rows_per_second(self, obj: models.ImportJob):
+        return round(obj.rows_per_second)
+
+
+@admin.register(models.NCMDispatch)
+class NCMDispatchAdmin(admin.ModelAdmin[models.NCMDispatch]):
+    list_display = (
+        "id",
+        "order",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "sent_at",
+        "error",
+    )
+
+    ordering = ("-id",)
+
+    search_fields = ("order__id",)
+
+    list_filter = ("status",)
+
+    raw_id_fields = ("order",)
+
+    # written by process_ncm_dispatches
+    readonly_fields = ("attempts", "attempted_at", "sent_at", "error")
+
+
+@admin.register(models.NCMBranch)
+class NCMBranchAdmin(admin.ModelAdmin[models.NCMBranch]):
+    list_display = ("name", "code", "district_name", "phone", "updated_at")
+
+    ordering = ("name",)
+
+    search_fields = ("name", "code", "district_name")
+
+
+@admin.register(models.NCMRate)
+class NCMRateAdmin(admin.ModelAdmin[models.NCMRate]):
+    list_display = ("source", "destination", "charge", "updated_at")
+
+    ordering = ("source", "destination")
+
+    search_fields = ("source", "destination")
+
+    list_filter = ("source",)
@@ -0,0 +1,314 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from typing import Any
+from typing import Generator
+
+from django.db.models import F
+from django.db.models import OuterRef
+from django.db.models import QuerySet
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Greatest
+from django.db.models.functions import Least
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_init
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from core import models
+from core.db import get_aggregate
+
+# stored counters of customers, products and categories. signals add the
+# difference a single save or delete makes to the counters, in the UPDATE
+# itself (F() + delta). the bulk paths (fetch_wc, the csv importer) and
+# recompute_counters recompute the counters of the affected rows instead,
+# with one UPDATE per table
+
+
+def get_order_dates() -> dict[str, Any]:
+    orders = models.Order.objects.filter(customer=OuterRef("pk"))
+    return {
+        "first_order_at": get_aggregate(orders, "MIN", "ordered_at"),
+        "last_order_at": get_aggregate(orders, "MAX", "ordered_at"),
+    }
+
+
+def refresh_customer_counters(customers: QuerySet[models.Customer]):
+    orders = models.Order.objects.filter(customer=OuterRef("pk"))
+    customers.update(
+        order_count=get_aggregate(orders, "COUNT"),
+        order_item_count=get_aggregate(
+            models.OrderItem.objects.filter(order__customer=OuterRef("pk")),
+            "COUNT",
+        ),
+        total_paid=Coalesce(
+            get_aggregate(
+                models.PaymentItem.objects.filter(
+                    order__customer=OuterRef("pk")
+                ),
+                "SUM",
+                "amount",
+            ),
+            Decimal("0.00"),
+        ),
+        **get_order_dates(),
+    )
+
+
+def refresh_product_counters(products: QuerySet[models.Product]):
+    products.update(
+        units_sold=Coalesce(
+            get_aggregate(
+                models.OrderItem.objects.filter(product=OuterRef("pk")),
+                "SUM",
+                "quantity",
+            ),
+            0,
+        )
+    )
+
+
+def refresh_category_counters(categories: QuerySet[models.Category]):
+    categories.update(
+        product_count=get_aggregate(
+            models.Product.objects.filter(category=OuterRef("pk")),
+            "COUNT",
+        )
+    )
+
+
+# fields the counters of a row depend on. their values when the row was
+# loaded or last saved are kept on the instance, to know what a save changed
+# without reading the row again
+COUNTED_FIELDS: dict[Any, tuple[str, ...]] = {
+    models.Order: ("customer_id", "ordered_at"),
+    models.OrderItem: ("order_id", "product_id", "quantity"),
+    models.PaymentItem: ("order_id", "amount"),
+    models.Product: ("category_id",),
+}
+
+# set while a bulk path writes, it recomputes the counters itself
+counters_deferred: ContextVar[bool] = ContextVar(
+    "counters_deferred", default=False
+)
+
+
+@contextmanager
+def defer_counters() -> Generator[None, None, None]:
+    """Skip the counter signals in the block, see save_orders
+
+    For bulk writes that recompute the counters of the affected rows at
+    the end, instead of an UPDATE per saved or deleted row.
+    """
+    token = counters_deferred.set(True)
+    try:
+        yield
+    finally:
+        counters_deferred.reset(token)
+
+
+def add_counters(queryset: QuerySet[Any], **deltas: Any):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        queryset.update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+
+
+def get_order_customers(order_id: int) -> QuerySet[models.Customer]:
+    return models.Customer.objects.filter(orders=order_id)
+
+
+def remember_counted(sender: Any, instance: Any):
+    # deferred fields are not in __dict__, they are not fetched here
+    instance._counted = {
+        field: instance.__dict__.get(field) for field in COUNTED_FIELDS[sender]
+    }
+
+
+def get_previous(sender: Any, instance: Any) -> dict[str, Any]:
+    """Counted values of a saved row before the save, see COUNTED_FIELDS"""
+    previous: dict[str, Any] = instance._counted
+    remember_counted(sender, instance)
+    return previous
+
+
+def is_skipped(kwargs: dict[str, Any]) -> bool:
+    return bool(kwargs.get("raw")) or counters_deferred.get()
+
+
+@receiver(post_init, sender=models.Order)
+@receiver(post_init, sender=models.OrderItem)
+@receiver(post_init, sender=models.PaymentItem)
+@receiver(post_init, sender=models.Product)
+def init_counted(sender: Any, instance: Any, **kwargs: Any):
+    remember_counted(sender, instance)
+
+
+@receiver(pre_save, sender=models.Order)
+@receiver(pre_save, sender=models.OrderItem)
+@receiver(pre_save, sender=models.PaymentItem)
+@receiver(pre_save, sender=models.Product)
+def load_counted(sender: Any, instance: Any, raw: bool, **kwargs: Any):
+    # only when the values are unknown: deferred fields, or an instance
+    # built with the pk of an existing row
+    counted: dict[str, Any] = instance._counted
+    if raw or instance.pk is None:
+        return
+    if instance._state.adding or None in counted.values():
+        row = (
+            sender.objects.filter(pk=instance.pk)
+            .values(*COUNTED_FIELDS[sender])
+            .first()
+        )
+        counted.update(row or {})
+
+
+@receiver(post_save, sender=models.Order)
+def count_saved_order(
+    sender: Any, instance: models.Order, created: bool, **kwargs: Any
+):
+    previous = get_previous(sender, instance)
+    if is_skipped(kwargs):
+        return
+    customer_id: int = instance.customer_id  # type: ignore
+    customers = models.Customer.objects.filter(pk=customer_id)
+    if created:
+        ordered_at = Value(instance.ordered_at)
+        customers.update(
+            order_count=F("order_count") + 1,
+            first_order_at=Least("first_order_at", ordered_at),
+            last_order_at=Greatest("last_order_at", ordered_at),
+        )
+    elif previous["customer_id"] != customer_id:
+        # the items and payments of the order move with it
+        refresh_customer_counters(
+            models.Customer.objects.filter(
+                pk__in=[previous["customer_id"], customer_id]
+            )
+        )
+    elif previous["ordered_at"] != instance.ordered_at:
+        customers.update(**get_order_dates())
+
+
+@receiver(post_delete, sender=models.Order)
+def count_deleted_order(instance: models.Order, **kwargs: Any):
+    if is_skipped(kwargs):
+        return
+    # the first and last order dates can not be derived from the deleted
+    # one, they are aggregated over the remaining orders of the customer
+    models.Customer.objects.filter(
+        pk=instance.customer_id  # type: ignore
+    ).update(order_count=F("order_count") - 1, **get_order_dates())
+
+
+@receiver(post_save, sender=models.OrderItem)
+def count_saved_order_item(
+    sender: Any, instance: models.OrderItem, created: bool, **kwargs: Any
+):
+    previous = get_previous(sender, instance)
+    if is_skipped(kwargs):
+        return
+    order_id: int = instance.order_id  # type: ignore
+    product_id: int = instance.product_id  # type: ignore
+    products = models.Product.objects.filter(pk=product_id)
+    if created:
+        add_counters(get_order_customers(order_id), order_item_count=1)
+        add_counters(products, units_sold=instance.quantity)
+        return
+    if previous["order_id"] != order_id:
+        add_counters(
+            get_order_customers(previous["order_id"]), order_item_count=-1
+        )
+        add_counters(get_order_customers(order_id), order_item_count=1)
+    if previous["product_id"] != product_id:
+        add_counters(
+            models.Product.objects.filter(pk=previous["product_id"]),
+            units_sold=-previous["quantity"],
+        )
+        add_counters(products, units_sold=instance.quantity)
+    else:
+        add_counters(
+            products, units_sold=instance.quantity - previous["quantity"]
+        )
+
+
+@receiver(post_delete, sender=models.OrderItem)
+def count_deleted_order_item(instance: models.OrderItem, **kwargs: Any):
+    if is_skipped(kwargs):
+        return
+    add_counters(
+        get_order_customers(instance.order_id),  # type: ignore
+        order_item_count=-1,
+    )
+    add_counters(
+        models.Product.objects.filter(pk=instance.product_id),  # type: ignore
+        units_sold=-instance.quantity,
+    )
+
+
+@receiver(post_save, sender=models.PaymentItem)
+def count_saved_payment(
+    sender: Any, instance: models.PaymentItem, created: bool, **kwargs: Any
+):
+    previous = get_previous(sender, instance)
+    if is_skipped(kwargs):
+        return
+    order_id: int = instance.order_id  # type: ignore
+    customers = get_order_customers(order_id)
+    if created:
+        add_counters(customers, total_paid=instance.amount)
+    elif previous["order_id"] != order_id:
+        add_counters(
+            get_order_customers(previous["order_id"]),
+            total_paid=-previous["amount"],
+        )
+        add_counters(customers, total_paid=instance.amount)
+    else:
+        add_counters(
+            customers, total_paid=instance.amount - previous["amount"]
+        )
+
+
+@receiver(post_delete, sender=models.PaymentItem)
+def count_deleted_payment(instance: models.PaymentItem, **kwargs: Any):
+    if is_skipped(kwargs):
+        return
+    add_counters(
+        get_order_customers(instance.order_id),  # type: ignore
+        total_paid=-instance.amount,
+    )
+
+
+@receiver(post_save, sender=models.Product)
+def count_saved_product(
+    sender: Any, instance: models.Product, created: bool, **kwargs: Any
+):
+    previous = get_previous(sender, instance)
+    if is_skipped(kwargs):
+        return
+    category_id: int = instance.category_id  # type: ignore
+    if not created and previous["category_id"] == category_id:
+        return
+    if not created:
+        add_counters(
+            models.Category.objects.filter(pk=previous["category_id"]),
+            product_count=-1,
+        )
+    add_counters(
+        models.Category.objects.filter(pk=category_id), product_count=1
+    )
+
+
+@receiver(post_delete, sender=models.Product)
+def count_deleted_product(instance: models.Product, **kwargs: Any):
+    if is_skipped(kwargs):
+        return
+    add_counters(
+        models.Category.objects.filter(
+            pk=instance.category_id  # type: ignore
+        ),
+        product_count=-1,
+    )
@@ -0,0 +1,89 @@
+import zlib
+from contextlib import contextmanager
+from typing import Any
+from typing import Generator
+
+from django.db import connection
+from django.db.models import Func
+from django.db.models import QuerySet
+from django.db.models import Subquery
+
+
+def get_lock_key(name: str) -> int:
+    return zlib.crc32(name.encode())
+
+
+def try_advisory_lock(name: str) -> bool:
+    """Take a session level Postgres advisory lock, without waiting
+
+    Returns whether it was acquired. The lock belongs to the current
+    connection, it is released by release_advisory_lock or when the
+    connection is closed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [get_lock_key(name)])
+        acquired: bool = cursor.fetchone()[0]  # type: ignore
+    return acquired
+
+
+def release_advisory_lock(name: str):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [get_lock_key(name)])
+
+
+def has_advisory_lock(name: str) -> bool:
+    """Whether the current connection still holds the advisory lock
+
+    False once the connection that took it was lost, the lock went with
+    it. A bigint key is the classid (high bits) and objid of pg_locks.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT EXISTS (
+                SELECT FROM pg_locks
+                WHERE locktype = 'advisory'
+                AND pid = pg_backend_pid()
+                AND classid = 0 AND objid = %s::oid AND objsubid = 1
+                AND granted
+            )
+            """,
+            [get_lock_key(name)],
+        )
+        held: bool = cursor.fetchone()[0]  # type: ignore
+    return held
+
+
+def close_broken_connection():
+    # after a database error, a connection that still works is kept, with
+    # the advisory locks it holds
+    if connection.connection is not None and not connection.is_usable():
+        connection.close()
+
+
+@contextmanager
+def advisory_lock(name: str) -> Generator[bool, None, None]:
+    """Hold a session level Postgres advisory lock while in the block
+
+    Does not wait for the lock, yields whether it was acquired. The lock
+    is released when the block exits or the connection is closed.
+    """
+    acquired = try_advisory_lock(name)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release_advisory_lock(name)
+
+
+def get_aggregate(queryset: QuerySet[Any], function: str, field: str = "pk"):
+    """Aggregate of the queryset as a subquery, see OuterRef
+
+    Used to annotate or update many rows with their counts and totals in
+    one query, instead of a query per row.
+    """
+    return Subquery(
+        queryset.order_by()
+        .annotate(value=Func(field, function=function))
+        .values("value")
+    )
@@ -1,5 +1,17 @@
+from typing import Any
+
 from django.forms import FileField
 from django.forms import Form
+from django.forms import ModelForm
+from django.forms import Select
+
+from core.models import DeliveryMethodChoices
+from core.models import Order
+from core.models import Settings
+from core.ncm import get_ncm_branch_label
+from core.ncm import get_ncm_branches
+from core.ncm import get_ncm_charge
+from core.ncm import is_ncm_branch
 
 
 class OrderUploadForm(Form):
@@ -7,3 +19,82 @@ class OrderUploadForm(Form):
         label="Upload CSV file",
         required=True,
     )
+
+
+def set_ncm_branch_widgets(form: ModelForm[Any], fields: tuple[str, ...]):
+    """Pick the branch fields from the branches stored by refresh_ncm
+
+    A saved value that is no longer a branch stays a choice, so editing
+    the other fields does not change it.
+    """
+    branches = get_ncm_branches()
+    for field in fields:
+        if field not in form.fields:
+            continue
+        names = branches
+        current = getattr(form.instance, field)
+        if current and current not in names:
+            names = [current, *names]
+        form.fields[field].widget = Select(
+            choices=[
+                ("", "---------"),
+                *((name, get_ncm_branch_label(name)) for name in names),
+            ]
+        )
+
+
+def clean_ncm_branches(form: ModelForm[Any], fields: tuple[str, ...]):
+    # new values are checked against the branches stored by refresh_ncm
+    for field in fields:
+        if form.instance.pk is not None and field not in form.changed_data:
+            continue
+        branch = form.cleaned_data.get(field)
+        if branch and not is_ncm_branch(branch):
+            form.add_error(field, f"{branch} is not an NCM branch.")
+
+
+class OrderForm(ModelForm[Order]):
+    ncm_branch_fields = ("delivery_ncm_from", "delivery_ncm_to")
+
+    class Meta:
+        model = Order
+        fields = "__all__"
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        set_ncm_branch_widgets(self, self.ncm_branch_fields)
+
+    def clean(self) -> dict[str, Any]:
+        super().clean()
+        cleaned_data = self.cleaned_data
+        clean_ncm_branches(self, self.ncm_branch_fields)
+        if cleaned_data.get("delivery_method") != DeliveryMethodChoices.NCM:
+            return cleaned_data
+        # new orders are charged the ncm rate, unless a charge was entered
+        if self.instance.pk is None and "delivery_charge" not in (
+            self.changed_data
+        ):
+            charge = get_ncm_charge(
+                cleaned_data.get("delivery_ncm_from", ""),
+                cleaned_data.get("delivery_ncm_to", ""),
+            )
+            if charge is not None:
+                cleaned_data["delivery_charge"] = charge
+        return cleaned_data
+
+
+class SettingsForm(ModelForm[Settings]):
+    ncm_branch_fields = ("delivery_ncm_from",)
+
+    class Meta:
+        model = Settings
+        fields = "__all__"
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        set_ncm_branch_widgets(self, self.ncm_branch_fields)
+
+    def clean(self) -> dict[str, Any]:
+        super().clean()
+        clean_ncm_branches(self, self.ncm_branch_fields)
+        return self.cleaned_data
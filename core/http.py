@@ -0,0 +1,257 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import UTC
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+# methods that are safe to send again after the server saw the request
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# the server is overloaded, the request rate is lowered
+THROTTLE_STATUS_CODES = {429, 503}
+# transient server errors, only retried for idempotent methods
+RETRY_STATUS_CODES = {500, 502, 504}
+
+
+def get_retry_after(response: httpx.Response) -> float | None:
+    # "Retry-After: 120" or "Retry-After: Fri, 31 Dec 2024 23:59:59 GMT"
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=UTC)
+    return max((retry_at - datetime.now(UTC)).total_seconds(), 0.0)
+
+
+def is_refused(response: httpx.Response) -> bool:
+    """Whether the server did not process the request
+
+    A 429 is sent before the request is handled. A 503 may come from a
+    proxy after the request was applied, it is only trusted along with
+    a Retry-After.
+    """
+    if response.status_code == 429:
+        return True
+    return response.status_code == 503 and "Retry-After" in response.headers
+
+
+class RateLimit:
+    """Request policy shared by all requests of a client
+
+    Requests take a token from a bucket refilled at `rate` per second,
+    holding at most `burst` tokens. Throttled (429/503) and failed
+    requests are retried up to `retries` times after the Retry-After
+    header (at most `max_backoff`) or an exponential backoff with full
+    jitter. Non idempotent requests are only retried when the server
+    did not process them. The number of requests in flight adapts
+    between 1 and `max_concurrency`: it is halved when the server
+    throttles and grows by one after a window of successful requests
+    (AIMD).
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        max_concurrency: int = 1,
+        retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        # set from Retry-After, no request is sent before
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def has_slot(self) -> bool:
+        return self.in_flight < int(self.concurrency)
+
+    def reserve(self) -> float:
+        """Take a token, returns the seconds to wait before sending"""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.updated_at
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+            # tokens may go negative, later callers wait for the refill
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate, 0.0)
+            return max(wait, self.paused_until - now)
+
+    def on_success(self):
+        with self.lock:
+            self.concurrency = min(
+                self.concurrency + 1 / self.concurrency, self.max_concurrency
+            )
+
+    def on_throttle(self, retry_after: float | None):
+        with self.lock:
+            self.concurrency = max(self.concurrency / 2, 1.0)
+            if retry_after is not None:
+                self.paused_until = max(
+                    self.paused_until, time.monotonic() + retry_after
+                )
+
+    def get_backoff(self, attempt: int) -> float:
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2**attempt)
+        )
+
+    def get_retry_delay(
+        self,
+        request: httpx.Request,
+        response: httpx.Response | None,
+        error: httpx.TransportError | None,
+        attempt: int,
+    ) -> float | None:
+        """Record the outcome of a request
+
+        Returns the seconds to wait before retrying, None when the
+        response (or error) is final.
+        """
+        idempotent = request.method in IDEMPOTENT_METHODS
+        if response is None:
+            # a request that never reached the server is safe to repeat
+            if not idempotent and not isinstance(
+                error, httpx.ConnectError | httpx.ConnectTimeout
+            ):
+                return None
+            if attempt >= self.retries:
+                return None
+            return self.get_backoff(attempt)
+        code = response.status_code
+        if code in THROTTLE_STATUS_CODES:
+            retry_after = get_retry_after(response)
+            if retry_after is not None:
+                retry_after = min(retry_after, self.max_backoff)
+            self.on_throttle(retry_after)
+            if attempt >= self.retries:
+                return None
+            if not idempotent and not is_refused(response):
+                return None
+            if retry_after is not None:
+                return retry_after
+            return self.get_backoff(attempt)
+        if code in RETRY_STATUS_CODES and idempotent:
+            if attempt >= self.retries:
+                return None
+            return self.get_backoff(attempt)
+        if code < 400:
+            self.on_success()
+        return None
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Sync transport applying a RateLimit"""
+
+    def __init__(
+        self,
+        limit: RateLimit,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        self.limit = limit
+        self.transport = transport or httpx.HTTPTransport()
+        self.slots = threading.Condition()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            with self.slots:
+                self.slots.wait_for(self.limit.has_slot)
+                self.limit.in_flight += 1
+            try:
+                time.sleep(self.limit.reserve())
+                try:
+                    response = self.transport.handle_request(request)
+                except httpx.TransportError as e:
+                    delay = self.limit.get_retry_delay(
+                        request, None, e, attempt
+                    )
+                    if delay is None:
+                        raise
+                else:
+                    delay = self.limit.get_retry_delay(
+                        request, response, None, attempt
+                    )
+                    if delay is None:
+                        return response
+                    response.close()
+            finally:
+                with self.slots:
+                    self.limit.in_flight -= 1
+                    self.slots.notify_all()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Async transport applying a RateLimit"""
+
+    def __init__(
+        self,
+        limit: RateLimit,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.limit = limit
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.slots = asyncio.Condition()
+
+    async def handle_async_request(
+        self, request: httpx.Request
+    ) -> httpx.Response:
+        attempt = 0
+        while True:
+            async with self.slots:
+                await self.slots.wait_for(self.limit.has_slot)
+                self.limit.in_flight += 1
+            try:
+                await asyncio.sleep(self.limit.reserve())
+                try:
+                    response = await self.transport.handle_async_request(
+                        request
+                    )
+                except httpx.TransportError as e:
+                    delay = self.limit.get_retry_delay(
+                        request, None, e, attempt
+                    )
+                    if delay is None:
+                        raise
+                else:
+                    delay = self.limit.get_retry_delay(
+                        request, response, None, attempt
+                    )
+                    if delay is None:
+                        return response
+                    await response.aclose()
+            finally:
+                async with self.slots:
+                    self.limit.in_flight -= 1
+                    self.slots.notify_all()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,349 @@
+from datetime import datetime
+from io import StringIO
+from typing import Any
+
+from django.db import connection
+from django.db import models
+from django.db import transaction
+from django.db.backends.utils import CursorWrapper
+from django.utils import timezone
+
+from core.counters import refresh_category_counters
+from core.counters import refresh_customer_counters
+from core.counters import refresh_product_counters
+from core.models import Category
+from core.models import Color
+from core.models import Customer
+from core.models import Order
+from core.models import OrderItem
+from core.models import PaymentItem
+from core.models import Product
+from core.models import Size
+from core.phones import get_phone_customers
+from core.phones import normalize_phone
+
+# temporary tables are not written to the WAL and are private to the
+# connection, so concurrent imports do not see each other's rows
+STAGING_TABLE = "import_staging"
+
+# staging column: model field it is imported into, the column takes the
+# field's database type
+STAGING_COLUMNS: dict[str, tuple[type[models.Model], str]] = {
+    "full_name": (Customer, "full_name"),
+    "insta_handle": (Customer, "insta_handle"),
+    "email": (Customer, "email"),
+    "phone": (Customer, "phone"),
+    "phone2": (Customer, "phone2"),
+    "phone_e164": (Customer, "phone_e164"),
+    "phone2_e164": (Customer, "phone2_e164"),
+    "address": (Customer, "address"),
+    "c_title": (Category, "title"),
+    "p_title": (Product, "title"),
+    "s_name": (Size, "name"),
+    "c_name": (Color, "name"),
+    "medium": (Order, "medium"),
+    "status": (Order, "status"),
+    "subtotal_price": (Order, "subtotal_price"),
+    "delivery_charge": (Order, "delivery_charge"),
+    "discount": (Order, "discount"),
+    "total_price": (Order, "total_price"),
+    "is_paid": (Order, "is_paid"),
+    "delivery_to": (Order, "delivery_address"),
+    "delivery_method": (Order, "delivery_method"),
+    "delivery_package_id": (Order, "delivery_package_id"),
+    "ordered_at": (Order, "ordered_at"),
+    "shipped_at": (Order, "shipped_at"),
+    "paid_at": (Order, "paid_at"),
+    "payment_method": (PaymentItem, "payment_method"),
+    "amount": (PaymentItem, "amount"),
+    "is_advance": (PaymentItem, "is_advance"),
+    "is_giveaway": (OrderItem, "is_giveaway"),
+    "giveaway_reason": (OrderItem, "giveaway_reason"),
+    "quantity": (OrderItem, "quantity"),
+    "price_per_unit": (OrderItem, "price_per_unit"),
+    "price": (OrderItem, "price"),
+    "is_disputed": (OrderItem, "is_disputed"),
+    "dispute_remarks": (OrderItem, "dispute_remarks"),
+    "fingerprint": (Order, "import_fingerprint"),
+}
+
+
+def get_customer_upsert() -> str:
+    """ON CONFLICT clause updating customers with newer data
+
+    Empty values do not overwrite, unchanged customers are not written.
+    """
+    table = Customer._meta.db_table
+    values = {"full_name": "NULLIF(EXCLUDED.full_name, 'N/A')"}
+    for column in (
+        "insta_handle",
+        "email",
+        "phone2",
+        "phone2_e164",
+        "address",
+    ):
+        values[column] = f"NULLIF(EXCLUDED.{column}, '')"
+    updates = {
+        column: f"COALESCE({value}, {table}.{column})"
+        for column, value in values.items()
+    }
+    current = ", ".join(f"{table}.{column}" for column in updates)
+    return (
+        "ON CONFLICT (phone) DO UPDATE SET "
+        + ", ".join(f"{column} = {value}" for column, value in updates.items())
+        + ", updated_at = now() "
+        f"WHERE ({current}) IS DISTINCT FROM ({', '.join(updates.values())})"
+    )
+
+
+def get_copy_value(value: Any) -> str:
+    # COPY text format, tab separated with \N for null
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime) and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def get_phone_rows(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Rows with their E.164 numbers and the phone of their customer
+
+    Customers are upserted on their raw phone, so rows of a known number
+    are given the phone of its customer (see core.phones), and rows of a
+    new number the phone of its first row.
+    """
+    existing = get_phone_customers({row["phone"] for row in rows})
+    first: dict[str, str] = {}
+    phone_rows: list[dict[str, Any]] = []
+    for row in rows:
+        number = normalize_phone(row["phone"])
+        if row["phone"] in existing:
+            phone = existing[row["phone"]].phone
+        else:
+            phone = first.setdefault(number or row["phone"], row["phone"])
+        phone_rows.append(
+            {
+                **row,
+                "phone": phone,
+                "phone_e164": number,
+                "phone2_e164": normalize_phone(row["phone2"]),
+            }
+        )
+    return phone_rows
+
+
+def create_staging_table(cursor: CursorWrapper):
+    columns = [
+        # order ids are allocated while copying, in row order
+        "order_id bigint DEFAULT nextval("
+        f"pg_get_serial_sequence('{Order._meta.db_table}', 'id'))"
+    ]
+    for name, (model, field_name) in STAGING_COLUMNS.items():
+        field = model._meta.get_field(field_name)
+        columns.append(f"{name} {field.db_type(connection)}")  # type: ignore
+    # left over by an earlier batch of the same transaction
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {STAGING_TABLE} ({', '.join(columns)}) "
+        "ON COMMIT DROP"
+    )
+
+
+def copy_rows(cursor: CursorWrapper, rows: list[dict[str, Any]]):
+    content = StringIO()
+    for row in rows:
+        content.write(
+            "\t".join(get_copy_value(row[name]) for name in STAGING_COLUMNS)
+        )
+        content.write("\n")
+    content.seek(0)
+    cursor.copy_expert(  # type: ignore
+        f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN",
+        content,
+    )
+
+
+def insert_select(
+    cursor: CursorWrapper,
+    model: type[models.Model],
+    values: dict[str, str],
+    source: str,
+    conflict: str = "",
+):
+    """INSERT INTO the model's table the rows SELECTed from source
+
+    `values` maps columns to SQL expressions over source, the remaining
+    columns get the field defaults.
+    """
+    columns: list[str] = []
+    expressions: list[str] = []
+    params: list[Any] = []
+    for field in model._meta.concrete_fields:  # type: ignore
+        column: str = field.column  # type: ignore
+        if column in values:
+            expressions.append(values[column])
+        elif field.primary_key:
+            continue
+        elif getattr(field, "auto_now", False) or getattr(
+            field, "auto_now_add", False
+        ):
+            expressions.append("now()")
+        else:
+            expressions.append("%s")
+            params.append(
+                field.get_db_prep_save(field.get_default(), connection)
+            )
+        columns.append(column)
+    cursor.execute(
+        f"INSERT INTO {model._meta.db_table} ({', '.join(columns)}) "
+        f"SELECT {', '.join(expressions)} FROM {source} {conflict}",
+        params,
+    )
+
+
+@transaction.atomic
+def copy_previous_orders(rows: list[dict[str, Any]]):
+    """Import cleaned rows of the old system (see data_cleanup)
+
+    The rows are COPYed into a staging table, then every table is filled
+    with one INSERT ... SELECT joined against it. Customers are updated
+    with the latest non empty data of their rows, then the rows whose
+    fingerprint (see get_row_fingerprint) was imported before are
+    skipped. Existing categories, sizes, colors and products are kept as
+    they are. Returns the number of orders created.
+    """
+    order_table = Order._meta.db_table
+    customer_table = Customer._meta.db_table
+    category_table = Category._meta.db_table
+    product_table = Product._meta.db_table
+    rows = get_phone_rows(rows)
+    with connection.cursor() as cursor:
+        create_staging_table(cursor)
+        copy_rows(cursor, rows)
+        # the last row of a customer wins, empty values do not overwrite,
+        # known rows included so re-imports update their customers
+        insert_select(
+            cursor,
+            Customer,
+            {
+                "full_name": "full_name",
+                "insta_handle": "insta_handle",
+                "email": "email",
+                "phone": "phone",
+                "phone2": "phone2",
+                "phone_e164": "phone_e164",
+                "phone2_e164": "phone2_e164",
+                "address": "address",
+            },
+            f"(SELECT DISTINCT ON (phone) * FROM {STAGING_TABLE} "
+            "ORDER BY phone, order_id DESC) s",
+            get_customer_upsert(),
+        )
+        # skip the rows imported before
+        cursor.execute(
+            f"DELETE FROM {STAGING_TABLE} s USING {order_table} o "
+            "WHERE o.import_fingerprint = s.fingerprint"
+        )
+        insert_select(
+            cursor,
+            Category,
+            {"title": "c_title"},
+            f"(SELECT DISTINCT c_title FROM {STAGING_TABLE}) s",
+            "ON CONFLICT (title) DO NOTHING",
+        )
+        insert_select(
+            cursor,
+            Size,
+            {"name": "s_name"},
+            f"(SELECT DISTINCT s_name FROM {STAGING_TABLE}) s",
+            "ON CONFLICT (name) DO NOTHING",
+        )
+        insert_select(
+            cursor,
+            Color,
+            {"name": "c_name"},
+            f"(SELECT DISTINCT c_name FROM {STAGING_TABLE}) s",
+            "ON CONFLICT (name) DO NOTHING",
+        )
+        # the first row of a product wins
+        insert_select(
+            cursor,
+            Product,
+            {"title": "s.p_title", "category_id": "c.id"},
+            f"(SELECT DISTINCT ON (p_title) p_title, c_title "
+            f"FROM {STAGING_TABLE} ORDER BY p_title, order_id) s "
+            f"JOIN {category_table} c ON c.title = s.c_title",
+            "ON CONFLICT (title) DO NOTHING",
+        )
+        insert_select(
+            cursor,
+            Order,
+            {
+                "id": "s.order_id",
+                "customer_id": "cu.id",
+                "medium": "s.medium",
+                "status": "s.status",
+                "subtotal_price": "s.subtotal_price",
+                "delivery_charge": "s.delivery_charge",
+                "discount": "s.discount",
+                "total_price": "s.total_price",
+                "is_paid": "s.is_paid",
+                "delivery_address": "s.delivery_to",
+                "delivery_method": "s.delivery_method",
+                "delivery_package_id": "s.delivery_package_id",
+                "ordered_at": "s.ordered_at",
+                "shipped_at": "s.shipped_at",
+                "paid_at": "s.paid_at",
+                "import_fingerprint": "s.fingerprint",
+            },
+            f"{STAGING_TABLE} s JOIN {customer_table} cu "
+            "ON cu.phone = s.phone ORDER BY s.order_id",
+        )
+        created = cursor.rowcount
+        insert_select(
+            cursor,
+            PaymentItem,
+            {
+                "order_id": "order_id",
+                "payment_method": "payment_method",
+                "amount": "amount",
+                "is_advance": "is_advance",
+            },
+            f"{STAGING_TABLE} ORDER BY order_id",
+        )
+        insert_select(
+            cursor,
+            OrderItem,
+            {
+                "order_id": "s.order_id",
+                "product_id": "p.id",
+                "is_giveaway": "s.is_giveaway",
+                "giveaway_reason": "s.giveaway_reason",
+                "size": "s.s_name",
+                "color": "s.c_name",
+                "quantity": "s.quantity",
+                "price_per_unit": "s.price_per_unit",
+                "price": "s.price",
+                "is_disputed": "s.is_disputed",
+                "dispute_remarks": "s.dispute_remarks",
+            },
+            f"{STAGING_TABLE} s JOIN {product_table} p "
+            "ON p.title = s.p_title ORDER BY s.order_id",
+        )
+    # bulk inserts bypass the signals of core.counters
+    refresh_customer_counters(
+        Customer.objects.filter(phone__in={row["phone"] for row in rows})
+    )
+    refresh_product_counters(
+        Product.objects.filter(title__in={row["p_title"] for row in rows})
+    )
+    refresh_category_counters(
+        Category.objects.filter(title__in={row["c_title"] for row in rows})
+    )
+    return created
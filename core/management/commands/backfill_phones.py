@@ -0,0 +1,67 @@
+from argparse import ArgumentParser
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db import transaction
+
+from core import models
+from core.phones import set_e164_phones
+
+
+class Command(BaseCommand):
+    help = "Fill the E.164 phone numbers of the existing customers"
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Rows updated per transaction",
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        # id ranges keep the transactions and row locks short
+        last_id = 0
+        count = 0
+        while True:
+            customers = list(
+                models.Customer.objects.filter(pk__gt=last_id)
+                .order_by("pk")
+                .only(
+                    "phone",
+                    "phone2",
+                    "phone3",
+                    "phone_e164",
+                    "phone2_e164",
+                    "phone3_e164",
+                )[: options["batch_size"]]
+            )
+            if not customers:
+                break
+            changed: list[models.Customer] = []
+            for customer in customers:
+                before = (
+                    customer.phone_e164,
+                    customer.phone2_e164,
+                    customer.phone3_e164,
+                )
+                set_e164_phones(customer)
+                if before != (
+                    customer.phone_e164,
+                    customer.phone2_e164,
+                    customer.phone3_e164,
+                ):
+                    changed.append(customer)
+            with transaction.atomic():
+                models.Customer.objects.bulk_update(
+                    changed,
+                    ["phone_e164", "phone2_e164", "phone3_e164"],
+                    batch_size=1000,
+                )
+            last_id = customers[-1].pk
+            count += len(changed)
+        # statistics of the new numbers, for the plans of core.phones
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {models.Customer._meta.db_table}")
+        print(f"Updated the phone numbers of {count} customer(s).")
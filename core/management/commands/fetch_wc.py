@@ -1,19 +1,61 @@
+import asyncio
+import signal
+from argparse import ArgumentParser
 from typing import Any
 
 import httpx
+from asgiref.sync import sync_to_async
 from django.core.management import CommandError
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import DatabaseError
+from django.db import connections
 
-from core import models
+from core.db import close_broken_connection
+from core.db import has_advisory_lock
+from core.db import release_advisory_lock
+from core.db import try_advisory_lock
 from core.models import Settings
-from core.models import StatusChoices
-from core.serializers import WcNewOrderSerializer
+from core.wc import WC_CONCURRENCY
+from core.wc import get_wc_client
+from core.wc import sync_orders
+
+# only one fetch_wc syncs at a time, runs can not overlap
+LOCK_NAME = "fetch_wc"
 
 
 class Command(BaseCommand):
     help = "Fetch orders from woocommerce"
 
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Ignore the sync cursor and fetch every order (backfill)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=WC_CONCURRENCY,
+            help="Number of pages downloaded at the same time (backfill)",
+        )
+        parser.add_argument(
+            "--daemon",
+            action="store_true",
+            help="Keep running and poll woocommerce on an adaptive interval",
+        )
+        parser.add_argument(
+            "--min-interval",
+            type=float,
+            default=15.0,
+            help="Seconds between polls while orders keep arriving (daemon)",
+        )
+        parser.add_argument(
+            "--max-interval",
+            type=float,
+            default=300.0,
+            help="Seconds between polls when the store is idle (daemon)",
+        )
+
     def handle(self, *args: Any, **options: Any):
         print("Fetching orders from woocommerce...")
         settings, _ = Settings.objects.get_or_create(id=1)
@@ -23,101 +65,104 @@ class Command(BaseCommand):
             raise CommandError("wc_consumer_key not set.")
         if not settings.wc_consumer_secret:
             raise CommandError("wc_consumer_secret not set.")
-        res = httpx.get(
-            f"{settings.wc_url}/wp-json/wc/v3/orders",
-            auth=(settings.wc_consumer_key, settings.wc_consumer_secret),
+        if options["daemon"]:
+            asyncio.run(
+                self.daemon(
+                    settings,
+                    options["concurrency"],
+                    options["min_interval"],
+                    options["max_interval"],
+                )
+            )
+            return
+        counts = asyncio.run(
+            self.fetch(settings, options["full"], options["concurrency"])
         )
-        res.raise_for_status()
-        settings, _ = Settings.objects.get_or_create(id=1)
-        for order_data in res.json():
-            serializer = WcNewOrderSerializer(data=order_data)
-            serializer.is_valid(raise_exception=True)
-            wc_data: Any = serializer.validated_data  # type: ignore
+        if counts is None:
+            print("fetch_wc is already running.")
+            return
+        count, created, updated = counts
+        print(
+            f"Fetched {count} order(s), created {created}, "
+            f"updated {updated}."
+        )
+        print("Success.")
 
-            if wc_data["status"] == StatusChoices.CANCELED:
-                continue
+    async def fetch(self, settings: Settings, full: bool, concurrency: int):
+        # the lock is taken on the connection of the sync_to_async thread,
+        # the one the orders are saved with. None if it is taken
+        if not await sync_to_async(try_advisory_lock)(LOCK_NAME):
+            return None
+        try:
+            async with get_wc_client(settings, concurrency) as client:
+                return await sync_orders(client, settings, full, concurrency)
+        finally:
+            await sync_to_async(release_advisory_lock)(LOCK_NAME)
 
-            # check if order already exists
-            if models.Order.objects.filter(
-                medium=models.MediumChoices.WEBSITE,
-                wc_order_id=wc_data["id"],
-            ).exists():
-                print("Order already exists.")
-                continue
+    async def daemon(
+        self,
+        settings: Settings,
+        concurrency: int,
+        min_interval: float,
+        max_interval: float,
+    ):
+        """Poll woocommerce until SIGTERM/SIGINT
 
-            with transaction.atomic():
-                # get or create customer
-                customer, created = models.Customer.objects.get_or_create(
-                    phone=wc_data["billing"]["phone"],
-                )
-                if created:
-                    customer.full_name = wc_data["billing"]["full_name"]
-                    customer.email = wc_data["billing"]["email"]
-                    customer.address = wc_data["billing"]["address"]
-                    if "phone2" in wc_data["shipping"]:
-                        customer.phone2 = wc_data["shipping"]["phone2"]
-                    customer.save()
+        The http client (and its keep-alive connections) and the database
+        connection are reused between polls. The interval is reset to
+        min_interval when a poll finds changes and doubles up to
+        max_interval while the store is idle.
 
-                # get or create category
-                category, _ = models.Category.objects.get_or_create(
-                    title="UNKNOWN"
-                )
+        The lock is held by the connection the polls use, and checked
+        before each poll. A lost connection loses the lock with it, and
+        another fetch_wc may have started since, so the daemon exits.
+        """
+        if not await sync_to_async(try_advisory_lock)(LOCK_NAME):
+            raise CommandError("fetch_wc is already running.")
+        try:
+            await self.poll(settings, concurrency, min_interval, max_interval)
+        finally:
+            # closing the connection releases the lock, if still held
+            await sync_to_async(connections.close_all)()
+        print("Stopped.")
 
-                # create order
-                order = models.Order.objects.create(
-                    customer=customer,
-                    medium=models.MediumChoices.WEBSITE,
-                    wc_order_id=wc_data["id"],
-                    wc_order_key=wc_data["order_key"],
-                    status=wc_data["status"],
-                    subtotal_price=wc_data["total"]
-                    - wc_data["discount_total"]
-                    - wc_data["shipping_total"],
-                    delivery_charge=wc_data["shipping_total"],
-                    discount=wc_data["discount_total"],
-                    total_price=wc_data["total"],
-                    customer_note=wc_data["customer_note"],
-                    delivery_ncm_from=settings.delivery_ncm_from,
-                    delivery_ncm_to=wc_data["shipping"]["delivery_ncm_to"],
-                    delivery_address=wc_data["shipping"]["address"],
-                    delivery_note=wc_data["customer_note"],
-                    ordered_at=wc_data["date_created"],
-                )
-
-                # get or create product & order_item, for each line_item
-                # TODO bulk create
-                for item in wc_data["line_items"]:
-                    # product
-                    product = models.Product.objects.filter(
-                        title=item["name"]
-                    ).first()
-                    if product is None:
-                        product = models.Product(
-                            title=item["name"], category=category
-                        )
-                    product.price = item["price_per_unit"]
-                    product.wc_product_id = item["product_id"]
-                    product.save()
-
-                    # order item
-                    order_item = models.OrderItem(
-                        product=product,
-                        order=order,
-                        wc_item_id=item["id"],
-                        quantity=item["quantity"],
-                        price_per_unit=item["price_per_unit"],
-                        discount=item["discount"],
-                        price=item["price"],
+    async def poll(
+        self,
+        settings: Settings,
+        concurrency: int,
+        min_interval: float,
+        max_interval: float,
+    ):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        interval = min_interval
+        async with get_wc_client(settings, concurrency) as client:
+            while not stop.is_set():
+                try:
+                    if not await sync_to_async(has_advisory_lock)(LOCK_NAME):
+                        raise CommandError("Lost the fetch_wc lock.")
+                    # pick up changes made in the admin
+                    await sync_to_async(settings.refresh_from_db)()
+                    count, created, updated = await sync_orders(
+                        client, settings, concurrency=concurrency
                     )
-                    if item.get("size"):
-                        order_item.size = item["size"]
-                    if item.get("color"):
-                        order_item.color = item["color"]
-                    if item.get("include_longsleeve"):
-                        order_item.include_longsleeve = item[
-                            "include_longsleeve"
-                        ]
-                    if item.get("logo_variation"):
-                        order_item.logo_variation = item["logo_variation"]
-                    order_item.save()
-        print("Success.")
+                    print(
+                        f"Fetched {count} order(s), created {created}, "
+                        f"updated {updated}."
+                    )
+                except (httpx.HTTPError, DatabaseError) as e:
+                    print(f"Failed to fetch orders: {e!r}")
+                    # a broken connection is replaced on the next poll,
+                    # whose lock check then stops the daemon
+                    await sync_to_async(close_broken_connection)()
+                    count = 0
+                if count:
+                    interval = min_interval
+                else:
+                    interval = min(interval * 2, max_interval)
+                try:
+                    await asyncio.wait_for(stop.wait(), interval)
+                except TimeoutError:
+                    pass
@@ -0,0 +1,98 @@
+import time
+from argparse import ArgumentParser
+from typing import Any
+
+from django.core.management import CommandError
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import models
+from core.db import advisory_lock
+from core.models import NCM_TRACKED_STATUSES
+from core.models import Settings
+from core.ncm import NCM_CONCURRENCY
+from core.ncm import apply_ncm_status
+from core.ncm import get_ncm_statuses
+
+
+class Command(BaseCommand):
+    help = "Update the status of the shipped orders from NCM"
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=NCM_CONCURRENCY,
+            help="Number of requests sent to NCM at the same time",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling instead of exiting after one pass",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=900.0,
+            help="Seconds between passes (--watch)",
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        with advisory_lock("poll_ncm_status") as acquired:
+            if not acquired:
+                raise CommandError("poll_ncm_status is already running.")
+            while True:
+                self.poll(options["batch_size"], options["concurrency"])
+                if not options["watch"]:
+                    break
+                time.sleep(options["interval"])
+
+    def poll(self, batch_size: int, concurrency: int):
+        """Update the tracked orders, one batch at a time
+
+        Only orders with an ncm_order_id and a tracked status are read
+        (order_ncm_tracked_idx), delivered or canceled orders drop out.
+        """
+        settings, _ = Settings.objects.get_or_create(id=1)
+        last_id = 0
+        polled = 0
+        updated = 0
+        failed = 0
+        while True:
+            orders = list(
+                models.Order.objects.filter(
+                    ncm_order_id__isnull=False,
+                    status__in=NCM_TRACKED_STATUSES,
+                    id__gt=last_id,
+                )
+                .only("ncm_order_id", "status", "shipped_at", "delivered_at")
+                .order_by("id")[:batch_size]
+            )
+            if not orders:
+                break
+            last_id = orders[-1].pk
+            histories, errors = get_ncm_statuses(
+                settings,
+                [o.ncm_order_id for o in orders],  # type: ignore
+                concurrency,
+            )
+            for ncm_order_id, error in errors.items():
+                print(f"Failed to fetch NCM order {ncm_order_id}: {error!r}")
+            now = timezone.now()
+            changed: list[models.Order] = []
+            for order in orders:
+                history = histories.get(order.ncm_order_id)  # type: ignore
+                if history is not None and apply_ncm_status(order, history):
+                    order.updated_at = now
+                    changed.append(order)
+            models.Order.objects.bulk_update(
+                changed, ["status", "shipped_at", "delivered_at", "updated_at"]
+            )
+            polled += len(orders)
+            updated += len(changed)
+            failed += len(errors)
+        print(
+            f"Polled {polled} NCM order(s), updated {updated}, "
+            f"{failed} failed."
+        )
@@ -0,0 +1,119 @@
+import os
+import time
+from argparse import ArgumentParser
+from typing import Any
+
+from django.core.management import CommandError
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import models
+from core.actions import IMPORT_BATCH_SIZE
+from core.actions import upload_previous_orders
+from core.db import advisory_lock
+
+
+class Command(BaseCommand):
+    help = "Import the queued csv uploads"
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument(
+            "--batch-size", type=int, default=IMPORT_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of processes cleaning the rows",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling for jobs instead of exiting once none is left",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds between polls when no job is queued (--watch)",
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        # jobs are processed one at a time, in upload order
+        with advisory_lock("process_import_jobs") as acquired:
+            if not acquired:
+                raise CommandError("process_import_jobs is already running.")
+            while True:
+                while self.process_job(
+                    options["batch_size"], options["processes"]
+                ):
+                    pass
+                if not options["watch"]:
+                    break
+                time.sleep(options["interval"])
+
+    def process_job(self, batch_size: int, processes: int):
+        """Import the oldest unfinished job, returns False if there is none
+
+        A running job was interrupted, it resumes after its checkpoint.
+        """
+        job = (
+            models.ImportJob.objects.filter(
+                status__in=[
+                    models.ImportStatusChoices.QUEUED,
+                    models.ImportStatusChoices.RUNNING,
+                ]
+            )
+            .order_by("id")
+            .first()
+        )
+        if job is None:
+            return False
+        print(f"Importing {job}, resuming after row {job.rows_read}...")
+        job.status = models.ImportStatusChoices.RUNNING
+        if job.started_at is None:
+            job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at", "updated_at"])
+        start = job.rows_read
+        rows_done = job.rows_done
+        resumed_at = time.monotonic()
+
+        def save_checkpoint(count: int, total_count: int):
+            job.rows_read = total_count
+            job.rows_done = rows_done + count
+            job.rows_rejected = job.rows_read - job.rows_done
+            elapsed = time.monotonic() - resumed_at
+            job.rows_per_second = (total_count - start) / max(elapsed, 1e-3)
+            job.save(
+                update_fields=[
+                    "rows_read",
+                    "rows_done",
+                    "rows_rejected",
+                    "rows_per_second",
+                    "updated_at",
+                ]
+            )
+
+        try:
+            with job.file.open("rb") as file:
+                upload_previous_orders(
+                    file,  # type: ignore
+                    batch_size,
+                    save_checkpoint,
+                    start,
+                    processes,
+                )
+        except Exception as e:
+            job.status = models.ImportStatusChoices.FAILED
+            job.error = repr(e)
+            job.save(update_fields=["status", "error", "updated_at"])
+            print(f"Failed to import {job}: {e!r}")
+            return True
+        job.status = models.ImportStatusChoices.COMPLETED
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "finished_at", "updated_at"])
+        print(
+            f"Imported {job}, {job.rows_done} row(s) imported, "
+            f"{job.rows_rejected} rejected."
+        )
+        return True
@@ -0,0 +1,180 @@
+import time
+from argparse import ArgumentParser
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import models
+from core.models import NCMStatusChoices
+from core.models import Settings
+from core.ncm import NCM_CONCURRENCY
+from core.ncm import create_ncm_orders
+from core.ncm import is_unsent_error
+
+# attempts of a dispatch before it fails
+MAX_ATTEMPTS = 5
+# delay before the first retry, doubled on each attempt
+RETRY_DELAY = timedelta(minutes=1)
+# a dispatch sending for longer was interrupted, see fail_interrupted
+SEND_TIMEOUT = timedelta(minutes=10)
+
+
+class Command(BaseCommand):
+    help = "Create the queued NCM orders"
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=NCM_CONCURRENCY,
+            help="Number of requests sent to NCM at the same time",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling the queue instead of exiting once it is empty",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds between polls of an empty queue (--watch)",
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        while True:
+            self.fail_interrupted()
+            while self.process_batch(
+                options["batch_size"], options["concurrency"]
+            ):
+                pass
+            if not options["watch"]:
+                break
+            time.sleep(options["interval"])
+
+    def fail_interrupted(self):
+        """Fail the dispatches whose worker stopped while sending them
+
+        NCM may have created their orders, they are not sent again. Those
+        whose ncm_order_id was saved before the stop were sent.
+        """
+        now = timezone.now()
+        dispatches = models.NCMDispatch.objects.filter(
+            status=NCMStatusChoices.SENDING,
+            attempted_at__lt=now - SEND_TIMEOUT,
+        )
+        with transaction.atomic():
+            sent = dispatches.filter(order__ncm_order_id__isnull=False)
+            sent_ids = list(sent.values_list("order_id", flat=True))
+            sent.update(
+                status=NCMStatusChoices.SENT,
+                sent_at=now,
+                error="",
+                updated_at=now,
+            )
+            models.Order.objects.filter(pk__in=sent_ids).update(
+                ncm_status=NCMStatusChoices.SENT
+            )
+            failed_ids = list(dispatches.values_list("order_id", flat=True))
+            dispatches.update(
+                status=NCMStatusChoices.FAILED,
+                error="Interrupted while sending, check NCM before retrying.",
+                updated_at=now,
+            )
+            models.Order.objects.filter(pk__in=failed_ids).update(
+                ncm_status=NCMStatusChoices.FAILED
+            )
+        if sent_ids or failed_ids:
+            print(
+                f"Found {len(sent_ids) + len(failed_ids)} interrupted "
+                f"dispatch(es), {len(failed_ids)} failed."
+            )
+
+    def process_batch(self, batch_size: int, concurrency: int):
+        """Send the oldest due dispatches, returns their count
+
+        Rows are locked with SKIP LOCKED so several workers can drain the
+        queue at the same time. A dispatch is marked as sending before its
+        request, so it is never picked twice.
+        """
+        settings, _ = Settings.objects.get_or_create(id=1)
+        now = timezone.now()
+        with transaction.atomic():
+            dispatches = list(
+                models.NCMDispatch.objects.filter(
+                    status=NCMStatusChoices.QUEUED, next_attempt_at__lte=now
+                )
+                .select_related("order__customer")
+                .order_by("next_attempt_at", "id")
+                .select_for_update(skip_locked=True, of=("self",))[:batch_size]
+            )
+            if not dispatches:
+                return 0
+            for dispatch in dispatches:
+                dispatch.status = NCMStatusChoices.SENDING
+                dispatch.attempts += 1
+                dispatch.attempted_at = now
+                dispatch.updated_at = now
+            models.NCMDispatch.objects.bulk_update(
+                dispatches,
+                ["status", "attempts", "attempted_at", "updated_at"],
+            )
+            models.Order.objects.filter(
+                pk__in=[d.order_id for d in dispatches]  # type: ignore
+            ).update(ncm_status=NCMStatusChoices.SENDING)
+
+        # created since they were queued, they are not sent again
+        known = [d.order.pk for d in dispatches if d.order.ncm_order_id]
+        _, errors = create_ncm_orders(
+            settings,
+            [d.order for d in dispatches if not d.order.ncm_order_id],
+            concurrency,
+        )
+
+        now = timezone.now()
+        failed: list[models.Order] = []
+        for dispatch in dispatches:
+            dispatch.updated_at = now
+            error = errors.get(dispatch.order.pk)
+            if error is None:
+                dispatch.status = NCMStatusChoices.SENT
+                dispatch.sent_at = now
+                dispatch.error = ""
+            elif is_unsent_error(error) and dispatch.attempts < MAX_ATTEMPTS:
+                dispatch.status = NCMStatusChoices.QUEUED
+                dispatch.next_attempt_at = now + RETRY_DELAY * 2 ** (
+                    dispatch.attempts - 1
+                )
+                dispatch.error = repr(error)
+                dispatch.order.ncm_status = NCMStatusChoices.QUEUED
+                failed.append(dispatch.order)
+            else:
+                dispatch.status = NCMStatusChoices.FAILED
+                dispatch.error = repr(error)
+                dispatch.order.ncm_status = NCMStatusChoices.FAILED
+                failed.append(dispatch.order)
+        with transaction.atomic():
+            models.NCMDispatch.objects.bulk_update(
+                dispatches,
+                [
+                    "status",
+                    "next_attempt_at",
+                    "sent_at",
+                    "error",
+                    "updated_at",
+                ],
+            )
+            models.Order.objects.bulk_update(failed, ["ncm_status"])
+            models.Order.objects.filter(pk__in=known).update(
+                ncm_status=NCMStatusChoices.SENT
+            )
+        print(
+            f"Processed {len(dispatches)} dispatch(es), "
+            f"{len(dispatches) - len(failed)} NCM order(s) created, "
+            f"{len(failed)} not created."
+        )
+        return len(dispatches)
@@ -0,0 +1,87 @@
+import time
+from argparse import ArgumentParser
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from pydantic import ValidationError
+
+from core import models
+from core.models import Settings
+from core.serializers import validate_wc_orders
+from core.wc import save_orders
+
+
+class Command(BaseCommand):
+    help = "Create orders from the received woocommerce webhooks"
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling the inbox instead of exiting once it is empty",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds between polls of an empty inbox (--watch)",
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        while True:
+            while self.process_batch(options["batch_size"]):
+                pass
+            if not options["watch"]:
+                break
+            time.sleep(options["interval"])
+
+    def process_batch(self, batch_size: int):
+        """Process the oldest unprocessed webhooks, returns their count
+
+        Rows are locked with SKIP LOCKED so several workers can drain the
+        inbox at the same time.
+        """
+        settings, _ = Settings.objects.get_or_create(id=1)
+        with transaction.atomic():
+            webhooks = list(
+                models.WcWebhook.objects.filter(processed_at__isnull=True)
+                .order_by("id")
+                .select_for_update(skip_locked=True)[:batch_size]
+            )
+            if not webhooks:
+                return 0
+            valid: list[tuple[models.WcWebhook, Any]] = []
+            for webhook in webhooks:
+                try:
+                    wc_data = validate_wc_orders([webhook.payload])[0]
+                except ValidationError as e:
+                    webhook.error = str(e)
+                else:
+                    valid.append((webhook, wc_data))
+            try:
+                created, updated = save_orders(settings, [d for _, d in valid])
+            except Exception:
+                # retry one by one, so a failing webhook does not block the
+                # inbox, its error is kept for inspection in the admin
+                created, updated = 0, 0
+                for webhook, wc_data in valid:
+                    try:
+                        counts = save_orders(settings, [wc_data])
+                        created += counts[0]
+                        updated += counts[1]
+                    except Exception as e:
+                        webhook.error = repr(e)
+            processed_at = timezone.now()
+            for webhook in webhooks:
+                webhook.processed_at = processed_at
+            models.WcWebhook.objects.bulk_update(
+                webhooks, ["processed_at", "error"]
+            )
+        print(
+            f"Processed {len(webhooks)} webhook(s), created {created}, "
+            f"updated {updated} order(s)."
+        )
+        return len(webhooks)
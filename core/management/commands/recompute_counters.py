@@ -0,0 +1,52 @@
+from argparse import ArgumentParser
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import models
+from core.counters import refresh_category_counters
+from core.counters import refresh_customer_counters
+from core.counters import refresh_product_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored counters of customers, products, categories"
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Rows updated per transaction",
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        for model, refresh in (
+            (models.Customer, refresh_customer_counters),
+            (models.Product, refresh_product_counters),
+            (models.Category, refresh_category_counters),
+        ):
+            # id ranges keep the transactions and row locks short
+            last_id = 0
+            count = 0
+            while True:
+                ids = list(
+                    model.objects.filter(pk__gt=last_id)
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[: options["batch_size"]]
+                )
+                if not ids:
+                    break
+                with transaction.atomic():
+                    refresh(
+                        model.objects.filter(  # type: ignore
+                            pk__gte=ids[0], pk__lte=ids[-1]
+                        )
+                    )
+                last_id = ids[-1]
+                count += len(ids)
+            print(
+                f"Recomputed {count} "
+                f"{str(model._meta.verbose_name_plural).lower()}."
+            )
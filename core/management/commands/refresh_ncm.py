@@ -0,0 +1,71 @@
+import time
+from argparse import ArgumentParser
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Settings
+from core.ncm import NCM_CACHE_TTL
+from core.ncm import NCM_CONCURRENCY
+from core.ncm import refresh_ncm_directory
+
+
+class Command(BaseCommand):
+    help = "Store the NCM branches and delivery rates"
+
+    def add_arguments(self, parser: ArgumentParser):
+        parser.add_argument(
+            "--source",
+            action="append",
+            default=[],
+            help="Branch the rates are fetched from, besides the settings'",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Refresh even if the stored data is not older than the TTL",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=NCM_CONCURRENCY,
+            help="Number of requests sent to NCM at the same time",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep refreshing once the TTL expires",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=600.0,
+            help="Seconds between checks of the TTL (--watch)",
+        )
+
+    def handle(self, *args: Any, **options: Any):
+        force = options["force"]
+        while True:
+            self.refresh(options["source"], options["concurrency"], force)
+            if not options["watch"]:
+                break
+            force = False
+            time.sleep(options["interval"])
+
+    def refresh(self, sources: list[str], concurrency: int, force: bool):
+        settings, _ = Settings.objects.get_or_create(id=1)
+        if (
+            not force
+            and settings.ncm_synced_at is not None
+            and timezone.now() - settings.ncm_synced_at < NCM_CACHE_TTL
+        ):
+            return
+        if settings.delivery_ncm_from:
+            sources = [settings.delivery_ncm_from, *sources]
+        branches, rates, errors = refresh_ncm_directory(
+            settings, list(dict.fromkeys(sources)), concurrency
+        )
+        for (source, destination), error in errors.items():
+            print(f"Failed to fetch rate {source} to {destination}: {error!r}")
+        print(f"Stored {branches} NCM branch(es), {rates} rate(s).")
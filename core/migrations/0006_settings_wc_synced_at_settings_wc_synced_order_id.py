@@ -0,0 +1,23 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_rename_delivery_to_order_delivery_address_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="settings",
+            name="wc_synced_at",
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="settings",
+            name="wc_synced_order_id",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_settings_wc_synced_at_settings_wc_synced_order_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WcWebhook",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "topic",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                (
+                    "wc_order_id",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("payload", models.JSONField()),
+                (
+                    "processed_at",
+                    models.DateTimeField(blank=True, default=None, null=True),
+                ),
+                ("error", models.TextField(blank=True, default="")),
+            ],
+        ),
+        migrations.AddField(
+            model_name="settings",
+            name="wc_webhook_secret",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name="order",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("wc_order_id", ""), _negated=True),
+                fields=("medium", "wc_order_id"),
+                name="unique_wc_order",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wcwebhook",
+            index=models.Index(
+                condition=models.Q(("processed_at__isnull", True)),
+                fields=["id"],
+                name="wcwebhook_unprocessed_idx",
+            ),
+        ),
+    ]
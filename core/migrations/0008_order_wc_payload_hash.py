@@ -0,0 +1,21 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "core",
+            "0007_order_unique_wc_order_settings_wc_webhook_secret_wcwebhook",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="wc_payload_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_order_wc_payload_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("file", models.FileField(upload_to="imports/")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Queued", "Queued"),
+                            ("Running", "Running"),
+                            ("Completed", "Completed"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Queued",
+                        max_length=9,
+                    ),
+                ),
+                ("rows_read", models.PositiveIntegerField(default=0)),
+                ("rows_done", models.PositiveIntegerField(default=0)),
+                ("rows_rejected", models.PositiveIntegerField(default=0)),
+                ("rows_per_second", models.FloatField(default=0)),
+                (
+                    "started_at",
+                    models.DateTimeField(blank=True, default=None, null=True),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(blank=True, default=None, null=True),
+                ),
+                ("error", models.TextField(blank=True, default="")),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
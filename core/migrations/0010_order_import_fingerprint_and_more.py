@@ -0,0 +1,26 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_importjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="import_fingerprint",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name="order",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("import_fingerprint", ""), _negated=True),
+                fields=("import_fingerprint",),
+                name="unique_import_fingerprint",
+            ),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_order_import_fingerprint_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="ncm_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("Queued", "Queued"),
+                    ("Sending", "Sending"),
+                    ("Sent", "Sent"),
+                    ("Failed", "Failed"),
+                ],
+                default="",
+                max_length=7,
+            ),
+        ),
+        migrations.CreateModel(
+            name="NCMDispatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Queued", "Queued"),
+                            ("Sending", "Sending"),
+                            ("Sent", "Sent"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Queued",
+                        max_length=7,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "attempted_at",
+                    models.DateTimeField(blank=True, default=None, null=True),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(blank=True, default=None, null=True),
+                ),
+                ("error", models.TextField(blank=True, default="")),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="ncm_dispatches",
+                        to="core.order",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "NCM dispatch",
+                "verbose_name_plural": "NCM dispatches",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "Queued")),
+                        fields=["next_attempt_at"],
+                        name="ncmdispatch_queued_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ncmdispatch",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["Queued", "Sending"])),
+                fields=("order",),
+                name="unique_ncm_dispatch_in_flight",
+            ),
+        ),
+    ]
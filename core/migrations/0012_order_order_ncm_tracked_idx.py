@@ -0,0 +1,27 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_order_ncm_status_ncmdispatch_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(
+                    ("ncm_order_id__isnull", False),
+                    (
+                        "status__in",
+                        ["Pending", "Processed", "On Hold", "Shipped"],
+                    ),
+                ),
+                fields=["id"],
+                name="order_ncm_tracked_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:57
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_order_order_ncm_tracked_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NCMBranch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("name", models.CharField(max_length=255, unique=True)),
+                (
+                    "code",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                (
+                    "district_name",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                (
+                    "phone",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+            ],
+            options={
+                "verbose_name": "NCM branch",
+                "verbose_name_plural": "NCM branches",
+            },
+        ),
+        migrations.CreateModel(
+            name="NCMRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("source", models.CharField(max_length=255)),
+                ("destination", models.CharField(max_length=255)),
+                (
+                    "charge",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("5000.00"),
+                        max_digits=10,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "NCM rate",
+            },
+        ),
+        migrations.AddField(
+            model_name="settings",
+            name="ncm_synced_at",
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="ncmrate",
+            constraint=models.UniqueConstraint(
+                fields=("source", "destination"), name="unique_ncm_rate"
+            ),
+        ),
+    ]
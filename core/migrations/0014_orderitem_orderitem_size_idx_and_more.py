@@ -0,0 +1,21 @@
+# Generated by Django 5.0.8 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_ncmbranch_ncmrate_settings_ncm_synced_at_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="orderitem",
+            index=models.Index(fields=["size"], name="orderitem_size_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="orderitem",
+            index=models.Index(fields=["color"], name="orderitem_color_idx"),
+        ),
+    ]
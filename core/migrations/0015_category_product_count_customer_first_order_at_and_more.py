@@ -0,0 +1,119 @@
+# Generated by Django 5.0.8 on 2026-10-18 18:01
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_orderitem_orderitem_size_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="product_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="first_order_at",
+            field=models.DateTimeField(
+                blank=True, default=None, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="last_order_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                default=None,
+                editable=False,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="order_count",
+            field=models.PositiveIntegerField(
+                db_index=True, default=0, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="order_item_count",
+            field=models.PositiveIntegerField(
+                db_index=True, default=0, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="total_paid",
+            field=models.DecimalField(
+                db_index=True,
+                decimal_places=2,
+                default=Decimal("0.00"),
+                editable=False,
+                max_digits=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="units_sold",
+            field=models.PositiveIntegerField(
+                db_index=True, default=0, editable=False
+            ),
+        ),
+        # fill the counters of the existing rows, see recompute_counters
+        migrations.RunSQL(
+            """
+            UPDATE core_customer c
+            SET order_count = o.order_count,
+                first_order_at = o.first_order_at,
+                last_order_at = o.last_order_at
+            FROM (
+                SELECT customer_id,
+                       count(*) AS order_count,
+                       min(ordered_at) AS first_order_at,
+                       max(ordered_at) AS last_order_at
+                FROM core_order GROUP BY customer_id
+            ) o
+            WHERE o.customer_id = c.id;
+            UPDATE core_customer c
+            SET order_item_count = i.order_item_count
+            FROM (
+                SELECT o.customer_id, count(*) AS order_item_count
+                FROM core_orderitem oi
+                JOIN core_order o ON o.id = oi.order_id
+                GROUP BY o.customer_id
+            ) i
+            WHERE i.customer_id = c.id;
+            UPDATE core_customer c
+            SET total_paid = p.total_paid
+            FROM (
+                SELECT o.customer_id, sum(pi.amount) AS total_paid
+                FROM core_paymentitem pi
+                JOIN core_order o ON o.id = pi.order_id
+                GROUP BY o.customer_id
+            ) p
+            WHERE p.customer_id = c.id;
+            UPDATE core_product p
+            SET units_sold = i.units_sold
+            FROM (
+                SELECT product_id, sum(quantity) AS units_sold
+                FROM core_orderitem GROUP BY product_id
+            ) i
+            WHERE i.product_id = p.id;
+            UPDATE core_category c
+            SET product_count = p.product_count
+            FROM (
+                SELECT category_id, count(*) AS product_count
+                FROM core_product GROUP BY category_id
+            ) p
+            WHERE p.category_id = c.id;
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.0.8 on 2026-10-18 18:06
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "core",
+            "0015_category_product_count_customer_first_order_at_and_more",
+        ),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddField(
+            model_name="customer",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        # the document is written by the database, so the bulk_create and
+        # COPY paths of fetch_wc and the csv importer keep it up to date
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION core_customer_search_vector() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('simple', NEW.full_name), 'A')
+                    || setweight(to_tsvector('simple', NEW.insta_handle), 'A')
+                    || setweight(to_tsvector('simple', concat_ws(
+                        ' ', NEW.phone, NEW.phone2, NEW.phone3, NEW.email
+                    )), 'B')
+                    || setweight(to_tsvector('simple', NEW.address), 'C');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+            CREATE TRIGGER core_customer_search_vector
+            BEFORE INSERT OR UPDATE OF
+                full_name, insta_handle, phone, phone2, phone3, email, address
+            ON core_customer
+            FOR EACH ROW EXECUTE FUNCTION core_customer_search_vector();
+            UPDATE core_customer SET full_name = full_name;
+            """,
+            """
+            DROP TRIGGER core_customer_search_vector ON core_customer;
+            DROP FUNCTION core_customer_search_vector();
+            """,
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="customer_search_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("full_name"),
+                    name="gin_trgm_ops",
+                ),
+                name="customer_full_name_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("phone"),
+                    name="gin_trgm_ops",
+                ),
+                name="customer_phone_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("insta_handle"),
+                    name="gin_trgm_ops",
+                ),
+                name="customer_insta_handle_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("address"),
+                    name="gin_trgm_ops",
+                ),
+                name="customer_address_trgm_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.8 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_customer_search"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="ncm_order_id",
+            field=models.PositiveIntegerField(
+                blank=True, db_index=True, default=None, null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="wc_order_key",
+            field=models.CharField(
+                blank=True, db_index=True, default="", max_length=255
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.8 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0017_exact_search_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="phone2_e164",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=16,
+            ),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="phone3_e164",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=16,
+            ),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="phone_e164",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=16,
+            ),
+        ),
+    ]
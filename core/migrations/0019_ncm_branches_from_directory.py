@@ -0,0 +1,34 @@
+# Generated by Django 5.0.8 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0018_customer_e164_phones"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="delivery_ncm_from",
+            field=models.CharField(
+                blank=True, default="POKHARA", max_length=255
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="delivery_ncm_to",
+            field=models.CharField(
+                blank=True, default="POKHARA", max_length=255
+            ),
+        ),
+        migrations.AlterField(
+            model_name="settings",
+            name="delivery_ncm_from",
+            field=models.CharField(
+                blank=True, default="POKHARA", max_length=255
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.8 on 2026-10-18 18:35
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0019_ncm_branches_from_directory"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("phone2"),
+                    name="gin_trgm_ops",
+                ),
+                name="customer_phone2_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("email"),
+                    name="gin_trgm_ops",
+                ),
+                name="customer_email_trgm_idx",
+            ),
+        ),
+    ]
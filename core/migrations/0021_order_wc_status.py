@@ -0,0 +1,23 @@
+# Generated by Django 5.0.8 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0020_customer_email_phone2_trgm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="wc_modified_at",
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="wc_status",
+            field=models.CharField(blank=True, default="", max_length=20),
+        ),
+    ]
@@ -2,7 +2,11 @@ from decimal import Decimal
 from functools import partial
 from typing import Any
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.indexes import OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils import timezone
 
 
@@ -43,6 +47,15 @@ class StatusChoices(models.TextChoices):
     DRAFT = "Draft"
 
 
+# statuses of shipped orders still followed on ncm, see poll_ncm_status
+NCM_TRACKED_STATUSES = [
+    StatusChoices.PENDING,
+    StatusChoices.PROCESSED,
+    StatusChoices.ONHOLD,
+    StatusChoices.SHIPPED,
+]
+
+
 class DeliveryMethodChoices(models.TextChoices):
     NCM = "NCM"
     ARAMEX = "Aramex"
@@ -73,6 +86,20 @@ class LogoVariationChoices(models.TextChoices):
     BERSERK = "Berserk"
 
 
+class ImportStatusChoices(models.TextChoices):
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    COMPLETED = "Completed"
+    FAILED = "Failed"
+
+
+class NCMStatusChoices(models.TextChoices):
+    QUEUED = "Queued"
+    SENDING = "Sending"
+    SENT = "Sent"
+    FAILED = "Failed"
+
+
 class NCMBranchChoices(models.TextChoices):
     AMARDAHA = "AMARDAHA"
     AMARGADHI = "AMARGADHI"
@@ -401,9 +428,16 @@ class Settings(models.Model):
     ncm_key = models.CharField(
         max_length=40, default="009d25035b2da1b4533b0f2cbfe1877d510aaa7e"
     )
-    delivery_ncm_from = OptionalCharField(
-        default=NCMBranchChoices.POKHARA, choices=NCMBranchChoices
-    )
+    # ncm branch, validated against the branches of refresh_ncm
+    delivery_ncm_from = OptionalCharField(default=NCMBranchChoices.POKHARA)
+    # woocommerce sync cursor, (date_modified_gmt, id) of the last order
+    # fetched by fetch_wc, next run only requests orders modified after it
+    wc_synced_at = OptionalDateTimeField()
+    wc_synced_order_id = models.PositiveIntegerField(default=0)
+    # secret of the woocommerce order webhooks, used to verify signatures
+    wc_webhook_secret = OptionalCharField()
+    # last refresh of the ncm branches and rates, see refresh_ncm
+    ncm_synced_at = OptionalDateTimeField()
 
     class Meta:
         verbose_name_plural = "Settings"
@@ -457,8 +491,62 @@ class Customer(TimestampedModel):
     phone = models.CharField(max_length=15, unique=True)
     phone2 = OptionalCharField(max_length=15)
     phone3 = OptionalCharField(max_length=15)
+    # E.164 form of the phones, set by core.phones, see backfill_phones
+    phone_e164 = OptionalCharField(
+        max_length=16, editable=False, db_index=True
+    )
+    phone2_e164 = OptionalCharField(
+        max_length=16, editable=False, db_index=True
+    )
+    phone3_e164 = OptionalCharField(
+        max_length=16, editable=False, db_index=True
+    )
     # Home Address of the customer, may not be the Shipping Address
     address = OptionalCharField()
+    # counters kept up to date by core.counters, see recompute_counters
+    order_count = models.PositiveIntegerField(
+        default=0, editable=False, db_index=True
+    )
+    order_item_count = models.PositiveIntegerField(
+        default=0, editable=False, db_index=True
+    )
+    total_paid = AmountField(
+        default=Decimal("0.00"), editable=False, db_index=True
+    )
+    first_order_at = OptionalDateTimeField(editable=False)
+    last_order_at = OptionalDateTimeField(editable=False, db_index=True)
+    # admin search document, written by a trigger (see migration 0016)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:  # type: ignore
+        indexes = [
+            GinIndex(fields=["search_vector"], name="customer_search_idx"),
+            # substring searches (icontains) of core.search
+            GinIndex(
+                OpClass(Upper("full_name"), name="gin_trgm_ops"),
+                name="customer_full_name_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("phone"), name="gin_trgm_ops"),
+                name="customer_phone_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("phone2"), name="gin_trgm_ops"),
+                name="customer_phone2_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("insta_handle"), name="gin_trgm_ops"),
+                name="customer_insta_handle_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("email"), name="gin_trgm_ops"),
+                name="customer_email_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("address"), name="gin_trgm_ops"),
+                name="customer_address_trgm_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -468,6 +556,8 @@ class Category(TimestampedModel):
     title = models.CharField(max_length=255, unique=True)
     description = OptionalTextField()
     image_url = OptionalURLField()
+    # kept up to date by core.counters
+    product_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:  # type: ignore
         verbose_name_plural = "Categories"
@@ -504,6 +594,10 @@ class Product(TimestampedModel):
     # current stock number, 0 = out of stock
     stock = models.PositiveSmallIntegerField(default=0)
     price = AmountField(default=Decimal("0.00"))
+    # quantity of the order items, kept up to date by core.counters
+    units_sold = models.PositiveIntegerField(
+        default=0, editable=False, db_index=True
+    )
 
     def __str__(self):
         return self.title
@@ -513,10 +607,19 @@ class Order(TimestampedModel):
     # woocommerce order key (wc_order_fdqKhqbFYwilB)
     wc_order_id = OptionalCharField()
     # woocommerce order id (Woocommerce) if any
-    wc_order_key = OptionalCharField()
+    wc_order_key = OptionalCharField(db_index=True)
+    # hash of the last synced woocommerce payload, see core.wc
+    wc_payload_hash = OptionalCharField(max_length=64)
+    # woocommerce status (processing) and date_modified_gmt of that payload
+    wc_status = OptionalCharField(max_length=20)
+    wc_modified_at = OptionalDateTimeField()
+    # hash of the csv row the order was imported from, see core.importer
+    import_fingerprint = OptionalCharField(max_length=64)
     ncm_order_id = models.PositiveIntegerField(
-        default=None, blank=True, null=True
+        default=None, blank=True, null=True, db_index=True
     )
+    # state of the last ncm dispatch, empty if the order was never queued
+    ncm_status = OptionalCharField(max_length=7, choices=NCMStatusChoices)
     customer = models.ForeignKey(
         Customer, on_delete=models.PROTECT, related_name="orders"
     )
@@ -546,12 +649,9 @@ class Order(TimestampedModel):
     # customer notes for order, can be same as delivery_note
     customer_note = OptionalTextField()
     # delivery to/from addresses
-    delivery_ncm_from = OptionalCharField(
-        default=NCMBranchChoices.POKHARA, choices=NCMBranchChoices
-    )
-    delivery_ncm_to = OptionalCharField(
-        default=NCMBranchChoices.POKHARA, choices=NCMBranchChoices
-    )
+    # ncm branches, validated against the branches of refresh_ncm
+    delivery_ncm_from = OptionalCharField(default=NCMBranchChoices.POKHARA)
+    delivery_ncm_to = OptionalCharField(default=NCMBranchChoices.POKHARA)
     delivery_address = models.CharField(max_length=255)
     delivery_method = models.CharField(
         max_length=7,
@@ -569,6 +669,33 @@ class Order(TimestampedModel):
     delivered_at = OptionalDateTimeField()
     paid_at = OptionalDateTimeField()  # full payment
 
+    class Meta:  # type: ignore
+        constraints = [
+            # a woocommerce order is imported once, by fetch_wc or webhook
+            models.UniqueConstraint(
+                fields=["medium", "wc_order_id"],
+                condition=~models.Q(wc_order_id=""),
+                name="unique_wc_order",
+            ),
+            # a csv row is imported once, re-uploads skip it
+            models.UniqueConstraint(
+                fields=["import_fingerprint"],
+                condition=~models.Q(import_fingerprint=""),
+                name="unique_import_fingerprint",
+            ),
+        ]
+        indexes = [
+            # orders polled by poll_ncm_status, delivered ones drop out
+            models.Index(
+                fields=["id"],
+                condition=models.Q(
+                    ncm_order_id__isnull=False,
+                    status__in=NCM_TRACKED_STATUSES,
+                ),
+                name="order_ncm_tracked_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Order #{self.id}"  # type:ignore
 
@@ -628,5 +755,135 @@ class OrderItem(TimestampedModel):
     # remarks, eg. 'defect, product exchanged'
     dispute_remarks = OptionalCharField()
 
+    class Meta:  # type: ignore
+        indexes = [
+            # sold counts of the size and color changelists
+            models.Index(fields=["size"], name="orderitem_size_idx"),
+            models.Index(fields=["color"], name="orderitem_color_idx"),
+        ]
+
     def __str__(self):
         return f"OrderItem #{self.id}"  # type:ignore
+
+
+class WcWebhook(TimestampedModel):
+    # raw woocommerce webhook deliveries, processed by process_wc_inbox
+    # X-WC-Webhook-Topic, eg. order.created
+    topic = OptionalCharField()
+    wc_order_id = OptionalCharField()
+    payload = models.JSONField()
+    processed_at = OptionalDateTimeField()
+    # validation or processing error, if any
+    error = OptionalTextField()
+
+    class Meta:  # type: ignore
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="wcwebhook_unprocessed_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"WcWebhook #{self.id}"  # type:ignore
+
+
+class ImportJob(TimestampedModel):
+    # csv export of the old system, imported by process_import_jobs
+    file = models.FileField(upload_to="imports/")
+    status = models.CharField(
+        max_length=9,
+        choices=ImportStatusChoices.choices,
+        default=ImportStatusChoices.QUEUED,
+    )
+    # checkpoint, rows of the file already imported or rejected
+    rows_read = models.PositiveIntegerField(default=0)
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_rejected = models.PositiveIntegerField(default=0)
+    rows_per_second = models.FloatField(default=0)
+    started_at = OptionalDateTimeField()
+    finished_at = OptionalDateTimeField()
+    error = OptionalTextField()
+
+    def __str__(self):
+        return f"ImportJob #{self.id}"  # type:ignore
+
+
+class NCMDispatch(TimestampedModel):
+    # ncm order creations queued by the admin, sent by process_ncm_dispatches
+    order = models.ForeignKey(
+        Order, on_delete=models.PROTECT, related_name="ncm_dispatches"
+    )
+    status = models.CharField(
+        max_length=7,
+        choices=NCMStatusChoices.choices,
+        default=NCMStatusChoices.QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # queued dispatches are not sent before then, see retries
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # start of the last attempt
+    attempted_at = OptionalDateTimeField()
+    sent_at = OptionalDateTimeField()
+    error = OptionalTextField()
+
+    class Meta:  # type: ignore
+        verbose_name = "NCM dispatch"
+        verbose_name_plural = "NCM dispatches"
+        constraints = [
+            # an order is in flight once, so it is never booked twice
+            models.UniqueConstraint(
+                fields=["order"],
+                condition=models.Q(
+                    status__in=[
+                        NCMStatusChoices.QUEUED,
+                        NCMStatusChoices.SENDING,
+                    ]
+                ),
+                name="unique_ncm_dispatch_in_flight",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status=NCMStatusChoices.QUEUED),
+                name="ncmdispatch_queued_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"NCMDispatch #{self.id}"  # type:ignore
+
+
+class NCMBranch(TimestampedModel):
+    # branches served by ncm, refreshed by refresh_ncm
+    name = models.CharField(max_length=255, unique=True)
+    code = OptionalCharField()
+    district_name = OptionalCharField()
+    phone = OptionalCharField()
+
+    class Meta:  # type: ignore
+        verbose_name = "NCM branch"
+        verbose_name_plural = "NCM branches"
+
+    def __str__(self):
+        return self.name
+
+
+class NCMRate(TimestampedModel):
+    # ncm delivery charge from a branch to another, refreshed by refresh_ncm
+    source = models.CharField(max_length=255)
+    destination = models.CharField(max_length=255)
+    charge = AmountField()
+
+    class Meta:  # type: ignore
+        verbose_name = "NCM rate"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "destination"], name="unique_ncm_rate"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.source} to {self.destination}"
@@ -0,0 +1,321 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any
+
+import httpx
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import models
+from core.http import RateLimit
+from core.http import RetryTransport
+from core.http import is_refused
+from core.models import NCMBranchChoices
+from core.models import Settings
+from core.models import StatusChoices
+
+# requests per second sent to nepal can move
+NCM_RATE = 5.0
+# requests sent at the same time
+NCM_CONCURRENCY = 4
+# ncm delivery statuses: order status they move the order to, the others
+# (Pickup Order Created, Sent for Pickup...) do not change it
+NCM_STATUSES = {
+    "Pickup Complete": StatusChoices.SHIPPED,
+    "Drop off Order Collected": StatusChoices.SHIPPED,
+    "Dispatched": StatusChoices.SHIPPED,
+    "Arrived": StatusChoices.SHIPPED,
+    "Sent for Delivery": StatusChoices.SHIPPED,
+    "Delivered": StatusChoices.DELIVERED,
+    "Returned": StatusChoices.FAILED,
+    "Cancelled": StatusChoices.CANCELED,
+}
+# age of the stored branches and rates before refresh_ncm fetches them again
+NCM_CACHE_TTL = timedelta(days=1)
+# seconds the branches and rates are kept in memory before being read again
+NCM_DIRECTORY_RELOAD = 300.0
+
+# (loaded at, branch names, (source, destination): charge)
+_directory: tuple[float, frozenset[str], dict[tuple[str, str], Decimal]]
+_directory = (0.0, frozenset(), {})
+_directory_lock = threading.Lock()
+
+
+def get_ncm_client(settings: Settings, concurrency: int = NCM_CONCURRENCY):
+    transport = httpx.HTTPTransport(
+        limits=httpx.Limits(
+            max_connections=concurrency,
+            max_keepalive_connections=concurrency,
+        )
+    )
+    limit = RateLimit(NCM_RATE, burst=concurrency, max_concurrency=concurrency)
+    return httpx.Client(
+        base_url=f"{settings.ncm_url}/api/v1",
+        headers={"Authorization": f"Token {settings.ncm_key}"},
+        timeout=httpx.Timeout(30.0, connect=10.0),
+        transport=RetryTransport(limit, transport),
+    )
+
+
+def get_ncm_order_data(order: models.Order) -> dict[str, Any]:
+    return {
+        "name": order.customer.full_name,
+        "phone": order.customer.phone,
+        "phone2": order.customer.phone2,
+        "cod_charge": order.total_price if order.is_paid else Decimal("0.00"),
+        "address": order.delivery_address,
+        "fbranch": order.delivery_ncm_from,
+        "branch": order.delivery_ncm_to,
+    }
+
+
+def is_unsent_error(error: Exception) -> bool:
+    """Whether NCM surely did not create the order of the failed request
+
+    Other errors may come after the order was created, sending it again
+    could book the shipment twice.
+    """
+    if isinstance(error, httpx.ConnectError | httpx.ConnectTimeout):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and is_refused(
+        error.response
+    )
+
+
+def create_ncm_orders(
+    settings: Settings,
+    orders: list[models.Order],
+    concurrency: int = NCM_CONCURRENCY,
+):
+    """Create the NCM orders of the orders, `concurrency` at a time
+
+    The ncm_order_id of the created orders is saved with one query.
+    Returns the created orders and the errors of the others by order id.
+    """
+    # built before sending, the threads do not touch the database
+    data = [get_ncm_order_data(o) for o in orders]
+
+    def create(order_data: dict[str, Any]) -> int:
+        res = client.post("/order/create", data=order_data)
+        res.raise_for_status()
+        return res.json()["orderid"]
+
+    created: list[models.Order] = []
+    errors: dict[int, Exception] = {}
+    with (
+        get_ncm_client(settings, concurrency) as client,
+        ThreadPoolExecutor(concurrency) as executor,
+    ):
+        futures = [executor.submit(create, d) for d in data]
+        for order, future in zip(orders, futures):
+            try:
+                order.ncm_order_id = future.result()
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                errors[order.pk] = e
+            else:
+                order.ncm_status = models.NCMStatusChoices.SENT
+                created.append(order)
+    models.Order.objects.bulk_update(created, ["ncm_order_id", "ncm_status"])
+    return created, errors
+
+
+def get_ncm_statuses(
+    settings: Settings,
+    ncm_order_ids: list[int],
+    concurrency: int = NCM_CONCURRENCY,
+):
+    """Fetch the status history of the NCM orders, `concurrency` at a time
+
+    Returns the histories and the errors of the others by NCM order id.
+    """
+
+    def fetch(ncm_order_id: int) -> list[dict[str, Any]]:
+        res = client.get("/order/status", params={"id": ncm_order_id})
+        res.raise_for_status()
+        history = res.json()
+        if not isinstance(history, list):
+            raise ValueError(f"Unexpected status response: {history}")
+        return history
+
+    histories: dict[int, list[dict[str, Any]]] = {}
+    errors: dict[int, Exception] = {}
+    with (
+        get_ncm_client(settings, concurrency) as client,
+        ThreadPoolExecutor(concurrency) as executor,
+    ):
+        futures = [executor.submit(fetch, i) for i in ncm_order_ids]
+        for ncm_order_id, future in zip(ncm_order_ids, futures):
+            try:
+                histories[ncm_order_id] = future.result()
+            except (httpx.HTTPError, ValueError) as e:
+                errors[ncm_order_id] = e
+    return histories, errors
+
+
+def get_ncm_time(value: str) -> datetime | None:
+    # local time without offset, eg. 2024-07-01 10:00:00
+    added_at = parse_datetime(value)
+    if added_at is not None and timezone.is_naive(added_at):
+        added_at = timezone.make_aware(added_at)
+    return added_at
+
+
+def apply_ncm_status(
+    order: models.Order, history: list[dict[str, Any]]
+) -> bool:
+    """Update the order from its NCM status history
+
+    The latest known status wins, shipped_at and delivered_at are set
+    once. Returns whether the order changed.
+    """
+    before = (order.status, order.shipped_at, order.delivered_at)
+    for item in sorted(history, key=lambda i: i.get("added_time") or ""):
+        status = NCM_STATUSES.get(item.get("status", ""))
+        if status is None:
+            continue
+        added_at = get_ncm_time(item.get("added_time") or "")
+        order.status = status
+        if status == StatusChoices.SHIPPED and order.shipped_at is None:
+            order.shipped_at = added_at
+        if status == StatusChoices.DELIVERED:
+            order.shipped_at = order.shipped_at or added_at
+            order.delivered_at = order.delivered_at or added_at
+    return before != (order.status, order.shipped_at, order.delivered_at)
+
+
+def get_ncm_directory():
+    """Stored NCM branch names and rates, kept in memory for a while
+
+    Returns the branch names and the charges by (source, destination).
+    """
+    global _directory
+    with _directory_lock:
+        if time.monotonic() - _directory[0] > NCM_DIRECTORY_RELOAD:
+            branches = frozenset(
+                models.NCMBranch.objects.values_list("name", flat=True)
+            )
+            rates = {
+                (source, destination): charge
+                for source, destination, charge in (
+                    models.NCMRate.objects.values_list(
+                        "source", "destination", "charge"
+                    )
+                )
+            }
+            _directory = (time.monotonic(), branches, rates)
+        return _directory[1], _directory[2]
+
+
+def clear_ncm_directory():
+    global _directory
+    with _directory_lock:
+        _directory = (0.0, frozenset(), {})
+
+
+def is_ncm_branch(name: str) -> bool:
+    branches, _ = get_ncm_directory()
+    # never refreshed, the static choices are used
+    if not branches:
+        return name in NCMBranchChoices.values
+    return name in branches
+
+
+def get_ncm_branches() -> list[str]:
+    branches, _ = get_ncm_directory()
+    # never refreshed, the static choices are used
+    return sorted(branches or NCMBranchChoices.values)
+
+
+def get_ncm_branch_label(name: str) -> str:
+    # POKHARA -> Pokhara, names that are not branches are shown as they are
+    return name.title() if is_ncm_branch(name) else name
+
+
+def get_ncm_charge(source: str, destination: str) -> Decimal | None:
+    _, rates = get_ncm_directory()
+    return rates.get((source, destination))
+
+
+def refresh_ncm_directory(
+    settings: Settings,
+    sources: list[str],
+    concurrency: int = NCM_CONCURRENCY,
+):
+    """Store the NCM branches and the rates from the sources to them
+
+    The rates of a pair that failed to fetch are kept as they were.
+    Returns the number of branches, rates and the errors by pair.
+    """
+
+    def fetch_charge(pair: tuple[str, str]) -> Decimal:
+        res = client.get(
+            "/shipping-rate",
+            params={
+                "creation": pair[0],
+                "destination": pair[1],
+                "type": "Pickup/Collect",
+            },
+        )
+        res.raise_for_status()
+        return Decimal(str(res.json()["charge"]))
+
+    rates: list[models.NCMRate] = []
+    errors: dict[tuple[str, str], Exception] = {}
+    with (
+        get_ncm_client(settings, concurrency) as client,
+        ThreadPoolExecutor(concurrency) as executor,
+    ):
+        res = client.get("/branchlist")
+        res.raise_for_status()
+        branches = [
+            models.NCMBranch(
+                name=b["name"],
+                code=b.get("code") or "",
+                district_name=b.get("district_name") or "",
+                phone=b.get("phone") or "",
+            )
+            for b in res.json()
+        ]
+        names = [b.name for b in branches]
+        pairs = [(s, d) for s in sources for d in names]
+        futures = [executor.submit(fetch_charge, p) for p in pairs]
+        for pair, future in zip(pairs, futures):
+            try:
+                charge = future.result()
+            except (
+                httpx.HTTPError,
+                KeyError,
+                ValueError,
+                ArithmeticError,
+            ) as e:
+                errors[pair] = e
+            else:
+                rates.append(
+                    models.NCMRate(
+                        source=pair[0], destination=pair[1], charge=charge
+                    )
+                )
+    with transaction.atomic():
+        models.NCMBranch.objects.bulk_create(
+            branches,
+            update_conflicts=True,
+            unique_fields=["name"],
+            update_fields=["code", "district_name", "phone", "updated_at"],
+        )
+        models.NCMBranch.objects.exclude(name__in=names).delete()
+        models.NCMRate.objects.bulk_create(
+            rates,
+            update_conflicts=True,
+            unique_fields=["source", "destination"],
+            update_fields=["charge", "updated_at"],
+        )
+        models.NCMRate.objects.exclude(destination__in=names).delete()
+        settings.ncm_synced_at = timezone.now()
+        settings.save(update_fields=["ncm_synced_at"])
+    clear_ncm_directory()
+    return len(branches), len(rates), errors
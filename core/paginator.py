@@ -0,0 +1,92 @@
+import json
+from typing import Any
+
+from django.core.paginator import EmptyPage
+from django.core.paginator import Page
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+# row counts from which the planner's estimate is used instead of COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def get_table_count(queryset: QuerySet[Any]) -> int | None:
+    """Number of rows of the queryset's table, from pg_class.reltuples
+
+    None until the table is first vacuumed or analyzed.
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def get_estimated_count(queryset: QuerySet[Any]) -> int:
+    # row estimate of the queryset's plan
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]  # type: ignore
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator[Any]):
+    """Paginator that does not count large querysets
+
+    Whole tables above ESTIMATED_COUNT_THRESHOLD rows are counted from
+    pg_class. Filtered querysets are counted exactly but stop at the
+    threshold, above it the count is the planner's estimate. Used with
+    show_full_result_count = False, the admin changelists of large
+    tables then run no COUNT(*) over the whole table.
+
+    An estimate can be too high, the pages past the last row are then
+    the last page that has rows.
+    """
+
+    threshold = ESTIMATED_COUNT_THRESHOLD
+
+    @cached_property
+    def count(self) -> int:  # type: ignore
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        queryset: QuerySet[Any] = self.object_list
+        if not queryset.query.where and not queryset.query.distinct:
+            count = get_table_count(queryset)
+            if count is not None and count >= self.threshold:
+                return count
+        # plan estimates of searches and filters can be far off, so they
+        # are only used when there are too many rows to count
+        count = queryset[: self.threshold].count()
+        if count < self.threshold:
+            return count
+        return max(get_estimated_count(queryset), count)
+
+    def validate_number(self, number: Any) -> int:
+        # out of range pages are clamped instead of raising EmptyPage
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            return max(1, min(int(number), self.num_pages))
+
+    def page(self, number: Any) -> Page[Any]:
+        page = super().page(number)
+        if page.number == 1 or not isinstance(self.object_list, QuerySet):
+            return page
+        if page.object_list:
+            return page
+        # past the last row of an estimate, the exact count replaces it
+        queryset: QuerySet[Any] = self.object_list
+        self.__dict__["count"] = queryset.count()
+        self.__dict__.pop("num_pages", None)
+        return super().page(self.num_pages)
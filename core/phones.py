@@ -0,0 +1,98 @@
+import re
+from collections.abc import Iterable
+from typing import Any
+
+from django.db.models import Q
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from core import models
+
+# phone numbers are matched on their E.164 form (+9779812345678), which
+# is stored next to each of the three phones of a customer. the raw phone
+# stays as it was entered, it is what ncm and the admin show. signals
+# cover single saves, the bulk paths (fetch_wc, the csv importer) and
+# backfill_phones set the numbers themselves
+
+# numbers without a country code are nepali
+COUNTRY_CODE = "977"
+# digits of an E.164 number, country code included
+E164_MAX_DIGITS = 15
+# digits of a nepali number without its country code (98XXXXXXXX)
+NATIONAL_MAX_DIGITS = 10
+
+
+def normalize_phone(value: str) -> str:
+    """E.164 form of a phone number, empty if it has no digits
+
+    +977 98-1234-5678, 009779812345678, 9779812345678 and 9812345678 are
+    all +9779812345678. A leading 0 of a national number is dropped.
+    """
+    digits = re.sub(r"\D", "", value)
+    if not digits:
+        return ""
+    if value.lstrip().startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif not (
+        digits.startswith(COUNTRY_CODE) and len(digits) > NATIONAL_MAX_DIGITS
+    ):
+        digits = COUNTRY_CODE + digits.lstrip("0")
+    return "+" + digits[:E164_MAX_DIGITS]
+
+
+def set_e164_phones(customer: models.Customer):
+    customer.phone_e164 = normalize_phone(customer.phone)
+    customer.phone2_e164 = normalize_phone(customer.phone2)
+    customer.phone3_e164 = normalize_phone(customer.phone3)
+
+
+def get_phone_q(numbers: Iterable[str], prefix: str = "") -> Q:
+    """Customers with any of the E.164 numbers as one of their phones
+
+    Each phone has its own index, the OR is a bitmap OR of three probes.
+    """
+    numbers = list(numbers)
+    return (
+        Q(**{f"{prefix}phone_e164__in": numbers})
+        | Q(**{f"{prefix}phone2_e164__in": numbers})
+        | Q(**{f"{prefix}phone3_e164__in": numbers})
+    )
+
+
+def get_phone_customers(
+    phones: Iterable[str],
+) -> dict[str, models.Customer]:
+    """Existing customers of the phones, by phone
+
+    A number that is the primary phone of a customer goes to it, then to
+    the customer having it as phone2 or phone3. The oldest customer wins
+    among duplicates.
+    """
+    numbers = {phone: normalize_phone(phone) for phone in phones}
+    customers = list(
+        models.Customer.objects.filter(
+            get_phone_q(set(numbers.values()) - {""})
+        )
+        .only("phone", "phone_e164", "phone2_e164", "phone3_e164")
+        .order_by("-pk")
+    )
+    by_number: dict[str, models.Customer] = {}
+    # later assignments win: secondary phones first, newest first
+    for customer in customers:
+        by_number[customer.phone3_e164] = customer
+        by_number[customer.phone2_e164] = customer
+    for customer in customers:
+        by_number[customer.phone_e164] = customer
+    by_number.pop("", None)
+    return {
+        phone: by_number[number]
+        for phone, number in numbers.items()
+        if number in by_number
+    }
+
+
+@receiver(pre_save, sender=models.Customer)
+def normalize_customer_phones(instance: models.Customer, **kwargs: Any):
+    set_e164_phones(instance)
@@ -0,0 +1,194 @@
+import re
+from typing import Any
+
+from django.contrib.admin.views.main import ORDER_VAR
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.postgres.search import SearchQuery
+from django.contrib.postgres.search import SearchRank
+from django.db.models import F
+from django.db.models import Q
+from django.db.models import QuerySet
+from django.http import HttpRequest
+
+from core import models
+from core.phones import get_phone_q
+from core.phones import normalize_phone
+
+# customer columns matched by substring, each has a trigram index on its
+# upper case value, which is what icontains compares
+CUSTOMER_TRIGRAM_FIELDS = (
+    "full_name",
+    "phone",
+    "phone2",
+    "insta_handle",
+    "email",
+    "address",
+)
+
+# search terms looked up exactly, see get_exact_q
+# nepali mobile number, with or without the country code, or any number
+# with a + country code
+PHONE_RE = re.compile(r"(?:00)?(?:977-?)?9\d{9}|\+[\d-]{8,}")
+# country code typed apart from the number, eg. +977 9812345678
+COUNTRY_CODE_RE = re.compile(r"(\+?977)[\s-]+(?=9\d{9}\b)")
+# order id as displayed by the admin, eg. #123
+ORDER_ID_RE = re.compile(r"#(\d{1,18})")
+# woocommerce order key, eg. wc_order_fdqKhqbFYwilB
+ORDER_KEY_RE = re.compile(r"wc_order_\w+")
+# order, woocommerce or ncm order id, larger numbers do not fit a bigint
+NUMBER_RE = re.compile(r"\d{1,18}")
+# numbers from which a term is also searched as part of a phone, trigram
+# indexes need three characters
+PHONE_PART_MIN_LENGTH = 3
+# ncm_order_id is an integer column
+MAX_NCM_ORDER_ID = 2**31 - 1
+
+
+def get_search_query(term: str) -> SearchQuery:
+    return SearchQuery(term, config="simple", search_type="websearch")
+
+
+def get_order_q(term: str) -> Q | None:
+    """Orders an exact search term points to, None for other terms
+
+    Every lookup is an equality on an indexed order column.
+    """
+    if match := ORDER_ID_RE.fullmatch(term):
+        return Q(pk=int(match[1]))
+    if ORDER_KEY_RE.fullmatch(term):
+        return Q(wc_order_key=term)
+    if NUMBER_RE.fullmatch(term):
+        number = int(term)
+        q = Q(pk=number) | Q(
+            medium=models.MediumChoices.WEBSITE, wc_order_id=term
+        )
+        if number <= MAX_NCM_ORDER_ID:
+            q |= Q(ncm_order_id=number)
+        return q
+    return None
+
+
+def get_customer_q(term: str) -> Q:
+    # the term as a word of the search document, or part of a column
+    q = Q(search_vector=get_search_query(term))
+    for field in CUSTOMER_TRIGRAM_FIELDS:
+        q |= Q(**{f"{field}__icontains": term})
+    return q
+
+
+def search_customers(terms: list[str]) -> QuerySet[models.Customer]:
+    """Customers matching every term, see get_customer_q
+
+    Each term may match a different column, "ram pokhara" finds Ram of
+    Pokhara, and a partial word (pokh) is still found by its trigrams.
+    """
+    q = Q()
+    for term in terms:
+        q &= get_customer_q(term)
+    return models.Customer.objects.filter(q)
+
+
+class SearchChangeList(ChangeList):
+    def get_ordering(self, request: HttpRequest, queryset: QuerySet[Any]):
+        ordering = super().get_ordering(request, queryset)
+        # best matches first, unless a column was sorted
+        if (
+            "search_rank" in queryset.query.annotations
+            and ORDER_VAR not in self.params
+        ):
+            return ["-search_rank", *ordering]
+        return ordering
+
+
+class CustomerSearchMixin:
+    """Admin search routed by the shape of each term
+
+    Phones, order ids, order keys and other numbers are looked up
+    exactly on indexed columns, the remaining free text is searched in
+    the customer search document and ranked. Replaces the OR of
+    icontains over search_fields, which scans every row.
+    """
+
+    # path from the admin's model to the customer, empty for customers
+    customer_path = "customer"
+    # path from the admin's model to the order, empty for orders, None
+    # for customers
+    order_path: str | None = "order"
+
+    def get_changelist(self, request: HttpRequest, **kwargs: Any):
+        return SearchChangeList
+
+    def get_exact_q(self, term: str) -> Q | None:
+        """Rows an exact search term points to, None for free text"""
+        if PHONE_RE.fullmatch(term):
+            customers = models.Customer.objects.filter(
+                get_phone_q([normalize_phone(term)])
+            )
+            return Q(**{f"{self.customer_path or 'pk'}__in": customers})
+        order_q = get_order_q(term)
+        if order_q is None:
+            return None
+        if self.order_path == "":
+            q = order_q
+        else:
+            # the few matching orders are fetched first, so that the OR
+            # below stays on the admin's own indexed columns
+            orders = models.Order.objects.filter(order_q)
+            if self.order_path is None:
+                q = Q(
+                    pk__in=list(orders.values_list("customer_id", flat=True))
+                )
+            else:
+                q = Q(
+                    **{
+                        f"{self.order_path}__in": list(
+                            orders.values_list("pk", flat=True)
+                        )
+                    }
+                )
+            if NUMBER_RE.fullmatch(term):
+                q |= Q(pk=int(term))
+        if NUMBER_RE.fullmatch(term) and len(term) >= PHONE_PART_MIN_LENGTH:
+            q |= self.get_phone_part_q(term)
+        return q
+
+    def get_phone_part_q(self, term: str) -> Q:
+        """Rows of the customers having the digits in a phone (5678)
+
+        phone and phone2 as entered, through their trigram indexes.
+        """
+        q = Q(phone__icontains=term) | Q(phone2__icontains=term)
+        if not self.customer_path:
+            return q
+        customer_ids = models.Customer.objects.filter(q).values_list(
+            "pk", flat=True
+        )
+        return Q(**{f"{self.customer_path}__in": list(customer_ids)})
+
+    def get_search_results(
+        self,
+        request: HttpRequest,
+        queryset: QuerySet[Any],
+        search_term: str,
+    ):
+        free_text: list[str] = []
+        search_term = COUNTRY_CODE_RE.sub(r"\1", search_term)
+        for term in search_term.split():
+            q = self.get_exact_q(term)
+            if q is None:
+                free_text.append(term)
+            else:
+                queryset = queryset.filter(q)
+        if not free_text:
+            return queryset, False
+        text = " ".join(free_text)
+        path = self.customer_path or "pk"
+        prefix = f"{self.customer_path}__" if self.customer_path else ""
+        queryset = queryset.filter(
+            **{f"{path}__in": search_customers(free_text)}
+        ).annotate(
+            search_rank=SearchRank(
+                F(f"{prefix}search_vector"), get_search_query(text)
+            )
+        )
+        return queryset, False
@@ -1,8 +1,19 @@
+from datetime import UTC
+from datetime import datetime
 from decimal import ROUND_HALF_UP
 from decimal import Decimal
+from decimal import InvalidOperation
+from typing import Annotated
 from typing import Any
+from typing import NotRequired
+from typing import cast
 
+from django.utils import timezone
+from pydantic import BeforeValidator
+from pydantic import StringConstraints
+from pydantic import TypeAdapter
 from rest_framework import serializers  # type: ignore
+from typing_extensions import TypedDict
 
 from core.models import ColorChoices
 from core.models import LogoVariationChoices
@@ -95,6 +106,122 @@ WC_NCM_MAP = {
     "NP081": NCMBranchChoices.POKHARA,
 }
 
+# pending, processing, on-hold, completed, cancelled, refunded, failed and trash
+WC_STATUS_MAP = {
+    "pending": StatusChoices.PENDING,
+    "processing": StatusChoices.PENDING,
+    "on-hold": StatusChoices.ONHOLD,
+    "completed": StatusChoices.COMPLETED,
+    "cancelled": StatusChoices.CANCELED,
+    "refunded": StatusChoices.DISPUTED,
+    "failed": StatusChoices.FAILED,
+    "trash": StatusChoices.DRAFT,
+}
+
+WC_ESEWA_PAYMENT_METHODS = ("e", "esewa", "eSewa")
+
+# line item meta_data key: (line item key, value map, default)
+WC_META_MAP: dict[str, tuple[str, dict[str, Any], Any]] = {
+    "pa_include-longsleeve": ("include_longsleeve", {"yes": True}, False),
+    "pa_size": (
+        "size",
+        {
+            "s": SizeChoices.S,
+            "m": SizeChoices.M,
+            "l": SizeChoices.L,
+            "xl": SizeChoices.XL,
+            "xxl": SizeChoices.XXL,
+            "3xl": SizeChoices.XXXL,
+            "free-size": SizeChoices.FREE,
+        },
+        SizeChoices.FREE,
+    ),
+    "pa_minimal-logo-variation": (
+        "logo_variation",
+        {
+            "rzzy": LogoVariationChoices.RZZY,
+            "attack-on-titan": LogoVariationChoices.AOT,
+            "onepiece3d2y": LogoVariationChoices.OP3D2Y,
+            "berserk": LogoVariationChoices.BERSERK,
+        },
+        LogoVariationChoices.DEFAULT,
+    ),
+    "pa_color": (
+        "color",
+        {
+            "black": ColorChoices.BLACK,
+            "white": ColorChoices.WHITE,
+        },
+        ColorChoices.BLACK,
+    ),
+}
+
+CENT = Decimal(".01")
+
+
+def normalize_status(order: dict[str, Any]):
+    # the woocommerce status is kept next to the mapped one, update_orders
+    # only applies a status that changed on woocommerce
+    order["wc_status"] = order["status"]
+    order["status"] = WC_STATUS_MAP.get(order["status"], StatusChoices.PENDING)
+
+
+def normalize_billing(value: dict[str, Any]):
+    # only add required k:v
+    new_val: dict[str, Any] = {}
+    new_val["full_name"] = value["first_name"] + " " + value["last_name"]
+    new_val["address"] = value["address_1"]
+    new_val["phone"] = value["phone"]
+    new_val["email"] = value["email"]
+    return new_val
+
+
+def normalize_shipping(value: dict[str, str]):
+    new_val: dict[str, str] = {}
+    new_val["address"] = value["address_1"]
+    new_val["phone2"] = value["phone"]
+    new_val["delivery_ncm_to"] = WC_NCM_MAP.get(value["state"], "")
+    return new_val
+
+
+def normalize_payment_method(value: str):
+    if value in WC_ESEWA_PAYMENT_METHODS:
+        return PaymentMethodChoices.ESEWA_PERSONAL
+    return PaymentMethodChoices.COD
+
+
+def normalize_line_items(value: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    new_value: list[dict[str, Any]] = []
+    for item in value:
+        new_item: dict[str, Any] = {}
+        new_item["id"] = item["id"]
+        new_item["product_id"] = item["product_id"]
+        new_item["name"] = item["name"]
+        new_item["quantity"] = item["quantity"]
+        # string or number to Decimal, 2 decimal_places
+        new_item["subtotal"] = Decimal(str(item["subtotal"])).quantize(
+            CENT, rounding=ROUND_HALF_UP
+        )
+        new_item["price"] = Decimal(str(item["total"])).quantize(
+            CENT, rounding=ROUND_HALF_UP
+        )
+        # discount is not directly given
+        new_item["discount"] = new_item["subtotal"] - new_item["price"]
+        # per unit price same as subtotal if quantity = 1
+        new_item["price_per_unit"] = new_item["subtotal"]
+        if new_item["quantity"] > 1:
+            # per unit price calculated by subtotal / quantity
+            new_item["price_per_unit"] = (
+                new_item["subtotal"] / new_item["quantity"]
+            )
+        for data in item["meta_data"]:
+            meta = WC_META_MAP.get(data["key"])
+            if meta is not None:
+                key, value_map, default = meta
+                new_item[key] = value_map.get(data["value"], default)
+        new_value.append(new_item)
+    return new_value
+
 
 class WcNewOrderSerializer(serializers.Serializer[Any]):
     """Woocommerce webhook serializer for creating order"""
@@ -102,6 +229,9 @@ class WcNewOrderSerializer(serializers.Serializer[Any]):
     id = serializers.IntegerField()
     status = serializers.CharField()
     date_created = serializers.DateTimeField()
+    date_modified_gmt = serializers.DateTimeField(
+        required=False, default_timezone=UTC
+    )
     discount_total = serializers.DecimalField(max_digits=10, decimal_places=2)
     shipping_total = serializers.DecimalField(max_digits=10, decimal_places=2)
     total = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -113,102 +243,148 @@ class WcNewOrderSerializer(serializers.Serializer[Any]):
     customer_note = serializers.CharField(required=False, allow_blank=True)
     line_items = serializers.ListField(child=serializers.DictField())
 
-    def validate_status(self, value: str):
-        # pending, processing, on-hold, completed, cancelled, refunded, failed and trash
-        status_map = {
-            "pending": StatusChoices.PENDING,
-            "processing": StatusChoices.PENDING,
-            "on-hold": StatusChoices.ONHOLD,
-            "completed": StatusChoices.COMPLETED,
-            "cancelled": StatusChoices.CANCELED,
-            "refunded": StatusChoices.DISPUTED,
-            "failed": StatusChoices.FAILED,
-            "trash": StatusChoices.DRAFT,
-        }
-        return status_map.get(value, StatusChoices.PENDING)
-
     def validate_billing(self, value: dict[str, Any]):
-        # only add required k:v
-        new_val: dict[str, Any] = {}
-        new_val["full_name"] = value["first_name"] + " " + value["last_name"]
-        new_val["address"] = value["address_1"]
-        new_val["phone"] = value["phone"]
-        new_val["email"] = value["email"]
-        return new_val
+        return normalize_billing(value)
 
     def validate_shipping(self, value: dict[str, str]):
-        new_val: dict[str, str] = {}
-        new_val["address"] = value["address_1"]
-        new_val["phone2"] = value["phone"]
-        new_val["delivery_ncm_to"] = WC_NCM_MAP.get(value["state"], "")
-        return new_val
+        return normalize_shipping(value)
 
     def validate_payment_method(self, value: str):
-        if value in ["e", "esewa", "eSewa"]:
-            return PaymentMethodChoices.ESEWA_PERSONAL
-        if value == "cod":
-            return PaymentMethodChoices.COD
-        return PaymentMethodChoices.COD
+        return normalize_payment_method(value)
 
     def validate_line_items(
         self, value: list[dict[str, Any]]
     ) -> list[dict[str, str]]:
-        new_value: list[dict[str, Any]] = []
-        for item in value:
-            new_item: dict[str, Any] = {}
-            new_item["id"] = item["id"]
-            new_item["product_id"] = item["product_id"]
-            new_item["name"] = item["name"]
-            new_item["quantity"] = item["quantity"]
-            # float to Decimal, 2 decimal_places
-            new_item["subtotal"] = Decimal(item["subtotal"]).quantize(
-                Decimal(".01"), rounding=ROUND_HALF_UP
-            )
-            new_item["price"] = Decimal(item["total"]).quantize(
-                Decimal(".01"), rounding=ROUND_HALF_UP
-            )
-            # discount is not directly given
-            new_item["discount"] = new_item["subtotal"] - new_item["price"]
-            # per unit price same as subtotal if quantity = 1
-            new_item["price_per_unit"] = new_item["subtotal"]
-            if new_item["quantity"] > 1:
-                # per unit price calculated by subtotal / quantity
-                new_item["price_per_unit"] = (
-                    new_item["subtotal"] / new_item["quantity"]
-                )
-            for data in item["meta_data"]:
-                if data["key"] == "pa_include-longsleeve":
-                    new_item["include_longsleeve"] = data["value"] == "yes"
-                elif data["key"] == "pa_size":
-                    sizes_map = {
-                        "s": SizeChoices.S,
-                        "m": SizeChoices.M,
-                        "l": SizeChoices.L,
-                        "xl": SizeChoices.XL,
-                        "xxl": SizeChoices.XXL,
-                        "3xl": SizeChoices.XXXL,
-                        "free-size": SizeChoices.FREE,
-                    }
-                    new_item["size"] = sizes_map.get(
-                        data["value"], SizeChoices.FREE
-                    )
-                elif data["key"] == "pa_minimal-logo-variation":
-                    logos_map = {
-                        "rzzy": LogoVariationChoices.RZZY,
-                        "attack-on-titan": LogoVariationChoices.AOT,
-                        "onepiece3d2y": LogoVariationChoices.OP3D2Y,
-                        "berserk": LogoVariationChoices.BERSERK,
-                    }
-                    new_item["logo_variation"] = logos_map.get(
-                        data["value"], LogoVariationChoices.DEFAULT
-                    )
-                elif data["key"] == "pa_color":
-                    colors_map = {
-                        "black": ColorChoices.BLACK,
-                        "white": ColorChoices.WHITE,
-                    }
-                    new_item["color"] = colors_map.get(
-                        data["value"], ColorChoices.BLACK
-                    )
-            new_value.append(new_item)
-        return new_value
+        return normalize_line_items(value)
+
+    def validate(self, attrs: dict[str, Any]):
+        normalize_status(attrs)
+        return attrs
+
+
+##############################################################################
+### Fast validation
+##############################################################################
+# typed payload of woocommerce orders, validated by pydantic-core in one
+# pass, the same contract as WcNewOrderSerializer. Amounts are strings in
+# the woocommerce rest api (numbers are accepted too) and parsed once.
+AMOUNT_LIMIT = Decimal(10**8)
+
+
+def parse_decimal(value: Any) -> Decimal:
+    # a string or a number, through its string
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError("A valid number is required.") from None
+    if not amount.is_finite():
+        raise ValueError("A valid number is required.")
+    return amount
+
+
+def parse_amount(value: Any) -> Decimal:
+    # DecimalField(max_digits=10, decimal_places=2)
+    amount = parse_decimal(value)
+    quantized = amount.quantize(CENT)
+    if quantized != amount:
+        raise ValueError(
+            "Ensure that there are no more than 2 decimal places."
+        )
+    if abs(quantized) >= AMOUNT_LIMIT:
+        raise ValueError(
+            "Ensure that there are no more than 10 digits in total."
+        )
+    return quantized
+
+
+Amount = Annotated[Decimal, BeforeValidator(parse_amount)]
+# line item amounts, rounded to cents by normalize_line_items
+LineItemAmount = Annotated[Decimal, BeforeValidator(parse_decimal)]
+RequiredStr = Annotated[
+    str, StringConstraints(strip_whitespace=True, min_length=1)
+]
+
+
+class WcBilling(TypedDict):
+    first_name: str
+    last_name: str
+    address_1: str
+    phone: str
+    email: str
+
+
+class WcShipping(TypedDict):
+    address_1: str
+    phone: str
+    state: str
+
+
+class WcMetaData(TypedDict):
+    key: str
+    value: Any
+
+
+class WcLineItem(TypedDict):
+    id: int
+    product_id: int
+    name: str
+    quantity: int
+    subtotal: LineItemAmount
+    total: LineItemAmount
+    meta_data: list[WcMetaData]
+
+
+class WcOrder(TypedDict):
+    id: int
+    status: RequiredStr
+    date_created: datetime
+    date_modified_gmt: NotRequired[datetime]
+    discount_total: Amount
+    shipping_total: Amount
+    total: Amount
+    customer_id: int
+    order_key: RequiredStr
+    billing: WcBilling
+    shipping: WcShipping
+    payment_method: RequiredStr
+    customer_note: NotRequired[
+        Annotated[str, StringConstraints(strip_whitespace=True)]
+    ]
+    line_items: list[WcLineItem]
+
+
+wc_orders_adapter = TypeAdapter(list[WcOrder])
+
+
+def validate_wc_orders(data: Any) -> list[dict[str, Any]]:
+    """Validate a list of woocommerce orders
+
+    Produces the same validated data as WcNewOrderSerializer(many=True),
+    several times faster. Raises pydantic.ValidationError.
+    """
+    # normalized in place below, into the serializer's data
+    orders = cast(
+        list[dict[str, Any]], wc_orders_adapter.validate_python(data)
+    )
+    tz = timezone.get_current_timezone()
+    for order in orders:
+        normalize_status(order)
+        date_created: datetime = order["date_created"]
+        if timezone.is_aware(date_created):
+            order["date_created"] = date_created.astimezone(tz)
+        else:
+            order["date_created"] = timezone.make_aware(date_created, tz)
+        if "date_modified_gmt" in order:
+            # GMT, with or without an offset
+            date_modified: datetime = order["date_modified_gmt"]
+            if timezone.is_aware(date_modified):
+                order["date_modified_gmt"] = date_modified.astimezone(UTC)
+            else:
+                order["date_modified_gmt"] = date_modified.replace(tzinfo=UTC)
+        order["billing"] = normalize_billing(order["billing"])
+        order["shipping"] = normalize_shipping(order["shipping"])
+        order["payment_method"] = normalize_payment_method(
+            order["payment_method"]
+        )
+        order["line_items"] = normalize_line_items(order["line_items"])
+    return orders
@@ -0,0 +1,40 @@
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from django.test import TestCase
+from django.test import override_settings
+
+from core import models
+from core.actions import upload_orders_csv
+
+
+class UploadOrdersCsvTest(TestCase):
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, content: bytes):
+        file = SimpleUploadedFile("orders", content)
+        request = RequestFactory().post("/", {"submit": "1", "file": file})
+        request._messages = CookieStorage(request)  # type: ignore
+        response = upload_orders_csv(request)  # type: ignore
+        return response, [str(m) for m in get_messages(request)]
+
+    @mock.patch("core.actions.find_spec", return_value=None)
+    def test_parquet_without_pyarrow(self, _):
+        response, messages = self.upload(b"PAR1\x15\x04")
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("need pyarrow", messages[0])
+        self.assertFalse(models.ImportJob.objects.exists())
+
+    @mock.patch("core.actions.find_spec", return_value=None)
+    def test_csv_without_pyarrow(self, _):
+        self.upload(b"order_number,phone\n")
+        self.assertTrue(models.ImportJob.objects.exists())
@@ -0,0 +1,152 @@
+from datetime import datetime
+from datetime import timezone
+from decimal import Decimal
+from typing import Any
+
+from django.test import TestCase
+
+from core import models
+from core.counters import refresh_category_counters
+from core.counters import refresh_customer_counters
+from core.counters import refresh_product_counters
+
+CUSTOMER_COUNTERS = (
+    "order_count",
+    "order_item_count",
+    "total_paid",
+    "first_order_at",
+    "last_order_at",
+)
+
+
+class CounterSignalsTest(TestCase):
+    def setUp(self):
+        self.category = models.Category.objects.create(title="T-shirt")
+        self.other_category = models.Category.objects.create(title="Hoodie")
+        self.product = models.Product.objects.create(
+            title="TEST-PRODUCT", category=self.category
+        )
+        self.other_product = models.Product.objects.create(
+            title="OTHER-PRODUCT", category=self.category
+        )
+        self.customer = models.Customer.objects.create(
+            full_name="Ram", phone="9812345678"
+        )
+        self.other_customer = models.Customer.objects.create(
+            full_name="Sita", phone="9812345679"
+        )
+
+    def create_order(self, day: int, **kwargs: Any) -> models.Order:
+        return models.Order.objects.create(
+            customer=kwargs.pop("customer", self.customer),
+            subtotal_price=Decimal("1000.00"),
+            total_price=Decimal("1150.00"),
+            delivery_address="Lakeside",
+            ordered_at=datetime(2024, 6, day, tzinfo=timezone.utc),
+            **kwargs,
+        )
+
+    def create_item(self, order: models.Order, quantity: int = 1):
+        return models.OrderItem.objects.create(
+            order=order,
+            product=self.product,
+            quantity=quantity,
+            price_per_unit=Decimal("1000.00"),
+            price=Decimal("1000.00") * quantity,
+        )
+
+    def create_payment(self, order: models.Order, amount: str):
+        return models.PaymentItem.objects.create(
+            order=order, amount=Decimal(amount), is_advance=False
+        )
+
+    def get_counters(self) -> list[Any]:
+        return [
+            list(
+                models.Customer.objects.order_by("pk").values_list(
+                    *CUSTOMER_COUNTERS
+                )
+            ),
+            list(
+                models.Product.objects.order_by("pk").values_list(
+                    "units_sold", flat=True
+                )
+            ),
+            list(
+                models.Category.objects.order_by("pk").values_list(
+                    "product_count", flat=True
+                )
+            ),
+        ]
+
+    def assertCountersRecomputed(self):
+        counters = self.get_counters()
+        refresh_customer_counters(models.Customer.objects.all())
+        refresh_product_counters(models.Product.objects.all())
+        refresh_category_counters(models.Category.objects.all())
+        self.assertEqual(counters, self.get_counters())
+
+    def test_created(self):
+        order = self.create_order(10)
+        self.create_order(5)
+        self.create_item(order, quantity=2)
+        self.create_item(order)
+        self.create_payment(order, "500.00")
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.order_count, 2)
+        self.assertEqual(self.customer.order_item_count, 2)
+        self.assertEqual(self.customer.total_paid, Decimal("500.00"))
+        self.assertEqual(self.customer.first_order_at.day, 5)  # type: ignore
+        self.assertEqual(self.customer.last_order_at.day, 10)  # type: ignore
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.units_sold, 3)
+        self.assertCountersRecomputed()
+
+    def test_changed(self):
+        order = self.create_order(10)
+        other_order = self.create_order(12, customer=self.other_customer)
+        item = self.create_item(order, quantity=2)
+        payment = self.create_payment(order, "500.00")
+
+        item.quantity = 3
+        item.save()
+        payment.amount = Decimal("700.00")
+        payment.save()
+        self.assertCountersRecomputed()
+
+        item.product = self.other_product
+        item.order = other_order
+        item.save()
+        payment.order = other_order
+        payment.save()
+        self.assertCountersRecomputed()
+
+        order.ordered_at = datetime(2024, 6, 1, tzinfo=timezone.utc)
+        order.save()
+        other_order.customer = self.customer
+        other_order.save()
+        self.product.category = self.other_category
+        self.product.save()
+        self.assertCountersRecomputed()
+
+    def test_changed_deferred(self):
+        order = self.create_order(10)
+        self.create_item(order, quantity=2)
+        item = models.OrderItem.objects.only("pk").get()
+        item.quantity = 1
+        item.save()
+        self.assertCountersRecomputed()
+
+    def test_deleted(self):
+        order = self.create_order(10)
+        self.create_order(5)
+        self.create_item(order, quantity=2)
+        self.create_payment(order, "500.00")
+        models.OrderItem.objects.all().delete()
+        models.PaymentItem.objects.all().delete()
+        order.delete()
+        self.other_product.delete()
+        self.assertCountersRecomputed()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.order_count, 1)
+        self.assertEqual(self.customer.last_order_at.day, 5)  # type: ignore
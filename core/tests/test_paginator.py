@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from core import models
+from core.paginator import EstimatedCountPaginator
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    def setUp(self):
+        models.Customer.objects.bulk_create(
+            models.Customer(full_name="Ram", phone=f"98123456{i:02}")
+            for i in range(5)
+        )
+        self.queryset = models.Customer.objects.filter(
+            full_name="Ram"
+        ).order_by("pk")
+
+    def get_paginator(self, estimate: int) -> EstimatedCountPaginator:
+        paginator = EstimatedCountPaginator(self.queryset, 2)
+        paginator.threshold = 3
+        patcher = mock.patch(
+            "core.paginator.get_estimated_count", return_value=estimate
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return paginator
+
+    def test_estimate_too_high(self):
+        paginator = self.get_paginator(estimate=20)
+        self.assertEqual(paginator.num_pages, 10)
+        page = paginator.page(7)
+        self.assertEqual(page.number, 3)
+        self.assertEqual(len(page), 1)
+        self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.num_pages, 3)
+
+    def test_out_of_range(self):
+        paginator = self.get_paginator(estimate=5)
+        self.assertEqual(paginator.page(99).number, 3)
+        self.assertEqual(paginator.page(0).number, 1)
+        self.assertEqual(len(paginator.page(2)), 2)
@@ -0,0 +1,62 @@
+from typing import Any
+
+from django.contrib import admin
+from django.test import RequestFactory
+from django.test import TestCase
+
+from core import models
+
+
+class CustomerSearchTest(TestCase):
+    def setUp(self):
+        self.ram = models.Customer.objects.create(
+            full_name="Ram Sharma",
+            phone="9812345678",
+            phone2="9801234567",
+            email="ram.sharma@example.com",
+            address="Lakeside, Pokhara",
+        )
+        models.Customer.objects.create(
+            full_name="Ram Thapa", phone="9812345679", address="Birgunj"
+        )
+        models.Customer.objects.create(
+            full_name="Sita Sharma", phone="9812345670", address="Pokhara"
+        )
+
+    def search(self, search_term: str, model: Any = models.Customer):
+        model_admin = admin.site._registry[model]  # type: ignore
+        queryset, _ = model_admin.get_search_results(
+            RequestFactory().get("/"), model.objects.all(), search_term
+        )
+        return sorted(str(row) for row in queryset)
+
+    def test_terms_in_different_fields(self):
+        self.assertEqual(self.search("ram pokhara"), ["Ram Sharma"])
+        self.assertEqual(
+            self.search("Pokh sharm"), ["Ram Sharma", "Sita Sharma"]
+        )
+        self.assertEqual(self.search("ram birgunj"), ["Ram Thapa"])
+
+    def test_email(self):
+        self.assertEqual(self.search("ram.sharma@example.com"), ["Ram Sharma"])
+        self.assertEqual(self.search("sharma@example"), ["Ram Sharma"])
+
+    def test_phone2(self):
+        self.assertEqual(self.search("+9779801234567"), ["Ram Sharma"])
+
+    def test_phone_part(self):
+        self.assertEqual(self.search("5678"), ["Ram Sharma"])
+        self.assertEqual(self.search("01234"), ["Ram Sharma"])
+        self.assertEqual(len(self.search("981")), 3)
+        order = models.Order.objects.create(
+            customer=self.ram,
+            subtotal_price=1000,
+            total_price=1150,
+            delivery_address="Lakeside",
+        )
+        self.assertEqual(
+            self.search("5678", models.Order), [f"Order #{order.pk}"]
+        )
+        self.assertEqual(
+            self.search(str(order.pk), models.Order), [f"Order #{order.pk}"]
+        )
@@ -0,0 +1,29 @@
+from decimal import Decimal
+
+import pydantic
+from django.test import SimpleTestCase
+
+from core.serializers import WcNewOrderSerializer
+from core.serializers import validate_wc_orders
+from core.tests.test_views import make_order
+
+
+class ValidateWcOrdersTest(SimpleTestCase):
+    def test_numeric_amounts(self):
+        wc_order = make_order(1)
+        wc_order.update(discount_total=0, shipping_total=150, total=1650.5)
+        wc_order["line_items"][0].update(subtotal=1500.5, total=1500.5)
+        order = validate_wc_orders([wc_order])[0]
+        self.assertEqual(order["total"], Decimal("1650.50"))
+        item = order["line_items"][0]
+        self.assertEqual(item["subtotal"], Decimal("1500.50"))
+        self.assertEqual(item["price"], Decimal("1500.50"))
+        serializer = WcNewOrderSerializer(data=[wc_order], many=True)
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual([order], serializer.validated_data)
+
+    def test_invalid_line_item_amount(self):
+        wc_order = make_order(1)
+        wc_order["line_items"][0]["total"] = "free"
+        with self.assertRaises(pydantic.ValidationError):
+            validate_wc_orders([wc_order])
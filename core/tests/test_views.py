@@ -0,0 +1,94 @@
+import json
+from typing import Any
+
+from django.test import TestCase
+
+from core import models
+from core.views import get_wc_signature
+
+SECRET = "webhook-secret"
+URL = "/api/wc/webhook/"
+
+
+def make_order(wc_order_id: int) -> dict[str, Any]:
+    return {
+        "id": wc_order_id,
+        "status": "processing",
+        "date_created": "2024-06-13T08:01:00",
+        "date_modified_gmt": "2024-06-13T08:01:00",
+        "discount_total": "0.00",
+        "shipping_total": "150.00",
+        "total": "1650.00",
+        "customer_id": 0,
+        "order_key": f"wc_order_test{wc_order_id}",
+        "billing": {
+            "first_name": "Test",
+            "last_name": "Customer",
+            "address_1": "Lakeside",
+            "phone": "9812345678",
+            "email": "test@example.com",
+        },
+        "shipping": {"address_1": "Lakeside", "phone": "", "state": "NP001"},
+        "payment_method": "cod",
+        "customer_note": "",
+        "line_items": [
+            {
+                "id": 1,
+                "product_id": 1,
+                "name": "TEST-PRODUCT",
+                "quantity": 1,
+                "subtotal": "1500",
+                "total": "1500",
+                "meta_data": [],
+            }
+        ],
+    }
+
+
+class WcOrderWebhookViewTest(TestCase):
+    def setUp(self):
+        models.Settings.objects.update_or_create(
+            id=1, defaults={"wc_webhook_secret": SECRET}
+        )
+
+    def post(self, payload: Any, topic: str, secret: str = SECRET):
+        body = json.dumps(payload).encode()
+        return self.client.post(
+            URL,
+            body,
+            content_type="application/json",
+            headers={
+                "X-WC-Webhook-Topic": topic,
+                "X-WC-Webhook-Signature": get_wc_signature(secret, body),
+            },
+        )
+
+    def test_order_created(self):
+        res = self.post(make_order(101), "order.created")
+        self.assertEqual(res.status_code, 200)
+        webhook = models.WcWebhook.objects.get()
+        self.assertEqual(webhook.topic, "order.created")
+        self.assertEqual(webhook.wc_order_id, "101")
+        self.assertIsNone(webhook.processed_at)
+
+    def test_invalid_signature(self):
+        res = self.post(make_order(101), "order.created", "other-secret")
+        self.assertEqual(res.status_code, 401)
+        self.assertFalse(models.WcWebhook.objects.exists())
+
+    def test_other_topic_ignored(self):
+        res = self.post({"id": 101}, "order.deleted")
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(models.WcWebhook.objects.exists())
+
+    def test_invalid_order_stored_with_error(self):
+        res = self.post({"id": 101}, "order.updated")
+        self.assertEqual(res.status_code, 200)
+        webhook = models.WcWebhook.objects.get()
+        self.assertNotEqual(webhook.error, "")
+        self.assertIsNotNone(webhook.processed_at)
+
+    def test_ping(self):
+        res = self.client.post(URL, {"webhook_id": "1"})
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(models.WcWebhook.objects.exists())
@@ -0,0 +1,176 @@
+import random
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from unittest import mock
+
+import httpx
+from django.test import SimpleTestCase
+from django.test import TestCase
+
+from core import models
+from core.models import StatusChoices
+from core.serializers import validate_wc_orders
+from core.tests.test_views import make_order
+from core.wc import WC_PER_PAGE
+from core.wc import fetch_changed_orders
+from core.wc import get_wc_cursor
+from core.wc import save_orders
+from core.wc import save_products
+
+START = datetime(2024, 6, 13, 8, 0, tzinfo=UTC)
+
+
+def make_orders(timestamps: list[tuple[int, int]]) -> list[dict[str, Any]]:
+    # (seconds after START, number of orders modified at that second)
+    orders: list[dict[str, Any]] = []
+    for seconds, count in timestamps:
+        modified_at = (START + timedelta(seconds=seconds)).replace(tzinfo=None)
+        for _ in range(count):
+            orders.append(
+                {
+                    "id": len(orders) + 1,
+                    "date_modified_gmt": modified_at.isoformat(),
+                }
+            )
+    return orders
+
+
+def get_transport(orders: list[dict[str, Any]]):
+    """Woocommerce /orders?orderby=modified, ties are not in id order"""
+    ordered = list(orders)
+    random.Random(0).shuffle(ordered)
+    ordered.sort(key=lambda o: o["date_modified_gmt"])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        matching = ordered
+        if "modified_after" in params:
+            after = datetime.fromisoformat(params["modified_after"])
+            matching = [
+                o
+                for o in ordered
+                if datetime.fromisoformat(o["date_modified_gmt"]) > after
+            ]
+        page = int(params["page"])
+        per_page = int(params["per_page"])
+        return httpx.Response(
+            200, json=matching[(page - 1) * per_page : page * per_page]
+        )
+
+    return httpx.MockTransport(handler)
+
+
+class FetchChangedOrdersTest(SimpleTestCase):
+    async def fetch(
+        self,
+        orders: list[dict[str, Any]],
+        cursor: None | tuple[datetime, int] = None,
+    ):
+        pages: list[list[dict[str, Any]]] = []
+        async with httpx.AsyncClient(
+            base_url="http://wc.test", transport=get_transport(orders)
+        ) as client:
+            async for page in fetch_changed_orders(client, cursor):
+                pages.append(page)
+        return pages
+
+    async def test_tie_larger_than_page(self):
+        orders = make_orders([(0, 30), (1, WC_PER_PAGE * 2 + 50), (2, 20)])
+        pages = await self.fetch(orders)
+        fetched = [o["id"] for page in pages for o in page]
+        self.assertCountEqual(fetched, [o["id"] for o in orders])
+        # each page ends on a complete timestamp, its cursor is safe
+        for i, page in enumerate(pages):
+            cursor = max(get_wc_cursor(o) for o in page)
+            read = {o["id"] for p in pages[: i + 1] for o in p}
+            self.assertTrue(
+                all(
+                    o["id"] in read
+                    for o in orders
+                    if get_wc_cursor(o)[0] <= cursor[0]
+                )
+            )
+
+    async def test_cursor_timestamp_read_again(self):
+        orders = make_orders([(0, 30), (1, WC_PER_PAGE + 10), (2, 20)])
+        tie = [o for o in orders if o["id"] > 30 and o["id"] <= 30 + 110]
+        cursor = max(get_wc_cursor(o) for o in tie[:5])
+        pages = await self.fetch(orders, cursor)
+        fetched = [o["id"] for page in pages for o in page]
+        self.assertCountEqual(fetched, [o["id"] for o in orders[30:]])
+
+
+class SaveOrdersTest(TestCase):
+    def setUp(self):
+        self.shop_settings, _ = models.Settings.objects.get_or_create(id=1)
+
+    def save(self, modified_at: str, **changes: Any):
+        wc_order = make_order(1)
+        wc_order["date_modified_gmt"] = modified_at
+        wc_order.update(changes)
+        return save_orders(self.shop_settings, validate_wc_orders([wc_order]))
+
+    def get_order(self) -> models.Order:
+        return models.Order.objects.get(wc_order_id="1")
+
+    def test_status_changed_on_woocommerce(self):
+        self.save("2024-06-13T08:01:00")
+        self.assertEqual(self.get_order().wc_status, "processing")
+        self.save("2024-06-13T08:02:00", status="on-hold")
+        self.assertEqual(self.get_order().status, StatusChoices.ONHOLD)
+
+    def test_local_status_kept(self):
+        self.save("2024-06-13T08:01:00")
+        models.Order.objects.update(status=StatusChoices.PROCESSED)
+        self.save("2024-06-13T08:02:00", total="1750.00")
+        order = self.get_order()
+        self.assertEqual(order.status, StatusChoices.PROCESSED)
+        self.assertEqual(order.total_price, 1750)
+
+    def test_delivered_not_moved_back(self):
+        self.save("2024-06-13T08:01:00")
+        models.Order.objects.update(status=StatusChoices.DELIVERED)
+        self.save("2024-06-13T08:02:00", status="pending")
+        self.assertEqual(self.get_order().status, StatusChoices.DELIVERED)
+        self.save("2024-06-13T08:03:00", status="completed")
+        self.assertEqual(self.get_order().status, StatusChoices.COMPLETED)
+
+    def test_older_payload_skipped(self):
+        self.save("2024-06-13T08:05:00")
+        self.assertEqual(
+            self.save("2024-06-13T08:02:00", status="cancelled"), (0, 0)
+        )
+        order = self.get_order()
+        self.assertEqual(order.status, StatusChoices.PENDING)
+        self.assertEqual(
+            order.wc_modified_at, datetime(2024, 6, 13, 8, 5, tzinfo=UTC)
+        )
+
+    def test_latest_payload_of_batch(self):
+        newer = make_order(1)
+        newer["date_modified_gmt"] = "2024-06-13T08:05:00"
+        newer["status"] = "on-hold"
+        older = make_order(1)
+        save_orders(self.shop_settings, validate_wc_orders([newer, older]))
+        self.assertEqual(self.get_order().status, StatusChoices.ONHOLD)
+
+    def test_created_meanwhile(self):
+        # the order is created by another worker after save_orders looked
+        # for it, the conflict on unique_wc_order turns it into an update
+        other = make_order(1)
+        created_meanwhile: list[bool] = []
+
+        def save_products_meanwhile(wc_orders: list[dict[str, Any]]):
+            if not created_meanwhile:
+                created_meanwhile.append(True)
+                save_orders(self.shop_settings, validate_wc_orders([other]))
+            return save_products(wc_orders)
+
+        with mock.patch("core.wc.save_products", save_products_meanwhile):
+            counts = self.save("2024-06-13T08:05:00", status="on-hold")
+        self.assertEqual(counts, (0, 1))
+        order = self.get_order()
+        self.assertEqual(order.status, StatusChoices.ONHOLD)
+        self.assertEqual(order.order_items.count(), 1)  # type: ignore
@@ -0,0 +1,659 @@
+import asyncio
+import hashlib
+import json
+from collections import deque
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from typing import AsyncIterator
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core import models
+from core.counters import defer_counters
+from core.counters import refresh_category_counters
+from core.counters import refresh_customer_counters
+from core.counters import refresh_product_counters
+from core.http import AsyncRetryTransport
+from core.http import RateLimit
+from core.models import Settings
+from core.models import StatusChoices
+from core.ncm import is_ncm_branch
+from core.phones import get_phone_customers
+from core.phones import get_phone_q
+from core.phones import normalize_phone
+from core.phones import set_e164_phones
+from core.serializers import validate_wc_orders
+
+# maximum page size allowed by the woocommerce rest api
+WC_PER_PAGE = 100
+# pages downloaded concurrently while backfilling
+WC_CONCURRENCY = 4
+# requests per second sent to woocommerce
+WC_RATE = 10.0
+
+
+def get_wc_cursor(order_data: dict[str, Any]) -> tuple[datetime, int]:
+    # "date_modified_gmt": "2024-06-13T08:01:00", always UTC without offset
+    modified_at = datetime.fromisoformat(order_data["date_modified_gmt"])
+    return modified_at.replace(tzinfo=UTC), order_data["id"]
+
+
+def get_wc_client(settings: Settings, concurrency: int = WC_CONCURRENCY):
+    # one keep-alive connection per concurrent page request
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=concurrency,
+            max_keepalive_connections=concurrency,
+        )
+    )
+    limit = RateLimit(WC_RATE, burst=concurrency, max_concurrency=concurrency)
+    return httpx.AsyncClient(
+        base_url=f"{settings.wc_url}/wp-json/wc/v3",
+        auth=(settings.wc_consumer_key, settings.wc_consumer_secret),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        transport=AsyncRetryTransport(limit, transport),
+    )
+
+
+async def get_orders_page(
+    client: httpx.AsyncClient, params: dict[str, Any]
+) -> httpx.Response:
+    res = await client.get(
+        "/orders",
+        params={
+            "per_page": WC_PER_PAGE,
+            "order": "asc",
+            "dates_are_gmt": "true",
+            **params,
+        },
+    )
+    res.raise_for_status()
+    return res
+
+
+async def fetch_all_orders(
+    client: httpx.AsyncClient, concurrency: int = WC_CONCURRENCY
+) -> AsyncIterator[list[dict[str, Any]]]:
+    """Yield every order page by page, in id order
+
+    The first page tells the number of pages (X-WP-TotalPages), the rest
+    are downloaded `concurrency` at a time while the caller processes the
+    pages already received. Pages are yielded in order, new orders are
+    appended to the last page so the walk does not skip any.
+    """
+
+    async def get_page(page: int) -> list[dict[str, Any]]:
+        res = await get_orders_page(client, {"orderby": "id", "page": page})
+        return res.json()
+
+    res = await get_orders_page(client, {"orderby": "id", "page": 1})
+    total_pages = int(res.headers.get("X-WP-TotalPages", 1))
+    pages = iter(range(2, total_pages + 1))
+    pending: deque[asyncio.Task[list[dict[str, Any]]]] = deque()
+    try:
+        for page in pages:
+            pending.append(asyncio.create_task(get_page(page)))
+            if len(pending) >= concurrency:
+                break
+        orders: list[dict[str, Any]] = res.json()
+        while True:
+            if orders:
+                yield orders
+            if not pending:
+                return
+            orders = await pending.popleft()
+            page = next(pages, None)
+            if page is not None:
+                pending.append(asyncio.create_task(get_page(page)))
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def fetch_changed_orders(
+    client: httpx.AsyncClient, cursor: None | tuple[datetime, int]
+) -> AsyncIterator[list[dict[str, Any]]]:
+    """Yield pages of orders modified since the cursor
+
+    Orders are walked in date_modified order using the last page's
+    timestamp as the lower bound of the next request (keyset pagination),
+    so orders modified while walking can not shift an unseen order onto
+    an already fetched page.
+
+    orderby=modified does not order the orders sharing a timestamp (a
+    bulk status change touches many in the same second), so a timestamp
+    is only left behind once all its orders were read: pages ending on
+    the current timestamp are followed with page += 1, and the orders of
+    the last timestamp are held back until a later one shows up. Every
+    yielded page thus ends on a complete timestamp, which is a safe
+    cursor. The orders of the cursor's timestamp are read again by the
+    next run, saving them again does nothing.
+    """
+    params: dict[str, Any] = {"orderby": "modified"}
+    since = None if cursor is None else cursor[0]
+    # (id, date_modified) of the orders read by this run
+    seen: set[tuple[int, datetime]] = set()
+    # orders of the last timestamp read, it may continue on the next page
+    held: list[dict[str, Any]] = []
+    page = 1
+    while True:
+        if since is not None:
+            # step back a second so orders sharing the timestamp are
+            # returned again, those already read are filtered out below
+            modified_after = since - timedelta(seconds=1)
+            params["modified_after"] = modified_after.astimezone(UTC).strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )
+        res = await get_orders_page(client, {**params, "page": page})
+        orders: list[dict[str, Any]] = res.json()
+        for order in orders:
+            modified_at, order_id = get_wc_cursor(order)
+            if since is not None and modified_at < since:
+                continue
+            if (order_id, modified_at) not in seen:
+                seen.add((order_id, modified_at))
+                held.append(order)
+        if len(orders) < WC_PER_PAGE:
+            if held:
+                yield held
+            return
+        last_modified_at = get_wc_cursor(orders[-1])[0]
+        if last_modified_at == since:
+            # the timestamp continues on the next page
+            page += 1
+            continue
+        complete = [o for o in held if get_wc_cursor(o)[0] < last_modified_at]
+        held = [o for o in held if get_wc_cursor(o)[0] >= last_modified_at]
+        if complete:
+            yield complete
+        since = last_modified_at
+        page = 1
+
+
+def save_orders_page(
+    settings: Settings, orders: list[dict[str, Any]], update_cursor: bool
+):
+    created, updated = save_orders(settings, validate_wc_orders(orders))
+    if update_cursor:
+        # persist the cursor after every page, so an aborted run resumes
+        # from the last page that was fully processed
+        cursor = max(get_wc_cursor(o) for o in orders)
+        settings.wc_synced_at, settings.wc_synced_order_id = cursor
+        settings.save(update_fields=["wc_synced_at", "wc_synced_order_id"])
+    return created, updated
+
+
+async def sync_orders(
+    client: httpx.AsyncClient,
+    settings: Settings,
+    full: bool = False,
+    concurrency: int = WC_CONCURRENCY,
+):
+    """Fetch new and changed orders from woocommerce and save them
+
+    Pages are written to the database as they arrive, while the next
+    pages are still downloading. Returns the number of fetched, created
+    and updated orders.
+    """
+    started_at = timezone.now()
+    if full:
+        pages = fetch_all_orders(client, concurrency)
+    else:
+        cursor = None
+        if settings.wc_synced_at is not None:
+            cursor = (settings.wc_synced_at, settings.wc_synced_order_id)
+        pages = fetch_changed_orders(client, cursor)
+    save_page = sync_to_async(save_orders_page)
+    count = 0
+    created = 0
+    updated = 0
+    async for orders in pages:
+        page_created, page_updated = await save_page(
+            settings, orders, not full
+        )
+        count += len(orders)
+        created += page_created
+        updated += page_updated
+    if full:
+        # orders modified while the backfill was walking the pages are
+        # picked up by the next incremental run
+        settings.wc_synced_at = started_at
+        settings.wc_synced_order_id = 0
+        await sync_to_async(settings.save)(
+            update_fields=["wc_synced_at", "wc_synced_order_id"]
+        )
+    return count, created, updated
+
+
+def get_payload_hash(wc_data: dict[str, Any]) -> str:
+    # hash of the validated order, unchanged orders are skipped by it
+    payload = json.dumps(wc_data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def build_order(
+    settings: Settings, wc_order_id: str, wc_data: dict[str, Any]
+) -> models.Order:
+    delivery_ncm_to = wc_data["shipping"]["delivery_ncm_to"]
+    # the charge is what the customer paid on woocommerce, only the branch
+    # is checked against the stored ncm branches
+    if not is_ncm_branch(delivery_ncm_to):
+        delivery_ncm_to = ""
+    return models.Order(
+        medium=models.MediumChoices.WEBSITE,
+        wc_order_id=wc_order_id,
+        wc_order_key=wc_data["order_key"],
+        wc_payload_hash=get_payload_hash(wc_data),
+        wc_status=wc_data["wc_status"],
+        wc_modified_at=wc_data.get("date_modified_gmt"),
+        status=wc_data["status"],
+        subtotal_price=wc_data["total"]
+        - wc_data["discount_total"]
+        - wc_data["shipping_total"],
+        delivery_charge=wc_data["shipping_total"],
+        discount=wc_data["discount_total"],
+        total_price=wc_data["total"],
+        customer_note=wc_data["customer_note"],
+        delivery_ncm_from=settings.delivery_ncm_from,
+        delivery_ncm_to=delivery_ncm_to,
+        delivery_address=wc_data["shipping"]["address"],
+        delivery_note=wc_data["customer_note"],
+        ordered_at=wc_data["date_created"],
+    )
+
+
+def build_order_item(
+    order: models.Order, product_id: int, item: dict[str, Any]
+) -> models.OrderItem:
+    order_item = models.OrderItem(
+        product_id=product_id,
+        order=order,
+        wc_item_id=str(item["id"]),
+        quantity=item["quantity"],
+        price_per_unit=item["price_per_unit"],
+        discount=item["discount"],
+        price=item["price"],
+    )
+    if item.get("size"):
+        order_item.size = item["size"]
+    if item.get("color"):
+        order_item.color = item["color"]
+    if item.get("include_longsleeve"):
+        order_item.include_longsleeve = item["include_longsleeve"]
+    if item.get("logo_variation"):
+        order_item.logo_variation = item["logo_variation"]
+    return order_item
+
+
+# fields of already imported orders and order items kept in sync, the
+# status is synced apart, see get_synced_status
+ORDER_SYNC_FIELDS = (
+    "subtotal_price",
+    "delivery_charge",
+    "discount",
+    "total_price",
+)
+ORDER_ITEM_SYNC_FIELDS = (
+    "product_id",
+    "quantity",
+    "price_per_unit",
+    "discount",
+    "price",
+    "size",
+    "color",
+    "include_longsleeve",
+    "logo_variation",
+)
+
+
+# statuses set by poll_ncm_status or in the admin, which woocommerce does
+# not know. only a woocommerce status past them replaces them
+SHIPPING_STATUSES = (StatusChoices.SHIPPED, StatusChoices.DELIVERED)
+STATUSES_AFTER_SHIPPING = (StatusChoices.COMPLETED, StatusChoices.DISPUTED)
+
+
+def is_stale(wc_data: dict[str, Any], modified_at: datetime | None) -> bool:
+    """Whether a payload is older than the one modified at modified_at
+
+    Webhooks can arrive out of order, and a sync page can be older than a
+    webhook already saved. Payloads without date_modified_gmt are never
+    stale.
+    """
+    wc_modified_at: datetime | None = wc_data.get("date_modified_gmt")
+    if wc_modified_at is None or modified_at is None:
+        return False
+    return wc_modified_at < modified_at
+
+
+def is_changed(order: models.Order, wc_data: dict[str, Any]) -> bool:
+    # a payload that differs from the last synced one and is not older
+    if order.wc_payload_hash == get_payload_hash(wc_data):
+        return False
+    return not is_stale(wc_data, order.wc_modified_at)
+
+
+def get_synced_status(order: models.Order, wc_data: dict[str, Any]) -> str:
+    """Status of an imported order after a woocommerce update
+
+    The mapped woocommerce status is only applied when the status changed
+    on woocommerce, an edit of the line items keeps the local status. A
+    shipped or delivered order only moves on to completed or disputed.
+    """
+    if wc_data["wc_status"] == order.wc_status:
+        return order.status
+    if (
+        order.status in SHIPPING_STATUSES
+        and wc_data["status"] not in STATUSES_AFTER_SHIPPING
+    ):
+        return order.status
+    return wc_data["status"]
+
+
+def save_orders(settings: Settings, wc_orders: list[dict[str, Any]]):
+    """Save a batch of validated woocommerce orders, see validate_wc_orders
+
+    New orders are created, already imported orders whose payload hash
+    changed get their status, totals and line items updated, unless the
+    payload is older than the last synced one (see is_stale). Existing
+    orders, customers and products are resolved with one query each,
+    everything is written with bulk_create/bulk_update inside a single
+    transaction. Returns the number of created and updated orders.
+    """
+    # the latest payload of an order wins, the later one of a tie
+    batch: dict[str, dict[str, Any]] = {}
+    for wc_data in wc_orders:
+        wc_order_id = str(wc_data["id"])
+        previous = batch.get(wc_order_id)
+        if previous is None or not is_stale(
+            wc_data, previous.get("date_modified_gmt")
+        ):
+            batch[wc_order_id] = wc_data
+    existing = {
+        o.wc_order_id: o
+        for o in models.Order.objects.filter(
+            medium=models.MediumChoices.WEBSITE, wc_order_id__in=batch
+        )
+    }
+    new_orders: dict[str, dict[str, Any]] = {}
+    changed_orders: list[tuple[models.Order, dict[str, Any]]] = []
+    for wc_order_id, wc_data in batch.items():
+        order = existing.get(wc_order_id)
+        if order is None:
+            # cancelled orders that were never imported are not created
+            if wc_data["status"] != StatusChoices.CANCELED:
+                new_orders[wc_order_id] = wc_data
+        elif is_changed(order, wc_data):
+            changed_orders.append((order, wc_data))
+    if not new_orders and not changed_orders:
+        return 0, 0
+
+    with transaction.atomic(), defer_counters():
+        product_ids = save_products(
+            [wc_data for _, wc_data in changed_orders]
+            + list(new_orders.values())
+        )
+        created, conflicts = create_orders(settings, new_orders, product_ids)
+        # created meanwhile, see insert_orders, they are updated instead
+        for order in models.Order.objects.filter(
+            medium=models.MediumChoices.WEBSITE, wc_order_id__in=conflicts
+        ):
+            if is_changed(order, batch[order.wc_order_id]):
+                changed_orders.append((order, batch[order.wc_order_id]))
+        changed = [order for order, _ in changed_orders]
+        # products the changed items may move away from
+        previous_product_ids = list(
+            models.OrderItem.objects.filter(order__in=changed).values_list(
+                "product_id", flat=True
+            )
+        )
+        updated = update_orders(settings, changed_orders, product_ids)
+        # bulk writes bypass the signals of core.counters, the removed
+        # line items are recomputed here too
+        phones = [o["billing"]["phone"] for o in new_orders.values()]
+        refresh_customer_counters(
+            models.Customer.objects.filter(
+                Q(phone__in=phones)
+                | get_phone_q({normalize_phone(p) for p in phones} - {""})
+                | Q(pk__in=[o.customer_id for o in changed])  # type: ignore
+            )
+        )
+        refresh_product_counters(
+            models.Product.objects.filter(
+                pk__in={*product_ids.values(), *previous_product_ids}
+            )
+        )
+        refresh_category_counters(
+            models.Category.objects.filter(products__in=product_ids.values())
+        )
+    return created, updated
+
+
+def save_products(wc_orders: list[dict[str, Any]]) -> dict[str, int]:
+    """Upsert the products of the line items, returns their ids by title
+
+    Products are upserted on title (ON CONFLICT DO UPDATE), so the price
+    and woocommerce id of the latest line item win. New products go to
+    the UNKNOWN category.
+    """
+    category, _ = models.Category.objects.get_or_create(title="UNKNOWN")
+    products: dict[str, models.Product] = {}
+    for wc_data in wc_orders:
+        for item in wc_data["line_items"]:
+            products[item["name"]] = models.Product(
+                title=item["name"],
+                category=category,
+                price=item["price_per_unit"],
+                wc_product_id=item["product_id"],
+            )
+    return {
+        p.title: p.pk
+        for p in models.Product.objects.bulk_create(
+            products.values(),
+            update_conflicts=True,
+            unique_fields=["title"],
+            update_fields=["price", "wc_product_id", "updated_at"],
+        )
+    }
+
+
+def create_orders(
+    settings: Settings,
+    new_orders: dict[str, dict[str, Any]],
+    product_ids: dict[str, int],
+):
+    """Create new woocommerce orders with their customers and line items
+
+    Returns the number of created orders, and the ids of the orders that
+    already existed, see insert_orders.
+    """
+    if not new_orders:
+        return 0, []
+    # customers are matched on their E.164 numbers (core.phones), so
+    # +977 98... and 98... are the same customer. existing customers are
+    # left untouched and the first order of a new number wins
+    existing = get_phone_customers(
+        o["billing"]["phone"] for o in new_orders.values()
+    )
+    customers: dict[str, models.Customer] = {}
+    for wc_data in new_orders.values():
+        phone = wc_data["billing"]["phone"]
+        number = normalize_phone(phone) or phone
+        if phone in existing or number in customers:
+            continue
+        customers[number] = models.Customer(
+            phone=phone,
+            full_name=wc_data["billing"]["full_name"],
+            email=wc_data["billing"]["email"],
+            address=wc_data["billing"]["address"],
+            phone2=wc_data["shipping"].get("phone2", ""),
+        )
+        # bulk_create does not send pre_save
+        set_e164_phones(customers[number])
+    models.Customer.objects.bulk_create(
+        customers.values(), ignore_conflicts=True
+    )
+    created_ids = dict(
+        models.Customer.objects.filter(
+            phone__in=[c.phone for c in customers.values()]
+        ).values_list("phone", "id")
+    )
+    customer_ids = {phone: c.pk for phone, c in existing.items()}
+    for wc_data in new_orders.values():
+        phone = wc_data["billing"]["phone"]
+        if phone not in customer_ids:
+            number = normalize_phone(phone) or phone
+            customer_ids[phone] = created_ids[customers[number].phone]
+
+    # orders
+    orders: dict[str, models.Order] = {}
+    for wc_order_id, wc_data in new_orders.items():
+        order = build_order(settings, wc_order_id, wc_data)
+        customer_id = customer_ids[wc_data["billing"]["phone"]]
+        order.customer_id = customer_id  # type: ignore
+        orders[wc_order_id] = order
+    conflicts = insert_orders(orders)
+
+    # order items
+    models.OrderItem.objects.bulk_create(
+        [
+            build_order_item(order, product_ids[item["name"]], item)
+            for wc_order_id, order in orders.items()
+            if wc_order_id not in conflicts
+            for item in new_orders[wc_order_id]["line_items"]
+        ]
+    )
+    return len(orders) - len(conflicts), conflicts
+
+
+def insert_orders(orders: dict[str, models.Order]) -> list[str]:
+    """Insert new orders, returns the woocommerce ids that already exist
+
+    fetch_wc and process_wc_inbox can create the same order at the same
+    time. The insert of the second one waits for the first transaction,
+    then fails on unique_wc_order. The orders that exist by then are left
+    out and the others inserted again, the caller updates the existing
+    ones instead.
+    """
+    conflicts: list[str] = []
+    pending = dict(orders)
+    while pending:
+        try:
+            with transaction.atomic():
+                models.Order.objects.bulk_create(pending.values())
+        except IntegrityError:
+            existing = set(
+                models.Order.objects.filter(
+                    medium=models.MediumChoices.WEBSITE,
+                    wc_order_id__in=pending,
+                ).values_list("wc_order_id", flat=True)
+            )
+            if not existing:
+                raise
+            conflicts.extend(existing)
+            pending = {
+                wc_order_id: order
+                for wc_order_id, order in pending.items()
+                if wc_order_id not in existing
+            }
+        else:
+            break
+    return conflicts
+
+
+def update_orders(
+    settings: Settings,
+    changed_orders: list[tuple[models.Order, dict[str, Any]]],
+    product_ids: dict[str, int],
+):
+    """Apply the changed status, totals and line items of imported orders
+
+    Only the fields that changed are written, with one bulk_update for
+    the orders and one for their items. The status follows
+    get_synced_status, status changes stamp the matching
+    shipped_at/delivered_at date.
+    """
+    if not changed_orders:
+        return 0
+    now = timezone.now()
+    order_fields: set[str] = set()
+    for order, wc_data in changed_orders:
+        new_order = build_order(settings, order.wc_order_id, wc_data)
+        for field in ORDER_SYNC_FIELDS:
+            if getattr(order, field) != getattr(new_order, field):
+                setattr(order, field, getattr(new_order, field))
+                order_fields.add(field)
+        status = get_synced_status(order, wc_data)
+        if status != order.status:
+            order.status = status
+            order_fields.add("status")
+        if order.status == StatusChoices.SHIPPED and order.shipped_at is None:
+            order.shipped_at = now
+            order_fields.add("shipped_at")
+        if (
+            order.status in (StatusChoices.DELIVERED, StatusChoices.COMPLETED)
+            and order.delivered_at is None
+        ):
+            order.delivered_at = now
+            order_fields.add("delivered_at")
+        order.wc_payload_hash = new_order.wc_payload_hash
+        order.wc_status = new_order.wc_status
+        if new_order.wc_modified_at is not None:
+            order.wc_modified_at = new_order.wc_modified_at
+        order.updated_at = now
+    models.Order.objects.bulk_update(
+        [order for order, _ in changed_orders],
+        [
+            *order_fields,
+            "wc_payload_hash",
+            "wc_status",
+            "wc_modified_at",
+            "updated_at",
+        ],
+    )
+
+    # order items, matched on the woocommerce item id
+    order_items = {
+        (o.order_id, o.wc_item_id): o  # type: ignore
+        for o in models.OrderItem.objects.filter(
+            order__in=[order for order, _ in changed_orders]
+        )
+    }
+    new_items: list[models.OrderItem] = []
+    changed_items: list[models.OrderItem] = []
+    item_fields: set[str] = set()
+    for order, wc_data in changed_orders:
+        for item in wc_data["line_items"]:
+            new_item = build_order_item(order, product_ids[item["name"]], item)
+            order_item = order_items.pop((order.pk, new_item.wc_item_id), None)
+            if order_item is None:
+                new_items.append(new_item)
+                continue
+            fields = [
+                field
+                for field in ORDER_ITEM_SYNC_FIELDS
+                if getattr(order_item, field) != getattr(new_item, field)
+            ]
+            if fields:
+                for field in fields:
+                    setattr(order_item, field, getattr(new_item, field))
+                order_item.updated_at = now
+                changed_items.append(order_item)
+                item_fields.update(fields)
+    models.OrderItem.objects.bulk_create(new_items)
+    if changed_items:
+        models.OrderItem.objects.bulk_update(
+            changed_items, [*item_fields, "updated_at"]
+        )
+    # line items removed in woocommerce
+    if order_items:
+        models.OrderItem.objects.filter(
+            id__in=[o.pk for o in order_items.values()]
+        ).delete()
+    return len(changed_orders)
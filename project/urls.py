@@ -18,6 +18,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from core.views import WcOrderWebhookView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/wc/webhook/", WcOrderWebhookView.as_view()),
 ]